@@ -0,0 +1,185 @@
+"""
+Admission control for the model API.
+
+Without it a burst queues every request behind the model. Clients give up at their read timeout, and the
+server still spends CPU on answers nobody receives. AdmissionController does three things:
+
+  * runs at most max_in_flight model calls at once and queues the rest,
+  * estimates a new request's queueing delay from the texts ahead of it and a moving average of
+    seconds per text, and rejects it immediately (Overloaded -> 429 + Retry-After) if the delay would
+    exceed the wait budget or the client's deadline,
+  * drops queued work whose client deadline passes before a slot frees (DeadlineExceeded -> 503).
+
+Under overload, the model then spends its time on requests that can still finish in time, so goodput
+stays near peak.
+
+BatchAdmission applies the same policy to a micro-batching queue (inference_scheduler.py). There any
+number of requests share one batch, so the budget counts the texts queued ahead and a moving average
+of one batch's service time instead of holding a slot per request thread.
+"""
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+MAX_IN_FLIGHT = 4
+MAX_QUEUE_WAIT_SECONDS = 5.0
+DEFAULT_TIMEOUT_SECONDS = 30.0
+EWMA_ALPHA = 0.2
+
+
+class AdmissionError(Exception):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Overloaded(AdmissionError):
+    """Rejected on arrival: the estimated wait is over budget."""
+
+
+class DeadlineExceeded(AdmissionError):
+    """Dropped while queued: the client's deadline passed first."""
+
+
+class AdmissionController:
+    def __init__(self, max_in_flight=MAX_IN_FLIGHT, max_queue_wait=MAX_QUEUE_WAIT_SECONDS):
+        self.max_in_flight = max_in_flight
+        self.max_queue_wait = max_queue_wait
+        self.seconds_per_text = None  # EWMA of model time per text, unknown until the first call finishes
+        self.in_flight = 0
+        self.queued_texts = 0
+        self.running_texts = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.expired = 0
+        self._cond = threading.Condition()
+
+    def estimated_wait(self):
+        """Seconds a request arriving now would queue before starting (0 while slots are free)."""
+        if self.in_flight < self.max_in_flight or self.seconds_per_text is None:
+            return 0.0
+        return (self.queued_texts + self.running_texts) * self.seconds_per_text / self.max_in_flight
+
+    @contextmanager
+    def slot(self, n_texts, deadline):
+        """
+        Hold one model slot while the body runs. deadline is a time.monotonic() value.
+        Raises Overloaded or DeadlineExceeded instead of queueing work that cannot finish in time.
+        """
+        with self._cond:
+            wait = self.estimated_wait()
+            service = (self.seconds_per_text or 0.0) * n_texts
+            if wait > self.max_queue_wait or time.monotonic() + wait + service > deadline:
+                self.rejected += 1
+                raise Overloaded(f"Server overloaded (estimated wait {wait:.1f}s)", max(1, math.ceil(wait)))
+
+            self.queued_texts += n_texts
+            try:
+                while self.in_flight >= self.max_in_flight:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.expired += 1
+                        raise DeadlineExceeded("Request deadline passed while queued", max(1, math.ceil(self.estimated_wait())))
+                    self._cond.wait(remaining)
+                # A slot may free up just as the deadline passes: never start work nobody will receive
+                if time.monotonic() >= deadline:
+                    self.expired += 1
+                    self._cond.notify()  # hand the free slot to the next waiter
+                    raise DeadlineExceeded("Request deadline passed while queued", max(1, math.ceil(self.estimated_wait())))
+            finally:
+                self.queued_texts -= n_texts
+            self.in_flight += 1
+            self.running_texts += n_texts
+            self.admitted += 1
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            with self._cond:
+                self.in_flight -= 1
+                self.running_texts -= n_texts
+                per_text = elapsed / max(1, n_texts)
+                self.seconds_per_text = per_text if self.seconds_per_text is None else (
+                    EWMA_ALPHA * per_text + (1 - EWMA_ALPHA) * self.seconds_per_text
+                )
+                self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'in_flight': self.in_flight,
+                'queued_texts': self.queued_texts,
+                'estimated_wait': round(self.estimated_wait(), 3),
+                'seconds_per_text': self.seconds_per_text,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'expired': self.expired,
+            }
+
+
+class BatchAdmission:
+    """Wait-budget admission for a queue drained in batches of up to max_batch_size texts."""
+    def __init__(self, max_batch_size, max_queue_wait=MAX_QUEUE_WAIT_SECONDS):
+        self.max_batch_size = max_batch_size
+        self.max_queue_wait = max_queue_wait
+        self.seconds_per_batch = None  # EWMA of one batch's model time, unknown until the first batch finishes
+        self.queued_texts = 0
+        self.running = False
+        self.admitted = 0
+        self.rejected = 0
+        self.expired = 0
+        self._lock = threading.Lock()
+
+    def estimated_wait(self):
+        """Seconds a request arriving now would queue: the batches ahead of it, plus the running one."""
+        if self.seconds_per_batch is None:
+            return 0.0
+        batches = math.ceil(self.queued_texts / self.max_batch_size) + (1 if self.running else 0)
+        return batches * self.seconds_per_batch
+
+    def retry_after(self):
+        with self._lock:
+            return max(1, math.ceil(self.estimated_wait()))
+
+    def admit(self, n_texts, deadline):
+        """Count n_texts as queued, or raise Overloaded if they cannot be scored before deadline."""
+        with self._lock:
+            wait = self.estimated_wait()
+            service = (self.seconds_per_batch or 0.0) * math.ceil(n_texts / self.max_batch_size)
+            if wait > self.max_queue_wait or time.monotonic() + wait + service > deadline:
+                self.rejected += 1
+                raise Overloaded(f"Server overloaded (estimated wait {wait:.1f}s)", max(1, math.ceil(wait)))
+            self.queued_texts += n_texts
+            self.admitted += 1
+
+    def dequeued(self, n_texts, expired=False):
+        """n_texts left the queue, either into a batch or dropped because their deadline passed."""
+        with self._lock:
+            self.queued_texts -= n_texts
+            if expired:
+                self.expired += 1
+
+    def batch_started(self):
+        with self._lock:
+            self.running = True
+
+    def batch_finished(self, elapsed):
+        with self._lock:
+            self.running = False
+            self.seconds_per_batch = elapsed if self.seconds_per_batch is None else (
+                EWMA_ALPHA * elapsed + (1 - EWMA_ALPHA) * self.seconds_per_batch
+            )
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queued_texts': self.queued_texts,
+                'estimated_wait': round(self.estimated_wait(), 3),
+                'seconds_per_batch': self.seconds_per_batch,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'expired': self.expired,
+            }
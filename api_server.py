@@ -2,18 +2,96 @@
 
 import sys
 import os
-from flask import Flask, request, jsonify
+import hmac
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import TimeoutError as FutureTimeout
+from datetime import datetime
+from functools import wraps
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 # Import the model loading function from your utility file
 from model_utils import load_ensemble_models 
+from log_queries import query_logs, iter_logs
+from inference_scheduler import HybridBatchScheduler, combine_predictions
+from admission import AdmissionController, AdmissionError, BatchAdmission, DeadlineExceeded
 
 # --- FLASK SETUP ---
 app = Flask(__name__)
-# Allow cross-origin requests from your Streamlit app
-CORS(app) 
+# Allow cross-origin requests from your Streamlit app (prediction and health only, never the audit log)
+CORS(app, resources=[r"/predict_.*", r"/health"])
 
 # Global variable to hold the initialized ensemble model
 GLOBAL_ENSEMBLE_MODEL = None
+# Batches /predict_hybrid requests and runs the ensemble and the lexicon scorer side by side
+GLOBAL_HYBRID_SCHEDULER = None
+
+# Default combine_predictions() thresholds (override per request or via environment)
+HYBRID_SIM_THRESHOLD = float(os.environ.get("HYBRID_SIM_THRESHOLD", 0.7))
+HYBRID_CONF_THRESHOLD = float(os.environ.get("HYBRID_CONF_THRESHOLD", 0.85))
+HYBRID_MAX_WAIT_MS = float(os.environ.get("HYBRID_MAX_WAIT_MS", 5))
+# Results kept per replica; app.py routes repeats of a text to the same replica (see replica_router.py)
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", 10000))
+
+class ResultCache:
+    """Thread-safe LRU of text -> serialized prediction."""
+    def __init__(self, max_size=RESULT_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, texts):
+        """{text: result} for the cached texts."""
+        found = {}
+        with self._lock:
+            for text in texts:
+                if text in self._items:
+                    self._items.move_to_end(text)
+                    found[text] = self._items[text]
+            self.hits += len(found)
+            self.misses += len(texts) - len(found)
+        return found
+
+    def put_many(self, items):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            for text, result in items:
+                self._items[text] = result
+                self._items.move_to_end(text)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._items), 'max_size': self.max_size, 'hits': self.hits, 'misses': self.misses}
+
+RESULT_CACHE = ResultCache()
+
+# Admission control (see admission.py): concurrent model calls, queueing budget, default client deadline
+ADMISSION_MAX_IN_FLIGHT = int(os.environ.get("ADMISSION_MAX_IN_FLIGHT", 4))
+ADMISSION_MAX_QUEUE_WAIT = float(os.environ.get("ADMISSION_MAX_QUEUE_WAIT", 5))
+DEFAULT_REQUEST_TIMEOUT = float(os.environ.get("DEFAULT_REQUEST_TIMEOUT", 30))
+ADMISSION = AdmissionController(ADMISSION_MAX_IN_FLIGHT, ADMISSION_MAX_QUEUE_WAIT)
+
+def _request_deadline():
+    """Monotonic deadline from the client's X-Request-Timeout header (seconds), else DEFAULT_REQUEST_TIMEOUT."""
+    try:
+        timeout = float(request.headers.get('X-Request-Timeout', DEFAULT_REQUEST_TIMEOUT))
+    except ValueError:
+        timeout = DEFAULT_REQUEST_TIMEOUT
+    return time.monotonic() + max(0.0, min(timeout, DEFAULT_REQUEST_TIMEOUT))
+
+def _admission_response(error):
+    """429 when rejected on arrival, 503 when dropped after queueing past the deadline; both carry Retry-After."""
+    status = 503 if isinstance(error, DeadlineExceeded) else 429
+    response = jsonify({'error': str(error), 'retry_after': error.retry_after})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, status
 
 def initialize_ensemble_model():
     """Initializes the model once at startup."""
@@ -23,11 +101,30 @@ def initialize_ensemble_model():
         # Use your provided loading function
         GLOBAL_ENSEMBLE_MODEL = load_ensemble_models() 
         print("✅ GLOBAL_ENSEMBLE_MODEL initialized and ready.")
-        return True
     except Exception as e:
         print(f"❌ FATAL: Failed to initialize ensemble model: {e}", file=sys.stderr)
         return False
 
+    initialize_hybrid_scheduler()
+    return True
+
+def initialize_hybrid_scheduler():
+    """Loads the semantic scorer; without it only /predict_hybrid is unavailable."""
+    global GLOBAL_HYBRID_SCHEDULER
+    try:
+        from semantic_scorer import load_semantic_scorer
+        GLOBAL_HYBRID_SCHEDULER = HybridBatchScheduler(
+            GLOBAL_ENSEMBLE_MODEL,
+            load_semantic_scorer(),
+            max_batch_size=MAX_BATCH_SIZE,
+            max_wait_ms=HYBRID_MAX_WAIT_MS,
+            # Budgeted by queued texts and batch time, so any number of requests can share a batch
+            admission=BatchAdmission(MAX_BATCH_SIZE, ADMISSION_MAX_QUEUE_WAIT)
+        )
+        print("✅ Hybrid scheduler initialized and ready.")
+    except Exception as e:
+        print(f"⚠️ Semantic scorer unavailable, /predict_hybrid disabled: {e}", file=sys.stderr)
+
 @app.route('/predict_sentiment', methods=['POST'])
 def predict_sentiment():
     """API endpoint to receive text and return ensemble prediction."""
@@ -43,20 +140,210 @@ def predict_sentiment():
         if not text:
             return jsonify({'error': 'No text provided'}), 400
 
-        # Run prediction using the loaded model instance
-        risk_label, confidence = GLOBAL_ENSEMBLE_MODEL.predict(text)
-        
-        # Ensure output format matches what app.py expects
-        return jsonify({
-            'sentiment': risk_label,
-            'confidence': float(confidence) 
-        })
+        # Ensure output format matches what app.py expects.
+        # model_probs: per-model softmax rows (NaN -> null for skipped models), kept for the audit log.
+        return jsonify(_predict_cached([text], _request_deadline())[0])
 
+    except AdmissionError as e:
+        return _admission_response(e)
     except Exception as e:
         print(f"Error during prediction: {e}")
         return jsonify({'error': f'Prediction failed due to internal model error: {str(e)}'}), 500
 
 
+# Upper bound on texts per /predict_batch call, keeps one request's memory and latency bounded
+MAX_BATCH_SIZE = 256
+
+def _serialize_model_probs(probs):
+    """Per-model softmax rows as JSON lists (NaN -> null for skipped models)."""
+    return [[None if p != p else float(p) for p in row] for row in probs]
+
+def _predict_cached(texts, deadline):
+    """{sentiment, confidence, model_probs} per text; only texts missing from RESULT_CACHE reach the model."""
+    cached = RESULT_CACHE.get_many(texts)
+    missing = list(dict.fromkeys(t for t in texts if t not in cached))
+    if missing:
+        # Cache hits skip admission; only model work is queued or shed
+        with ADMISSION.slot(len(missing), deadline):
+            risk_labels, confidences, model_probs = GLOBAL_ENSEMBLE_MODEL.predict_with_model_probs(missing)
+        computed = [
+            (text, {
+                'sentiment': label,
+                'confidence': float(conf),
+                'model_probs': _serialize_model_probs(probs)
+            })
+            for text, label, conf, probs in zip(missing, risk_labels, confidences, model_probs)
+        ]
+        RESULT_CACHE.put_many(computed)
+        cached.update(computed)
+    return [cached[t] for t in texts]
+
+@app.route('/predict_batch', methods=['POST'])
+def predict_batch():
+    """API endpoint for batch prediction: {'texts': [...]} -> {'results': [{sentiment, confidence, model_probs}, ...]}"""
+    global GLOBAL_ENSEMBLE_MODEL
+
+    if GLOBAL_ENSEMBLE_MODEL is None:
+        return jsonify({'error': 'Model not initialized. Server is unavailable.'}), 503
+
+    data = request.get_json(silent=True) or {}
+    texts = data.get('texts')
+    if not isinstance(texts, list) or not texts:
+        return jsonify({'error': 'No texts provided'}), 400
+    if len(texts) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'Too many texts (maximum {MAX_BATCH_SIZE} per request)'}), 400
+
+    try:
+        return jsonify({'results': _predict_cached([str(t) if t is not None else "" for t in texts], _request_deadline())})
+    except AdmissionError as e:
+        return _admission_response(e)
+    except Exception as e:
+        print(f"Error during batch prediction: {e}")
+        return jsonify({'error': f'Prediction failed due to internal model error: {str(e)}'}), 500
+
+@app.route('/predict_hybrid', methods=['POST'])
+def predict_hybrid():
+    """
+    Ensemble + semantic-lexicon voting (the notebook's refined_risk_level_with_semantic_voting).
+    Accepts {'text': ...} or {'texts': [...]}, optionally with 'sim_threshold' / 'conf_threshold'.
+    """
+    if GLOBAL_HYBRID_SCHEDULER is None:
+        return jsonify({'error': 'Hybrid model not initialized. Server is unavailable.'}), 503
+
+    data = request.get_json(silent=True) or {}
+    single = 'texts' not in data
+    texts = [data.get('text', '')] if single else data.get('texts')
+    if not isinstance(texts, list) or not texts or (single and not texts[0]):
+        return jsonify({'error': 'No text provided'}), 400
+    if len(texts) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'Too many texts (maximum {MAX_BATCH_SIZE} per request)'}), 400
+    try:
+        sim_threshold = float(data.get('sim_threshold', HYBRID_SIM_THRESHOLD))
+        conf_threshold = float(data.get('conf_threshold', HYBRID_CONF_THRESHOLD))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Thresholds must be numbers'}), 400
+
+    deadline = _request_deadline()
+    try:
+        future = GLOBAL_HYBRID_SCHEDULER.submit([str(t) if t is not None else "" for t in texts], deadline)
+        try:
+            scored = future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeout:
+            # The client has given up: free this thread, and drop the work if it has not started yet
+            future.cancel()
+            raise DeadlineExceeded("Request deadline passed before scoring finished",
+                                   GLOBAL_HYBRID_SCHEDULER.admission.retry_after())
+    except AdmissionError as e:
+        return _admission_response(e)
+    except Exception as e:
+        print(f"Error during hybrid prediction: {e}")
+        return jsonify({'error': f'Prediction failed due to internal model error: {str(e)}'}), 500
+
+    results = []
+    for i in range(len(texts)):
+        model_risk = scored['model_labels'][i]
+        model_conf = float(scored['model_confidences'][i])
+        semantic_risk = scored['semantic_labels'][i]
+        sim_score = float(scored['semantic_scores'][i])
+        results.append({
+            'model_predicted_risk': model_risk,
+            'model_confidence': round(model_conf, 4),
+            'semantic_risk': semantic_risk,
+            'semantic_similarity_score': round(sim_score, 4),
+            'final_risk': combine_predictions(
+                model_risk, model_conf, semantic_risk, sim_score, sim_threshold, conf_threshold
+            ),
+            'model_probs': _serialize_model_probs(scored['model_probs'][i])
+        })
+    return jsonify(results[0] if single else {'results': results})
+
+@app.route('/health', methods=['GET'])
+def health():
+    """Readiness probe for replica_router.py: 200 once the ensemble is loaded, 503 before."""
+    ready = GLOBAL_ENSEMBLE_MODEL is not None
+    return jsonify({
+        'status': 'ok' if ready else 'unavailable',
+        'hybrid': GLOBAL_HYBRID_SCHEDULER is not None,
+        'result_cache': RESULT_CACHE.stats(),
+        'admission': ADMISSION.stats(),
+        'hybrid_admission': GLOBAL_HYBRID_SCHEDULER.admission.stats() if GLOBAL_HYBRID_SCHEDULER else None
+    }), 200 if ready else 503
+
+def _parse_log_filters(args):
+    """Read the audit-log filters from the query string. Raises ValueError on bad input."""
+    filters = {}
+    if args.get('start'):
+        filters['start'] = datetime.fromisoformat(args['start'])
+    if args.get('end'):
+        filters['end'] = datetime.fromisoformat(args['end'])
+    # risk_level may be repeated or comma-separated: ?risk_level=high,moderate
+    levels = [level.strip() for value in args.getlist('risk_level') for level in value.split(',') if level.strip()]
+    if levels:
+        filters['risk_level'] = levels
+    if args.get('source'):
+        filters['source'] = args['source']
+    if args.get('min_confidence'):
+        filters['min_confidence'] = float(args['min_confidence'])
+    return filters
+
+# The audit log holds raw post text: /logs* answer 403 unless LOGS_API_TOKEN is set and sent as a Bearer token
+LOGS_API_TOKEN = os.environ.get("LOGS_API_TOKEN", "")
+
+def _require_logs_token(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not LOGS_API_TOKEN:
+            return jsonify({'error': 'Audit-log API disabled (set LOGS_API_TOKEN to enable it)'}), 403
+        supplied = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(supplied.encode(), f"Bearer {LOGS_API_TOKEN}".encode()):
+            return jsonify({'error': 'Missing or invalid API token'}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+def _serialize_log(item):
+    item = dict(item)
+    if item.get('timestamp') is not None:
+        item['timestamp'] = item['timestamp'].isoformat()
+    return item
+
+@app.route('/logs', methods=['GET'])
+@_require_logs_token
+def get_logs():
+    """One page of audit-log entries (newest first). Pass next_cursor back as ?cursor= for the next page."""
+    try:
+        filters = _parse_log_filters(request.args)
+        items, next_cursor = query_logs(
+            cursor=request.args.get('cursor'),
+            limit=request.args.get('limit', 100, type=int),
+            **filters
+        )
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameter: {str(e)}'}), 400
+    except Exception as e:
+        print(f"Error querying logs: {e}")
+        return jsonify({'error': f'Log query failed: {str(e)}'}), 500
+
+    return jsonify({
+        'items': [_serialize_log(item) for item in items],
+        'next_cursor': next_cursor
+    })
+
+@app.route('/logs/stream', methods=['GET'])
+@_require_logs_token
+def stream_logs():
+    """All matching audit-log entries as newline-delimited JSON, fetched page by page."""
+    try:
+        filters = _parse_log_filters(request.args)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameter: {str(e)}'}), 400
+
+    def generate():
+        for item in iter_logs(**filters):
+            yield json.dumps(_serialize_log(item)) + '\n'
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+
 if __name__ == '__main__':
     # Initialize the model at startup
     if initialize_ensemble_model():
@@ -1,45 +1,239 @@
 import streamlit as st
+import os
 import random
+import tempfile
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+import pandas as pd
+import pyarrow.parquet as pq
 
 # ⚠️ IMPORTANT: These imports must point to your simplified files (db_utils and db_models)
 # If you don't want logging at all, you can remove these and related code.
-from db_utils import initialize_database, log_post_analysis 
+from db_utils import initialize_database, log_post_analysis, log_post_analyses
+from replica_router import ReplicaPool, routing_key
 
 # --- API CLIENT AND UTILITY STUBS ---
 # URL must match the host/port of your Python Flask/FastAPI service (e.g., model_service/ensemble_api.py)
 API_URL = "http://127.0.0.1:5001/predict_sentiment" 
+API_BATCH_URL = "http://127.0.0.1:5001/predict_batch"
+# Optional comma-separated api_server base URLs; when set, requests are routed by text (see replica_router.py)
+API_REPLICAS = [url.strip() for url in os.environ.get("MODEL_API_REPLICAS", "").split(",") if url.strip()]
 
 def clean_text_for_analysis(text):
     """Placeholder for text cleaning before API call."""
     return text
 
+# Connect fails fast when the backend is down; read allows for slow batches on CPU
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 30
+MAX_RETRIES = 2
+RETRY_BACKOFF = 0.5  # seconds, doubled per attempt, full jitter
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+# Longest server-requested Retry-After worth waiting for; beyond it the call fails fast as overloaded
+MAX_RETRY_AFTER = 10
+POOL_MAXSIZE = 10
+# Circuit breaker: after this many consecutive failures, reject calls immediately for BREAKER_RESET_SECONDS
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_SECONDS = 30
+
+class CircuitBreaker:
+    """Minimal thread-safe circuit breaker (closed -> open -> half-open)."""
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        """False while open; once reset_seconds have passed a single trial call is let through."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_seconds:
+                # Half-open: re-arm the timer so concurrent callers keep failing fast until the trial finishes
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def seconds_until_retry(self):
+        with self._lock:
+            if self.opened_at is None:
+                return 0
+            return max(0, self.reset_seconds - (time.monotonic() - self.opened_at))
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
 class APIModelClient:
-    """Client to interact with the external Python model API."""
-    def predict(self, text):
+    """
+    Client to interact with the external Python model API.
+    One instance is shared by the whole Streamlit process (see load_ensemble_models) so
+    keep-alive connections in the session's pool are reused across reruns and users.
+    """
+    def __init__(self, api_url=API_URL, replicas=API_REPLICAS):
+        self.api_url = api_url
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max(1, len(replicas)), pool_maxsize=POOL_MAXSIZE)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.breaker = CircuitBreaker()
+        self.pool = None
+        if replicas:
+            self.pool = ReplicaPool(replicas, session=self.session)
+            self.pool.start_health_checks()
+
+    def _post(self, payload, url=None, route_key=None):
+        """
+        POST with bounded retries. Prediction is side-effect free, so connection errors and
+        gateway/unavailable responses are retried with jittered exponential backoff.
+        Read timeouts are not retried: the server is already busy with this request.
+        429/503 with Retry-After is load shedding: waited out (up to MAX_RETRY_AFTER) and, when it
+        persists, reported as overloaded without counting against the circuit breaker.
+        With replicas configured, each attempt goes to the replica chosen for route_key; a replica
+        that refuses the connection is marked down, so the retry lands on its ring successor.
+        """
+        url = url or self.api_url
+        if not self.breaker.allow_request():
+            raise ConnectionError(
+                f"Model service at {self.api_url} is unavailable; retrying in {self.breaker.seconds_until_retry():.0f}s."
+            )
+
+        for attempt in range(MAX_RETRIES + 1):
+            replica = self.pool.acquire(route_key or "") if self.pool else None
+            failed = False
+            try:
+                target = replica + urlsplit(url).path if replica else url
+                # The server drops queued work once our read timeout has passed (see admission.py)
+                response = self.session.post(
+                    target, json=payload, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+                    headers={'X-Request-Timeout': str(READ_TIMEOUT)}
+                )
+                retry_after = self._retry_after(response)
+                if response.status_code in (429, 503) and retry_after is not None:
+                    # Load shedding (see admission.py): the server is healthy, so the breaker is left alone
+                    if attempt < MAX_RETRIES and retry_after <= MAX_RETRY_AFTER:
+                        time.sleep(retry_after)
+                        continue
+                    raise ConnectionError(f"Model service is overloaded; try again in {max(1, retry_after):.0f}s.")
+                if response.status_code in RETRY_STATUS_CODES and attempt < MAX_RETRIES:
+                    time.sleep(random.uniform(0, RETRY_BACKOFF * 2 ** attempt))
+                    continue
+                response.raise_for_status()
+                self.breaker.record_success()
+                return response.json()
+            except requests.exceptions.ConnectionError:
+                failed = True
+                if attempt < MAX_RETRIES:
+                    time.sleep(random.uniform(0, RETRY_BACKOFF * 2 ** attempt))
+                    continue
+                self.breaker.record_failure()
+                raise ConnectionError(f"Cannot reach model service at {self.api_url}. Is the Python service running?")
+            except requests.exceptions.Timeout:
+                self.breaker.record_failure()
+                raise ConnectionError("Model service timed out.")
+            except requests.exceptions.HTTPError as e:
+                # 4xx means the request was rejected, not that the service is unhealthy
+                if e.response is not None and e.response.status_code < 500:
+                    self.breaker.record_success()
+                else:
+                    self.breaker.record_failure()
+                raise RuntimeError(f"API Request failed: {e}")
+            except requests.exceptions.RequestException as e:
+                self.breaker.record_failure()
+                raise RuntimeError(f"API Request failed: {e}")
+            finally:
+                if replica:
+                    self.pool.release(replica, failed=failed)
+
+    @staticmethod
+    def _retry_after(response):
+        """Retry-After in seconds, or None when absent or not a number."""
         try:
-            response = requests.post(API_URL, json={'text': text}, timeout=60)
-            response.raise_for_status()
-            data = response.json()
-            
-            sentiment = data.get('sentiment')
-            confidence = data.get('confidence')
-            
-            if sentiment is None or confidence is None:
-                 raise ValueError("API response missing 'sentiment' or 'confidence'.")
-                 
-            return str(sentiment), float(confidence)
-
-        except requests.exceptions.ConnectionError:
-            raise ConnectionError(f"Cannot reach model service at {API_URL}. Is the Python service running?")
-        except requests.exceptions.Timeout:
-            raise ConnectionError("Model service timed out.")
-        except requests.exceptions.RequestException as e:
-            raise RuntimeError(f"API Request failed: {e}")
+            return max(0.0, float(response.headers['Retry-After']))
+        except (KeyError, ValueError):
+            return None
+
+    def predict(self, text):
+        sentiment, confidence, _ = self.predict_with_model_probs(text)
+        return sentiment, confidence
+
+    def predict_with_model_probs(self, text):
+        """Returns (sentiment, confidence, model_probs); model_probs is None if the API omits it."""
+        data = self._post({'text': text}, route_key=routing_key(text))
+        
+        sentiment = data.get('sentiment')
+        confidence = data.get('confidence')
+        model_probs = data.get('model_probs')
+        
+        if sentiment is None or confidence is None:
+             raise ValueError("API response missing 'sentiment' or 'confidence'.")
+
+        if model_probs is not None:
+            model_probs = [[float('nan') if p is None else float(p) for p in row] for row in model_probs]
+             
+        return str(sentiment), float(confidence), model_probs
+
+    def predict_batch(self, texts):
+        """Scores a list of texts in one request. Returns a list of (sentiment, confidence, model_probs)."""
+        texts = list(texts)
+        if self.pool:
+            return self._predict_batch_routed(texts)
+        data = self._post({'texts': texts}, url=API_BATCH_URL)
+        results = data.get('results')
+        if results is None or len(results) != len(texts):
+            raise ValueError("API response missing or incomplete 'results'.")
+        return self._parse_batch_results(results)
+
+    def _predict_batch_routed(self, texts):
+        """Splits the batch by owning replica and sends the sub-batches concurrently."""
+        keys = [routing_key(t) for t in texts]
+        groups = {}
+        for i, key in enumerate(keys):
+            groups.setdefault(self.pool.owner(key), []).append(i)
+
+        def send(indices):
+            data = self._post({'texts': [texts[i] for i in indices]}, url=API_BATCH_URL, route_key=keys[indices[0]])
+            results = data.get('results')
+            if results is None or len(results) != len(indices):
+                raise ValueError("API response missing or incomplete 'results'.")
+            return self._parse_batch_results(results)
+
+        merged = [None] * len(texts)
+        with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+            for indices, parsed in zip(groups.values(), executor.map(send, groups.values())):
+                for i, result in zip(indices, parsed):
+                    merged[i] = result
+        return merged
+
+    @staticmethod
+    def _parse_batch_results(results):
+        return [
+            (
+                str(r['sentiment']),
+                float(r['confidence']),
+                [[float('nan') if p is None else float(p) for p in row] for row in r['model_probs']]
+                if r.get('model_probs') is not None else None
+            )
+            for r in results
+        ]
 
+@st.cache_resource
 def load_ensemble_models():
-    """Initializes the API client connection."""
+    """Initializes the API client connection (one shared client per process)."""
     return APIModelClient()
 
 # --- END API CLIENT STUBS ---
@@ -111,8 +305,137 @@ def add_risk_based_resources(risk_level):
         st.markdown("""### ✅ Postivity Detected...""", unsafe_allow_html=True)
 
 
+# --- BULK FILE ANALYSIS ---
+BULK_CHUNK_ROWS = 2000       # rows read from the uploaded file at a time
+BULK_BATCH_SIZE = 64         # texts per /predict_batch request
+BULK_MAX_CONCURRENCY = 4     # /predict_batch requests in flight at once
+
+def iter_uploaded_chunks(uploaded_file, text_column, chunk_rows=BULK_CHUNK_ROWS):
+    """
+    Yields (DataFrame chunk, fraction of the file consumed) without reading the whole file at once.
+    CSV is read with pandas' chunked reader, Parquet one record batch at a time.
+    """
+    if uploaded_file.name.lower().endswith(".parquet"):
+        parquet_file = pq.ParquetFile(uploaded_file)
+        total = max(parquet_file.metadata.num_rows, 1)
+        done = 0
+        for batch in parquet_file.iter_batches(batch_size=chunk_rows):
+            chunk = batch.to_pandas()
+            done += len(chunk)
+            yield chunk, done / total
+    else:
+        total = max(uploaded_file.size, 1)
+        for chunk in pd.read_csv(uploaded_file, chunksize=chunk_rows, dtype={text_column: str}):
+            yield chunk, min(uploaded_file.tell() / total, 1.0)
+
+def read_uploaded_columns(uploaded_file):
+    """Column names of the uploaded file (reads only the header / schema)."""
+    if uploaded_file.name.lower().endswith(".parquet"):
+        columns = pq.ParquetFile(uploaded_file).schema_arrow.names
+    else:
+        columns = list(pd.read_csv(uploaded_file, nrows=0).columns)
+    uploaded_file.seek(0)
+    return columns
+
+def score_chunk(client, executor, texts):
+    """Scores one chunk as BULK_BATCH_SIZE batches; at most BULK_MAX_CONCURRENCY requests run at once."""
+    batches = [texts[i:i + BULK_BATCH_SIZE] for i in range(0, len(texts), BULK_BATCH_SIZE)]
+    results = []
+    for batch_results in executor.map(client.predict_batch, batches):
+        results.extend(batch_results)
+    return results
+
+def run_bulk_analysis(uploaded_file, text_column):
+    """
+    Streams the uploaded file through the model service chunk by chunk, appending scored rows to a
+    temporary CSV and logging each chunk in bulk. Returns the scored CSV as bytes; the temporary
+    file is always removed, so repeated uploads do not accumulate in the temp directory.
+    """
+    output = tempfile.NamedTemporaryFile(prefix="scored_", suffix=".csv", delete=False)
+    output.close()
+    try:
+        _score_upload_to_csv(uploaded_file, text_column, output.name)
+        with open(output.name, "rb") as f:
+            return f.read()
+    finally:
+        os.remove(output.name)
+
+def _score_upload_to_csv(uploaded_file, text_column, output_path):
+    client = st.session_state.ensemble_model
+
+    progress = st.progress(0.0, text="Starting bulk analysis...")
+    summary_placeholder = st.empty()
+    preview_placeholder = st.empty()
+    risk_counts = {}
+    rows_done = 0
+
+    with ThreadPoolExecutor(max_workers=BULK_MAX_CONCURRENCY) as executor:
+        for chunk_index, (chunk, fraction) in enumerate(iter_uploaded_chunks(uploaded_file, text_column)):
+            raw_texts = chunk[text_column].fillna("").astype(str).tolist()
+            results = score_chunk(client, executor, [clean_text_for_analysis(t) for t in raw_texts])
+
+            chunk = chunk.assign(
+                risk_level=[r[0].replace(' ', '').lower() for r in results],
+                confidence=[r[1] for r in results],
+            )
+            chunk.to_csv(output_path, mode="a", header=(chunk_index == 0), index=False)
+
+            if st.session_state.db_initialized:
+                written = log_post_analyses(
+                    {'content': text, 'risk_level': level, 'confidence': conf, 'model_probs': probs}
+                    for text, (_, conf, probs), level in zip(raw_texts, results, chunk['risk_level'])
+                )
+                if not written:
+                    st.warning(f"⚠️ Warning: Could not log chunk {chunk_index + 1} to the database.")
+
+            rows_done += len(chunk)
+            for level, n in chunk['risk_level'].value_counts().items():
+                risk_counts[level] = risk_counts.get(level, 0) + int(n)
+
+            progress.progress(fraction, text=f"Analyzed {rows_done:,} posts...")
+            summary_placeholder.bar_chart(pd.Series(risk_counts, name="posts"))
+            preview_placeholder.dataframe(chunk[[text_column, 'risk_level', 'confidence']].tail(20), use_container_width=True)
+
+    progress.progress(1.0, text=f"✅ Done: analyzed {rows_done:,} posts.")
+
+def render_bulk_upload():
+    """File-upload mode: score a CSV/Parquet export of posts and offer the scored file for download."""
+    st.subheader("📂 Bulk File Analysis")
+    uploaded_file = st.file_uploader("Upload a CSV or Parquet file of posts", type=["csv", "parquet"])
+    if uploaded_file is None:
+        return
+
+    try:
+        columns = read_uploaded_columns(uploaded_file)
+    except Exception as e:
+        st.error(f"Could not read the uploaded file: {str(e)}")
+        return
+    default_index = columns.index("content") if "content" in columns else 0
+    text_column = st.selectbox("Column containing the post text:", columns, index=default_index)
+
+    if st.button("Analyze File", use_container_width=True, key="submit_bulk"):
+        if not st.session_state.models_loaded or not st.session_state.ensemble_model:
+            st.error("Model service is not available. Please try again later.")
+            return
+        try:
+            st.session_state.bulk_output = run_bulk_analysis(uploaded_file, text_column)
+            st.session_state.bulk_output_name = f"scored_{os.path.splitext(uploaded_file.name)[0]}.csv"
+        except Exception as e:
+            st.error(f"Bulk analysis stopped: {str(e)}")
+
+    output = st.session_state.get('bulk_output')
+    if output:
+        st.download_button(
+            "⬇️ Download scored file",
+            data=output,
+            file_name=st.session_state.get('bulk_output_name', 'scored_posts.csv'),
+            mime="text/csv",
+            use_container_width=True
+        )
+
+
 def main():
-    """Main application function for single-post analysis"""
+    """Main application function for single-post and bulk file analysis"""
     initialize_session_state()
     
     st.markdown('<h1 class="main-header">🧠 Mental Health Post Risk Detector</h1>', unsafe_allow_html=True)
@@ -140,6 +463,12 @@ def main():
     
     # Main Analysis Interface
     st.markdown("---")
+    mode = st.radio("Analysis mode:", ["Single post", "Bulk file upload"], horizontal=True, key="analysis_mode")
+    if mode == "Bulk file upload":
+        render_bulk_upload()
+        st.markdown("---")
+        return
+
     st.subheader("📝 Text Input")
         
     user_input = st.text_area(
@@ -153,6 +482,7 @@ def main():
         
         risk_level = 'unknown'
         confidence = 0.0
+        model_probs = None
         
         if not st.session_state.models_loaded or not st.session_state.ensemble_model:
             st.error("Model service is not available. Please try again later.")
@@ -163,7 +493,7 @@ def main():
         with st.spinner("Analyzing risk level..."):
             try:
                 # Call the prediction method (which internally calls the API)
-                risk_level, confidence = st.session_state.ensemble_model.predict(cleaned_input)
+                risk_level, confidence, model_probs = st.session_state.ensemble_model.predict_with_model_probs(cleaned_input)
                 risk_level = risk_level.replace(' ', '').lower() 
                 
             except Exception as e:
@@ -175,7 +505,8 @@ def main():
             success = log_post_analysis(
                 content=user_input, 
                 risk_level=risk_level, 
-                confidence=confidence
+                confidence=confidence,
+                model_probs=model_probs
             )
             if not success:
                  st.warning("⚠️ Warning: Could not log analysis to the database.")
@@ -0,0 +1,93 @@
+"""Chunked readers, Parquet part writers and checkpoint files shared by the offline batch jobs."""
+import json
+import os
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+CHECKPOINT_FILE = "_checkpoint.json"
+
+
+def iter_input_chunks(path, chunk_size):
+    """Yields DataFrames of up to chunk_size rows from a CSV, JSONL or Parquet file."""
+    lower = path.lower()
+    if lower.endswith(".parquet"):
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    elif lower.endswith((".jsonl", ".ndjson")):
+        with pd.read_json(path, lines=True, chunksize=chunk_size) as reader:
+            yield from reader
+    elif lower.endswith(".csv"):
+        with pd.read_csv(path, chunksize=chunk_size) as reader:
+            yield from reader
+    else:
+        raise ValueError(f"Unsupported input format: {path} (expected .csv, .jsonl or .parquet)")
+
+
+def load_checkpoint(output_dir, input_path, chunk_size):
+    """Returns (chunks_done, rows_done) already written for this input ((0, 0) when starting fresh)."""
+    path = os.path.join(output_dir, CHECKPOINT_FILE)
+    if not os.path.exists(path):
+        return 0, 0
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("input") != os.path.abspath(input_path) or checkpoint.get("chunk_size") != chunk_size:
+        raise ValueError(
+            f"{path} belongs to a different input or chunk size; use another --output directory or delete it."
+        )
+    return int(checkpoint.get("chunks_done", 0)), int(checkpoint.get("rows_done", 0))
+
+
+def save_checkpoint(output_dir, input_path, chunk_size, chunks_done, rows_done):
+    path = os.path.join(output_dir, CHECKPOINT_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({
+            "input": os.path.abspath(input_path),
+            "chunk_size": chunk_size,
+            "chunks_done": chunks_done,
+            "rows_done": rows_done,
+        }, f)
+    os.replace(tmp_path, path)
+
+
+def write_part(output_dir, chunk_index, df):
+    """Write one chunk as part-NNNNNN.parquet via a temp name, so a crash never leaves a truncated part."""
+    part_path = os.path.join(output_dir, f"part-{chunk_index:06d}.parquet")
+    # Per-process temp name: two work_queue.py workers may write the same part after a lease expiry
+    tmp_path = f"{part_path}.{os.getpid()}.tmp"
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, part_path)
+    return part_path
+
+
+def iter_pending_chunks(input_path, output_dir, chunk_size):
+    """
+    Yields (chunk_index, chunk, rows_done_before) for chunks not yet recorded in the checkpoint.
+    Callers write the part and then call save_checkpoint(..., chunk_index + 1, rows_done).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    chunks_done, rows_done = load_checkpoint(output_dir, input_path, chunk_size)
+    if chunks_done:
+        print(f"Resuming after {chunks_done} completed chunks.")
+    for chunk_index, chunk in enumerate(iter_input_chunks(input_path, chunk_size)):
+        if chunk_index < chunks_done:
+            continue
+        yield chunk_index, chunk, rows_done
+        rows_done += len(chunk)
+
+
+def read_row_range(path, start, stop):
+    """Rows [start, stop) of a Parquet file, reading only the overlapping row groups."""
+    pf = pq.ParquetFile(path)
+    groups, offset, first_offset = [], 0, None
+    for i in range(pf.num_row_groups):
+        n = pf.metadata.row_group(i).num_rows
+        if offset < stop and offset + n > start:
+            groups.append(i)
+            first_offset = offset if first_offset is None else first_offset
+        offset += n
+    if not groups:
+        return pd.DataFrame()
+    table = pf.read_row_groups(groups)
+    return table.slice(start - first_offset, stop - start).to_pandas()
@@ -1,14 +1,23 @@
 # C:\Users\hp\OneDrive\Desktop\Risk_Chat\db_models.py
 
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, create_engine
+from sqlalchemy import (
+    Column, Integer, String, Float, DateTime, Text, LargeBinary, Index, create_engine, inspect, text
+)
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
 import os
 import uuid
+import numpy as np
 
 Base = declarative_base()
 
+# Per-model softmax outputs are stored as raw float16 bytes: 3 base models x 4 risk classes,
+# in LOCAL_MODEL_PATHS / id2label order (see model_utils). 24 bytes per row.
+MODEL_PROBS_DTYPE = np.float16
+MODEL_PROBS_SHAPE = (3, 4)
+
 class PostAnalysisLog(Base):
     """Model for logging every single post analysis performed."""
     __tablename__ = 'post_analysis_logs'
@@ -20,9 +29,86 @@ class PostAnalysisLog(Base):
     confidence = Column(Float, nullable=False)
     timestamp = Column(DateTime, default=datetime.now)
     source = Column(String(50), default='streamlit_web')
+    model_probs = Column(LargeBinary, nullable=True)
+
+    __table_args__ = (
+        # Keyset pagination over (timestamp, id) for the read API (see log_queries)
+        Index('ix_post_analysis_logs_timestamp_id', 'timestamp', 'id'),
+    )
     
-# --- The Conversation class and Message class MUST be removed for Option 2 ---
-# (They were left at the end of your provided code; they are removed here)
+class Conversation(Base):
+    """A chat session; messages reference it by session_id."""
+    __tablename__ = 'conversations'
+
+    id = Column(Integer, primary_key=True)
+    session_id = Column(String(100), nullable=False, index=True)
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now)
+
+class Message(Base):
+    """A single message within a conversation session."""
+    __tablename__ = 'messages'
+
+    id = Column(Integer, primary_key=True)
+    session_id = Column(String(100), nullable=False, index=True)
+    role = Column(String(20), nullable=False)
+    content = Column(Text, nullable=False)
+    risk_level = Column(String(20))
+    confidence = Column(Float)
+    timestamp = Column(DateTime, default=datetime.now)
+
+class ConversationStats(Base):
+    """
+    Running per-session aggregate over user messages, updated in the same transaction as each
+    message insert so session statistics are a single-row read.
+    """
+    __tablename__ = 'conversation_stats'
+
+    session_id = Column(String(100), primary_key=True)
+    total_messages = Column(Integer, nullable=False, default=0)
+    no_risk_count = Column(Integer, nullable=False, default=0)
+    low_count = Column(Integer, nullable=False, default=0)
+    moderate_count = Column(Integer, nullable=False, default=0)
+    high_count = Column(Integer, nullable=False, default=0)
+    other_count = Column(Integer, nullable=False, default=0)
+    confidence_sum = Column(Float, nullable=False, default=0.0)
+    confidence_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.now)
+
+class RiskHourlyRollup(Base):
+    """
+    Hourly counts of post_analysis_logs per (risk_level, source), maintained by the log writer
+    (see log_rollups). Dashboards read this table instead of scanning the raw log.
+    """
+    __tablename__ = 'risk_hourly_rollups'
+
+    bucket_start = Column(DateTime, primary_key=True)
+    risk_level = Column(String(20), primary_key=True)
+    source = Column(String(50), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    confidence_sum = Column(Float, nullable=False, default=0.0)
+
+class RiskConfidenceRollup(Base):
+    """Daily confidence histogram per (risk_level, source) (CONFIDENCE_BINS equal-width bins, see log_rollups)."""
+    __tablename__ = 'risk_confidence_rollups'
+
+    day = Column(DateTime, primary_key=True)
+    risk_level = Column(String(20), primary_key=True)
+    source = Column(String(50), primary_key=True)
+    confidence_bin = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+# Risk label -> ConversationStats counter column ('no risk' is also seen as 'norisk' from app.py)
+RISK_COUNT_COLUMNS = {
+    'no risk': 'no_risk_count',
+    'norisk': 'no_risk_count',
+    'low': 'low_count',
+    'moderate': 'moderate_count',
+    'high': 'high_count',
+}
+
+# One engine (and connection pool) per database URL for the whole process
+_ENGINES = {}
 
 def get_engine():
     """Get database engine using environment variables"""
@@ -30,15 +116,86 @@ def get_engine():
     if not database_url:
         # NOTE: Set DATABASE_URL environment variable (e.g., 'sqlite:///./risk_analysis_log.db')
         raise ValueError("DATABASE_URL environment variable not set")
-    return create_engine(database_url)
+    if database_url not in _ENGINES:
+        _ENGINES[database_url] = create_engine(database_url)
+    return _ENGINES[database_url]
+
+def upsert_increments(session, model, key_columns, rows, increment_columns):
+    """
+    Add each row's increment_columns onto the stored row with the same key_columns, inserting rows that
+    do not exist yet; any other column in the rows is overwritten. Runs in the caller's transaction.
+
+    SQLite and PostgreSQL use INSERT ... ON CONFLICT DO UPDATE, so two writers creating the same row at
+    once cannot fail on the primary key (and roll back the caller's other inserts with it).
+    """
+    if not rows:
+        return
+    table = model.__table__
+    # Fixed key order keeps concurrent multi-row upserts from deadlocking on PostgreSQL
+    rows = sorted(rows, key=lambda row: tuple(row[col] for col in key_columns))
+    dialect = session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(table).values(rows)
+        overwrite = [col for col in rows[0] if col not in key_columns and col not in increment_columns]
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(key_columns),
+            set_={
+                **{col: table.c[col] + stmt.excluded[col] for col in increment_columns},
+                **{col: stmt.excluded[col] for col in overwrite},
+            }
+        )
+        session.execute(stmt)
+        return
+
+    # Other dialects: UPDATE, else INSERT in a savepoint; losing an insert race retries the UPDATE once
+    for row in rows:
+        key = {col: row[col] for col in key_columns}
+        values = {
+            col: (table.c[col] + value if col in increment_columns else value)
+            for col, value in row.items() if col not in key_columns
+        }
+        for attempt in range(2):
+            if session.query(model).filter_by(**key).update(values, synchronize_session=False):
+                break
+            try:
+                with session.begin_nested():
+                    session.execute(table.insert().values(row))
+                break
+            except IntegrityError:
+                if attempt:
+                    raise
 
 def init_db():
     """Initialize database tables"""
     engine = get_engine()
-    # This will only create the 'post_analysis_logs' table now
     Base.metadata.create_all(engine) 
+    _upgrade_existing_tables(engine)
     return engine
 
+def _upgrade_existing_tables(engine):
+    """
+    create_all() never alters existing tables, so nullable columns and indexes added to a model
+    after the table was first created are added here (e.g. model_probs on older log files).
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {col['name'] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                col_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}'))
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+
 def get_session():
     """Get a database session"""
     engine = get_engine()
@@ -1,7 +1,13 @@
-from db_models import PostAnalysisLog, get_session, init_db # Import simplified model
+from db_models import (
+    PostAnalysisLog, Conversation, Message, ConversationStats, RISK_COUNT_COLUMNS,
+    get_session, init_db, upsert_increments, MODEL_PROBS_DTYPE, MODEL_PROBS_SHAPE
+)
 from datetime import datetime
 import uuid
+import numpy as np
+from sqlalchemy import func, case, and_, insert, select
 from sqlalchemy.exc import SQLAlchemyError
+from log_rollups import add_to_rollups
 
 def initialize_database():
     """Initialize database and create tables if they don't exist"""
@@ -11,9 +17,71 @@ def initialize_database():
     except Exception as e:
         print(f"Error initializing database: {e}")
         return False
-def log_post_analysis(content, risk_level, confidence):
+def encode_model_probs(model_probs):
+    """
+    Pack one post's per-model probabilities (n_models x n_classes) into float16 bytes.
+    Returns None when no probabilities are available.
+    """
+    if model_probs is None:
+        return None
+    probs = np.asarray(model_probs, dtype=np.float32).reshape(MODEL_PROBS_SHAPE)
+    return probs.astype(MODEL_PROBS_DTYPE).tobytes()
+
+def load_model_probs(start_id=None, end_id=None, source=None, chunk_rows=10000):
+    """
+    Load stored per-model probabilities as one NumPy matrix.
+
+    Returns:
+        tuple: (ids, probs) where ids is an int64 array of PostAnalysisLog ids and probs is a
+        float16 array of shape (n_rows, n_models, n_classes). Rows without probabilities are skipped.
+    """
+    empty = np.empty(0, dtype=np.int64), np.empty((0, *MODEL_PROBS_SHAPE), dtype=MODEL_PROBS_DTYPE)
+    session = None
+    try:
+        session = get_session()
+        filters = [PostAnalysisLog.model_probs.isnot(None)]
+        if start_id is not None:
+            filters.append(PostAnalysisLog.id >= start_id)
+        if end_id is not None:
+            filters.append(PostAnalysisLog.id < end_id)
+        if source is not None:
+            filters.append(PostAnalysisLog.source == source)
+
+        # Size the output up front; rows logged after this point are excluded via max_id
+        n_rows, max_id = session.query(func.count(PostAnalysisLog.id), func.max(PostAnalysisLog.id)).filter(*filters).one()
+        if not n_rows:
+            return empty
+
+        ids = np.empty(n_rows, dtype=np.int64)
+        probs = np.empty((n_rows, *MODEL_PROBS_SHAPE), dtype=MODEL_PROBS_DTYPE)
+        result = session.execute(
+            select(PostAnalysisLog.id, PostAnalysisLog.model_probs)
+            .where(*filters, PostAnalysisLog.id <= max_id)
+            .order_by(PostAnalysisLog.id),
+            execution_options={"stream_results": True, "yield_per": chunk_rows}
+        )
+        n = 0
+        # One frombuffer per chunk: the blobs are fixed-size, so joining them yields a contiguous matrix
+        for chunk in result.partitions():
+            chunk = chunk[:n_rows - n]
+            if not chunk:
+                break
+            chunk_ids, blobs = zip(*chunk)
+            ids[n:n + len(chunk)] = chunk_ids
+            probs[n:n + len(chunk)] = np.frombuffer(b"".join(blobs), dtype=MODEL_PROBS_DTYPE).reshape(-1, *MODEL_PROBS_SHAPE)
+            n += len(chunk)
+        return ids[:n], probs[:n]
+    except Exception as e:
+        print(f"Error loading model probabilities: {e}")
+        return empty
+    finally:
+        if session is not None:
+            session.close()
+
+def log_post_analysis(content, risk_level, confidence, model_probs=None):
     """
     Log a single post analysis result to the database.
+    model_probs (optional) is the per-model softmax output for this post (n_models x n_classes).
     """
     try:
         session = get_session()
@@ -24,10 +92,13 @@ def log_post_analysis(content, risk_level, confidence):
             risk_level=risk_level,
             confidence=confidence,
             timestamp=datetime.now(),
-            source='streamlit_web'
+            source='streamlit_web',
+            model_probs=encode_model_probs(model_probs)
         )
         
         session.add(log_entry)
+        # Hourly dashboard rollups are updated in the same commit as the log row
+        add_to_rollups(session, [(log_entry.timestamp, risk_level, log_entry.source, confidence)])
         session.commit()
         session.close()
         return True
@@ -41,127 +112,272 @@ def log_post_analysis(content, risk_level, confidence):
     except Exception as e:
         print(f"Unexpected error in log_post_analysis: {e}")
         return False
-# def generate_session_id():
-#     """Generate a unique session ID"""
-#     return str(uuid.uuid4())
-
-# def save_message(session_id, role, content, risk_level=None, confidence=None):
-#     """Save a message to the database"""
-#     try:
-#         session = get_session()
-        
-#         # Create or update conversation
-#         conversation = session.query(Conversation).filter_by(session_id=session_id).first()
-#         if not conversation:
-#             conversation = Conversation(session_id=session_id)
-#             session.add(conversation)
-#         else:
-#             conversation.updated_at = datetime.now()
-        
-#         # Create message
-#         message = Message(
-#             session_id=session_id,
-#             role=role,
-#             content=content,
-#             risk_level=risk_level,
-#             confidence=confidence,
-#             timestamp=datetime.now()
-#         )
-#         session.add(message)
-#         session.commit()
-#         session.close()
-#         return True
-#     except Exception as e:
-#         print(f"Error saving message: {e}")
-#         return False
-
-# def load_conversation(session_id):
-#     """Load all messages for a given session"""
-#     try:
-#         session = get_session()
-#         messages = session.query(Message).filter_by(session_id=session_id).order_by(Message.timestamp).all()
+def log_post_analyses(entries, source='streamlit_bulk'):
+    """
+    Log many post analysis results in one transaction (executemany insert + one rollup update).
+
+    Args:
+        entries: iterable of dicts with content, risk_level, confidence and optional model_probs.
+            An optional analysis_id makes the write idempotent: entries whose id is already logged
+            are skipped (and not counted again in the rollups), so replaying a batch is harmless.
+        source (str): Source tag stored on every row
+
+    Returns:
+        int: number of entries now stored, including ones skipped as already logged (0 on error)
+    """
+    now = datetime.now()
+    rows = [
+        {
+            'analysis_id': entry.get('analysis_id') or str(uuid.uuid4()),
+            'content': entry['content'],
+            'risk_level': entry['risk_level'],
+            'confidence': entry['confidence'],
+            'timestamp': now,
+            'source': source,
+            'model_probs': encode_model_probs(entry.get('model_probs')),
+        }
+        for entry in entries
+    ]
+    if not rows:
+        return 0
+    total = len(rows)
+    try:
+        session = get_session()
+        existing = set()
+        for start in range(0, total, 500):
+            ids = [row['analysis_id'] for row in rows[start:start + 500]]
+            existing.update(
+                analysis_id for (analysis_id,) in
+                session.query(PostAnalysisLog.analysis_id).filter(PostAnalysisLog.analysis_id.in_(ids))
+            )
+        rows = [row for row in rows if row['analysis_id'] not in existing]
+        if rows:
+            session.execute(insert(PostAnalysisLog), rows)
+            add_to_rollups(session, [(now, row['risk_level'], source, row['confidence']) for row in rows])
+            session.commit()
+        session.close()
+        return total
+    except Exception as e:
+        print(f"Error bulk logging analyses to database: {e}")
+        if 'session' in locals():
+            session.rollback()
+            session.close()
+        return 0
+
+def generate_session_id():
+    """Generate a unique session ID"""
+    return str(uuid.uuid4())
+
+def _stats_increments(risk_level, confidence):
+    """Column increments a single user message contributes to its ConversationStats row."""
+    increments = {'total_messages': 1}
+    if risk_level:
+        column = RISK_COUNT_COLUMNS.get(risk_level.lower(), 'other_count')
+        increments[column] = 1
+    # 0.0 is a real confidence; rebuild_conversation_stats counts it too
+    if confidence is not None:
+        increments['confidence_sum'] = float(confidence)
+        increments['confidence_count'] = 1
+    return increments
+
+STATS_COUNTER_COLUMNS = (
+    'total_messages', 'no_risk_count', 'low_count', 'moderate_count',
+    'high_count', 'other_count', 'confidence_sum', 'confidence_count'
+)
+
+def _update_conversation_stats(session, session_id, risk_level, confidence, now):
+    """
+    Add one user message to the session's aggregate row (inside the caller's transaction).
+    An upsert with column = column + n, so concurrent writers neither lose an increment nor
+    collide when creating the session's first row.
+    """
+    increments = _stats_increments(risk_level, confidence)
+    row = {'session_id': session_id, 'updated_at': now}
+    row.update({col: increments.get(col, 0) for col in STATS_COUNTER_COLUMNS})
+    upsert_increments(session, ConversationStats, ['session_id'], [row], STATS_COUNTER_COLUMNS)
+
+def save_message(session_id, role, content, risk_level=None, confidence=None):
+    """Save a message to the database"""
+    try:
+        session = get_session()
+        now = datetime.now()
         
-#         result = []
-#         for msg in messages:
-#             message_data = {
-#                 'role': msg.role,
-#                 'content': msg.content,
-#                 'timestamp': msg.timestamp
-#             }
-#             if msg.risk_level:
-#                 message_data['risk_level'] = msg.risk_level
-#             if msg.confidence:
-#                 message_data['confidence'] = msg.confidence
-#             result.append(message_data)
+        # Create or update conversation
+        conversation = session.query(Conversation).filter_by(session_id=session_id).first()
+        if not conversation:
+            conversation = Conversation(session_id=session_id, created_at=now, updated_at=now)
+            session.add(conversation)
+        else:
+            conversation.updated_at = now
         
-#         session.close()
-#         return result
-#     except Exception as e:
-#         print(f"Error loading conversation: {e}")
-#         return []
-
-# def get_all_sessions():
-#     """Get all conversation sessions"""
-#     try:
-#         session = get_session()
-#         conversations = session.query(Conversation).order_by(Conversation.updated_at.desc()).all()
+        # Create message
+        message = Message(
+            session_id=session_id,
+            role=role,
+            content=content,
+            risk_level=risk_level,
+            confidence=confidence,
+            timestamp=now
+        )
+        session.add(message)
+
+        # Keep the session aggregate in step with the insert (same commit)
+        if role == 'user':
+            _update_conversation_stats(session, session_id, risk_level, confidence, now)
+
+        session.commit()
+        session.close()
+        return True
+    except Exception as e:
+        print(f"Error saving message: {e}")
+        if 'session' in locals():
+            session.rollback()
+            session.close()
+        return False
+
+def load_conversation(session_id, after_id=0, limit=500):
+    """
+    Load messages for a given session in chronological order.
+    Pass the last returned message 'id' as after_id to fetch the next page.
+    """
+    try:
+        session = get_session()
+        messages = (
+            session.query(Message)
+            .filter(Message.session_id == session_id, Message.id > after_id)
+            .order_by(Message.id)
+            .limit(limit)
+        )
         
-#         result = []
-#         for conv in conversations:
-#             result.append({
-#                 'session_id': conv.session_id,
-#                 'created_at': conv.created_at,
-#                 'updated_at': conv.updated_at
-#             })
+        result = []
+        for msg in messages:
+            message_data = {
+                'id': msg.id,
+                'role': msg.role,
+                'content': msg.content,
+                'timestamp': msg.timestamp
+            }
+            if msg.risk_level:
+                message_data['risk_level'] = msg.risk_level
+            if msg.confidence:
+                message_data['confidence'] = msg.confidence
+            result.append(message_data)
         
-#         session.close()
-#         return result
-#     except Exception as e:
-#         print(f"Error getting sessions: {e}")
-#         return []
-
-# def delete_conversation(session_id):
-#     """Delete a conversation and all its messages"""
-#     try:
-#         session = get_session()
-#         session.query(Message).filter_by(session_id=session_id).delete()
-#         session.query(Conversation).filter_by(session_id=session_id).delete()
-#         session.commit()
-#         session.close()
-#         return True
-#     except Exception as e:
-#         print(f"Error deleting conversation: {e}")
-#         return False
-
-# def get_conversation_stats(session_id):
-#     """Get statistics for a conversation"""
-#     try:
-#         session = get_session()
-#         messages = session.query(Message).filter_by(session_id=session_id, role='user').all()
+        session.close()
+        return result
+    except Exception as e:
+        print(f"Error loading conversation: {e}")
+        return []
+
+def get_all_sessions(limit=100):
+    """Get the most recently updated conversation sessions"""
+    try:
+        session = get_session()
+        conversations = session.query(Conversation).order_by(Conversation.updated_at.desc()).limit(limit)
         
-#         if not messages:
-#             session.close()
-#             return None
+        result = []
+        for conv in conversations:
+            result.append({
+                'session_id': conv.session_id,
+                'created_at': conv.created_at,
+                'updated_at': conv.updated_at
+            })
         
-#         risk_levels = {}
-#         total_confidence = 0
-#         count = 0
+        session.close()
+        return result
+    except Exception as e:
+        print(f"Error getting sessions: {e}")
+        return []
+
+def delete_conversation(session_id):
+    """Delete a conversation, all its messages and its aggregate row"""
+    try:
+        session = get_session()
+        session.query(Message).filter_by(session_id=session_id).delete()
+        session.query(ConversationStats).filter_by(session_id=session_id).delete()
+        session.query(Conversation).filter_by(session_id=session_id).delete()
+        session.commit()
+        session.close()
+        return True
+    except Exception as e:
+        print(f"Error deleting conversation: {e}")
+        return False
+
+def get_conversation_stats(session_id):
+    """Get statistics for a conversation (single-row read of the maintained aggregate)"""
+    try:
+        session = get_session()
+        stats = session.query(ConversationStats).filter_by(session_id=session_id).first()
+        session.close()
         
-#         for msg in messages:
-#             if msg.risk_level:
-#                 risk_levels[msg.risk_level] = risk_levels.get(msg.risk_level, 0) + 1
-#             if msg.confidence:
-#                 total_confidence += msg.confidence
-#                 count += 1
+        if not stats or not stats.total_messages:
+            return None
         
-#         avg_confidence = total_confidence / count if count > 0 else 0
+        risk_levels = {
+            'no risk': stats.no_risk_count,
+            'low': stats.low_count,
+            'moderate': stats.moderate_count,
+            'high': stats.high_count,
+            'other': stats.other_count,
+        }
+        avg_confidence = stats.confidence_sum / stats.confidence_count if stats.confidence_count > 0 else 0
         
-#         session.close()
-#         return {
-#             'total_messages': len(messages),
-#             'risk_distribution': risk_levels,
-#             'average_confidence': avg_confidence
-#         }
-#     except Exception as e:
-#         print(f"Error getting conversation stats: {e}")
-#         return None
+        return {
+            'total_messages': stats.total_messages,
+            'risk_distribution': {level: n for level, n in risk_levels.items() if n},
+            'average_confidence': avg_confidence,
+            'updated_at': stats.updated_at
+        }
+    except Exception as e:
+        print(f"Error getting conversation stats: {e}")
+        return None
+
+def rebuild_conversation_stats(session_id=None):
+    """
+    Recompute aggregate rows from the messages table with one GROUP BY
+    (backfill for sessions recorded before conversation_stats existed, or repair).
+    """
+    try:
+        session = get_session()
+        level = func.lower(Message.risk_level)
+        counts = [
+            func.sum(case((level.in_(labels), 1), else_=0)).label(column)
+            for column, labels in _labels_by_column().items()
+        ]
+        known = list(RISK_COUNT_COLUMNS)
+        query = session.query(
+            Message.session_id,
+            func.count(Message.id).label('total_messages'),
+            *counts,
+            func.sum(case((and_(Message.risk_level.isnot(None), level.notin_(known)), 1), else_=0)).label('other_count'),
+            func.coalesce(func.sum(Message.confidence), 0.0).label('confidence_sum'),
+            func.count(Message.confidence).label('confidence_count'),
+            func.max(Message.timestamp).label('updated_at'),
+        ).filter(Message.role == 'user').group_by(Message.session_id)
+
+        stats_query = session.query(ConversationStats)
+        if session_id is not None:
+            query = query.filter(Message.session_id == session_id)
+            stats_query = stats_query.filter_by(session_id=session_id)
+
+        stats_query.delete(synchronize_session=False)
+        rebuilt = 0
+        for row in query:
+            session.add(ConversationStats(**row._asdict()))
+            rebuilt += 1
+        session.commit()
+        session.close()
+        return rebuilt
+    except Exception as e:
+        print(f"Error rebuilding conversation stats: {e}")
+        if 'session' in locals():
+            session.rollback()
+            session.close()
+        return 0
+
+def _labels_by_column():
+    """Inverse of RISK_COUNT_COLUMNS: counter column -> risk labels counted in it."""
+    labels = {}
+    for label, column in RISK_COUNT_COLUMNS.items():
+        labels.setdefault(column, []).append(label)
+    return labels
@@ -0,0 +1,159 @@
+"""
+Cached base-model probability matrices for meta-model training and evaluation.
+
+Each base model's softmax output over a list of texts is computed once per
+(model checkpoint, dataset hash, max_length) and saved as data/features/<model>-<ckpt>-<data>-<len>.npy.
+Later calls memory-map the file, so iterating on the stacker (refitting, cross-validation,
+evaluation) needs no transformer forward passes.
+"""
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import accuracy_score, f1_score, log_loss, precision_score, recall_score
+from sklearn.model_selection import StratifiedKFold
+
+FEATURE_DIR = os.path.join("data", "features")
+
+
+def checkpoint_fingerprint(model_dir):
+    """Hash of the checkpoint's file names, sizes and modification times (cheap, changes on re-save)."""
+    h = hashlib.sha256()
+    for root, _, files in sorted(os.walk(model_dir)):
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            h.update(f"{os.path.relpath(path, model_dir)}|{stat.st_size}|{stat.st_mtime_ns}\n".encode())
+    return h.hexdigest()[:12]
+
+
+def texts_hash(texts):
+    h = hashlib.sha256()
+    for text in texts:
+        h.update(text.encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()[:16]
+
+
+def compute_model_probs(ensemble, name, texts, batch_size=64, max_length=128):
+    """
+    One base model's (n_texts, n_classes) softmax output, computed in length-sorted batches.
+    A batch with NaN logits is rerun one text at a time, so only the texts that produce NaN themselves
+    are left as NaN rows.
+    """
+    model_info = ensemble.models[name]
+    probs = np.full((len(texts), len(ensemble.id2label)), np.nan, dtype=np.float32)
+    order = np.argsort([len(t) for t in texts], kind="stable")
+    for start in range(0, len(texts), batch_size):
+        idx = order[start:start + batch_size]
+        batch_probs = ensemble._predict_batch(
+            model_info["model"], model_info["tokenizer"], [texts[i] for i in idx], max_length
+        )
+        if batch_probs is not None:
+            probs[idx] = batch_probs
+        elif len(idx) > 1:
+            for i in idx:
+                row = ensemble._predict_batch(model_info["model"], model_info["tokenizer"], [texts[i]], max_length)
+                if row is not None:
+                    probs[i] = row[0]
+    return probs
+
+
+def valid_rows(features):
+    """Boolean mask of feature rows without NaN (texts every base model could score)."""
+    return ~np.isnan(np.asarray(features)).any(axis=1)
+
+
+def get_model_probs(ensemble, name, texts, batch_size=64, max_length=128, feature_dir=FEATURE_DIR):
+    """
+    Cached compute_model_probs(); returns a read-only memory-mapped array when the cache exists.
+    Texts the checkpoint yields NaN logits for stay NaN (that is deterministic, so they are cached too);
+    filter them with valid_rows(). Exceptions propagate and cache nothing.
+    """
+    texts = ensemble._ensure_text_format(texts)
+    key = f"{name}-{checkpoint_fingerprint(ensemble.model_paths[name])}-{texts_hash(texts)}-{max_length}"
+    path = os.path.join(feature_dir, f"{key}.npy")
+
+    if not os.path.exists(path):
+        print(f"Computing {name} features for {len(texts):,} texts...")
+        probs = compute_model_probs(ensemble, name, texts, batch_size, max_length)
+        invalid = np.flatnonzero(~valid_rows(probs))
+        if len(invalid):
+            shown = ", ".join(str(i) for i in invalid[:20]) + (", ..." if len(invalid) > 20 else "")
+            print(f"⚠️ {name} produced NaN logits for {len(invalid):,} of {len(texts):,} texts (rows {shown})")
+        os.makedirs(feature_dir, exist_ok=True)
+        tmp_path = path + ".tmp.npy"
+        np.save(tmp_path, probs)
+        os.replace(tmp_path, path)
+
+    return np.load(path, mmap_mode="r")
+
+
+def get_meta_features(ensemble, texts, batch_size=64, max_length=128):
+    """Stacked (n_texts, n_models * n_classes) meta-features in LOCAL_MODEL_PATHS order (NaN rows included)."""
+    return np.hstack([
+        get_model_probs(ensemble, name, texts, batch_size, max_length)
+        for name in ensemble.model_paths
+        if name in ensemble.models
+    ])
+
+
+def make_meta_model():
+    """Logistic-regression stacker with the notebook's settings."""
+    return LogisticRegression(max_iter=1000, class_weight='balanced', solver='lbfgs')
+
+
+def cross_validated_stacking(ensemble, texts, labels, n_splits=5, seed=42):
+    """
+    Out-of-fold macro F1 of the stacker over cached features (no forward passes after the first call).
+    Rows with NaN features are left out of the folds.
+
+    Returns:
+        tuple: (per-fold F1 list, out-of-fold predicted probabilities; NaN for the rows left out)
+    """
+    X = np.asarray(get_meta_features(ensemble, texts))
+    y = np.asarray(labels)
+    oof = np.full((len(y), len(ensemble.id2label)), np.nan, dtype=np.float64)
+    rows = np.flatnonzero(valid_rows(X))
+    scores = []
+    for train_idx, test_idx in StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=seed).split(X[rows], y[rows]):
+        train_idx, test_idx = rows[train_idx], rows[test_idx]
+        meta_model = make_meta_model().fit(X[train_idx], y[train_idx])
+        oof[test_idx] = meta_model.predict_proba(X[test_idx])
+        scores.append(f1_score(y[test_idx], oof[test_idx].argmax(axis=1), average="macro"))
+    return scores, oof
+
+
+def get_valid_meta_features(ensemble, texts, labels):
+    """(meta-features, labels) without the rows that have NaN features."""
+    X = np.asarray(get_meta_features(ensemble, texts))
+    mask = valid_rows(X)
+    if not mask.all():
+        print(f"⚠️ Skipping {int((~mask).sum()):,} of {len(mask):,} texts without valid base-model features")
+    return X[mask], np.asarray(labels)[mask]
+
+
+def evaluate_ensemble(ensemble, X_train, y_train, X_val, y_val):
+    """Train/validation metrics of the fitted meta-model, using cached base-model features."""
+    train_meta_X, y_train = get_valid_meta_features(ensemble, X_train, y_train)
+    train_preds = ensemble.meta_model.predict(train_meta_X)
+    train_probs = ensemble.meta_model.predict_proba(train_meta_X)
+
+    val_meta_X, y_val = get_valid_meta_features(ensemble, X_val, y_val)
+    val_preds = ensemble.meta_model.predict(val_meta_X)
+    val_probs = ensemble.meta_model.predict_proba(val_meta_X)
+
+    return pd.DataFrame([{
+        "Training Loss": log_loss(y_train, train_probs),
+        "Validation Loss": log_loss(y_val, val_probs),
+        "Training Accuracy": accuracy_score(y_train, train_preds),
+        "Validation Accuracy": accuracy_score(y_val, val_preds),
+        "Training F1": f1_score(y_train, train_preds, average="macro"),
+        "Validation F1": f1_score(y_val, val_preds, average="macro"),
+        "Training Precision": precision_score(y_train, train_preds, average="macro"),
+        "Validation Precision": precision_score(y_val, val_preds, average="macro"),
+        "Training Recall": recall_score(y_train, train_preds, average="macro"),
+        "Validation Recall": recall_score(y_val, val_preds, average="macro"),
+    }])
@@ -0,0 +1,291 @@
+"""
+Offline geocoding of place names against a local GeoNames gazetteer.
+
+    python geocoding.py build cities15000.txt          # once: index a GeoNames dump into data/gazetteer/
+    python geocoding.py locate location_risk.csv --output map_risk_data.csv
+
+Replaces the notebook's GeoNames HTTP / Nominatim loops (one request per location plus time.sleep(1)).
+The gazetteer's names and alternate names are normalized (accents, case, punctuation) and stored as a
+sorted, memory-mapped NumPy key array, so an exact lookup is a binary search. Names without an exact
+match fall back to difflib fuzzy matching among keys sharing the same prefix. Every answer, including
+"not found", is stored in data/geocode_cache.sqlite per gazetteer build and fuzzy setting, so reruns
+repeat no work and a rebuilt gazetteer starts with a fresh cache.
+"""
+import argparse
+import difflib
+import hashlib
+import os
+import re
+import sqlite3
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+GAZETTEER_DIR = os.path.join("data", "gazetteer")
+GEOCODE_CACHE_PATH = os.path.join("data", "geocode_cache.sqlite")
+KEY_BYTES = 48          # normalized names longer than this are truncated in the index
+FUZZY_CUTOFF = 0.85
+FUZZY_PREFIX = 2        # fuzzy candidates must share this many leading characters
+PREFIX_BLOCK_CACHE = 64  # prefix ranges kept decoded for fuzzy lookups
+
+# Column positions in GeoNames dumps (allCountries.txt, cities*.txt)
+GEONAMES_COLUMNS = {"name": 1, "asciiname": 2, "alternatenames": 3, "latitude": 4, "longitude": 5,
+                    "feature_class": 6, "country": 8, "population": 14}
+
+
+def normalize_place_name(name):
+    """'São Paulo ' -> 'sao paulo'; strips accents, punctuation and a leading 'the'."""
+    if not isinstance(name, str):
+        return ""
+    name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii").lower()
+    name = re.sub(r"[^a-z0-9]+", " ", name).strip()
+    if name.startswith("the "):
+        name = name[4:]
+    return name
+
+
+def build_gazetteer(geonames_path, out_dir=GAZETTEER_DIR, min_population=0):
+    """
+    Index a GeoNames dump. Every name and alternate name becomes a key; when several places share a
+    key, the most populous one wins.
+    """
+    cols = GEONAMES_COLUMNS
+    places = pd.read_csv(
+        geonames_path, sep="\t", header=None, quoting=3, dtype=str, keep_default_na=False,
+        usecols=list(cols.values())
+    ).rename(columns={v: k for k, v in cols.items()})
+    places["population"] = pd.to_numeric(places["population"], errors="coerce").fillna(0).astype(np.int64)
+    places = places[places["population"] >= min_population].reset_index(drop=True)
+
+    names = (places["name"] + "," + places["asciiname"] + "," + places["alternatenames"]).str.split(",")
+    keys = names.explode().map(normalize_place_name)
+    keys = keys[keys.str.len() > 0]
+    table = pd.DataFrame({"key": keys.values, "place": keys.index.values})
+    table["population"] = places["population"].values[table["place"].values]
+    table = (table.sort_values(["key", "population"], ascending=[True, False])
+                  .drop_duplicates("key", keep="first"))
+
+    # Display names as one UTF-8 blob plus row offsets, so they are memory-mapped like the other arrays
+    encoded = [name.encode("utf-8") for name in places["name"]]
+    name_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(name) for name in encoded], out=name_offsets[1:])
+    arrays = {
+        "keys": table["key"].str.slice(0, KEY_BYTES).values.astype(f"S{KEY_BYTES}"),
+        "key_place": table["place"].values.astype(np.int32),
+        "latitude": places["latitude"].astype(np.float32).values,
+        "longitude": places["longitude"].astype(np.float32).values,
+        "population": places["population"].values,
+        "country": places["country"].values.astype("S2"),
+        "name_offsets": name_offsets,
+        "name_blob": np.frombuffer(b"".join(encoded), dtype=np.uint8),
+    }
+
+    os.makedirs(out_dir, exist_ok=True)
+    build_id_path = os.path.join(out_dir, "build_id.txt")
+    if os.path.exists(build_id_path):
+        os.remove(build_id_path)  # an interrupted rebuild must not pass for the previous build
+    build_id = hashlib.sha256()
+    for name, values in arrays.items():
+        np.save(os.path.join(out_dir, f"{name}.npy"), values)
+        build_id.update(name.encode() + np.ascontiguousarray(values).tobytes())
+    # Keys geocode cache entries to this build (see GeocodeCache)
+    with open(build_id_path, "w") as f:
+        f.write(build_id.hexdigest()[:16])
+    print(f"Indexed {len(places):,} places under {len(table):,} names into {out_dir}")
+
+
+class Gazetteer:
+    """Read-only, memory-mapped view of a built gazetteer."""
+    def __init__(self, index_dir=GAZETTEER_DIR):
+        load = lambda name: np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode="r")
+        self.keys = load("keys")
+        self.key_place = load("key_place")
+        self.latitude = load("latitude")
+        self.longitude = load("longitude")
+        self.population = load("population")
+        self.country = load("country")
+        self.name_offsets = load("name_offsets")
+        self.name_blob = load("name_blob")
+        with open(os.path.join(index_dir, "build_id.txt")) as f:
+            self.build_id = f.read().strip()
+        self._blocks = {}
+
+    def name(self, row):
+        """Display name of a place row."""
+        return bytes(self.name_blob[self.name_offsets[row]:self.name_offsets[row + 1]]).decode("utf-8")
+
+    def _prefix_block(self, prefix):
+        """(first row, keys as a uint8 matrix, key lengths) for one prefix range; recent ranges are reused."""
+        if prefix not in self._blocks:
+            lo = int(np.searchsorted(self.keys, prefix))
+            hi = int(np.searchsorted(self.keys, prefix + b"\xff"))
+            block = np.frombuffer(self.keys[lo:hi].tobytes(), dtype=np.uint8).reshape(hi - lo, KEY_BYTES)
+            if len(self._blocks) >= PREFIX_BLOCK_CACHE:
+                self._blocks.pop(next(iter(self._blocks)))
+            self._blocks[prefix] = (lo, block, (block != 0).sum(axis=1))
+        return self._blocks[prefix]
+
+    def exact(self, normalized):
+        """Place row per normalized name (-1 when absent), via one vectorized binary search."""
+        if len(self.keys) == 0:
+            return np.full(len(normalized), -1, dtype=np.int64)
+        query = np.array([n[:KEY_BYTES] for n in normalized], dtype=f"S{KEY_BYTES}")
+        pos = np.searchsorted(self.keys, query)
+        pos_clipped = np.minimum(pos, len(self.keys) - 1)
+        hit = (pos < len(self.keys)) & (self.keys[pos_clipped] == query)
+        return np.where(hit, self.key_place[pos_clipped], -1)
+
+    def fuzzy(self, normalized, cutoff=FUZZY_CUTOFF):
+        """
+        Closest key among those sharing the first FUZZY_PREFIX characters, or -1.
+
+        difflib's ratio is 2*M / (len_a + len_b), so keys whose length, or whose character counts, cannot
+        reach the cutoff are dropped with vectorized upper bounds first; SequenceMatcher then only runs
+        on the few candidates left instead of the whole prefix range.
+        """
+        query = normalized[:KEY_BYTES].encode("ascii", "ignore")
+        prefix = query[:FUZZY_PREFIX]
+        if len(prefix) < FUZZY_PREFIX or len(self.keys) == 0:
+            return -1
+        lo, block, lengths = self._prefix_block(prefix)
+        if len(block) == 0:
+            return -1
+        n = len(query)
+        rows = np.flatnonzero(2 * np.minimum(lengths, n) >= cutoff * (lengths + n))
+        if rows.size == 0:
+            return -1
+
+        # Shared character counts bound the number of matching characters (difflib's quick_ratio)
+        chars = block[rows]
+        shared = np.zeros(rows.size, dtype=np.int64)
+        for char in set(query):
+            shared += np.minimum((chars == char).sum(axis=1), query.count(char))
+        rows = rows[2 * shared >= cutoff * (lengths[rows] + n)]
+        if rows.size == 0:
+            return -1
+
+        candidates = [k.decode("ascii") for k in self.keys[lo + rows]]
+        match = difflib.get_close_matches(query.decode("ascii"), candidates, n=1, cutoff=cutoff)
+        if not match:
+            return -1
+        return int(self.key_place[lo + rows[candidates.index(match[0])]])
+
+
+class GeocodeCache:
+    """(gazetteer build, fuzzy flag, normalized query) -> place result (or a stored miss) in SQLite."""
+    def __init__(self, path=GEOCODE_CACHE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS geocode_cache ("
+            "build_id TEXT NOT NULL, fuzzy INTEGER NOT NULL, query TEXT NOT NULL, "
+            "latitude REAL, longitude REAL, matched_name TEXT, country TEXT, match_type TEXT NOT NULL, "
+            "PRIMARY KEY (build_id, fuzzy, query))"
+        )
+        self.conn.commit()
+
+    def get_many(self, queries, build_id, fuzzy, query_size=500):
+        found = {}
+        for start in range(0, len(queries), query_size):
+            part = queries[start:start + query_size]
+            rows = self.conn.execute(
+                f"SELECT query, latitude, longitude, matched_name, country, match_type FROM geocode_cache "
+                f"WHERE build_id = ? AND fuzzy = ? AND query IN ({','.join('?' * len(part))})",
+                [build_id, int(fuzzy), *part]
+            )
+            found.update((row[0], row[1:]) for row in rows)
+        return found
+
+    def put_many(self, items, build_id, fuzzy):
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO geocode_cache VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(build_id, int(fuzzy), query, *result) for query, result in items]
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+def geocode_many(locations, gazetteer, cache=None, fuzzy=True):
+    """
+    Geocode place names in one pass.
+
+    Returns:
+        DataFrame with columns location, latitude, longitude, matched_name, country, match_type
+        ('exact', 'fuzzy' or 'none'), one row per input in input order.
+    """
+    locations = list(locations)
+    # 'Austin, Texas' falls back to its first comma-separated part when the full name is unknown
+    queries = [normalize_place_name(loc) for loc in locations]
+    firsts = [normalize_place_name(loc.split(",")[0]) if isinstance(loc, str) else "" for loc in locations]
+    unique = list(dict.fromkeys(q for q in queries if q))
+
+    results = cache.get_many(unique, gazetteer.build_id, fuzzy) if cache is not None else {}
+    todo = [q for q in unique if q not in results]
+    if todo:
+        first_of = dict(zip(queries, firsts))
+        rows = gazetteer.exact(todo)
+        missing = rows < 0
+        if missing.any():
+            fallback = gazetteer.exact([first_of[q] or q for q in np.array(todo, dtype=object)[missing]])
+            rows[missing] = fallback
+        new_items = []
+        for query, row in zip(todo, rows):
+            match_type = "exact"
+            if row < 0 and fuzzy:
+                row = gazetteer.fuzzy(query)
+                match_type = "fuzzy"
+            if row < 0:
+                result = (None, None, None, None, "none")
+            else:
+                result = (float(gazetteer.latitude[row]), float(gazetteer.longitude[row]),
+                          gazetteer.name(row), gazetteer.country[row].decode("ascii"), match_type)
+            new_items.append((query, result))
+        results.update(new_items)
+        if cache is not None:
+            cache.put_many(new_items, gazetteer.build_id, fuzzy)
+
+    empty = (None, None, None, None, "none")
+    return pd.DataFrame(
+        [(loc, *results.get(q, empty)) for loc, q in zip(locations, queries)],
+        columns=["location", "latitude", "longitude", "matched_name", "country", "match_type"]
+    )
+
+
+def geocode_location(location_name, gazetteer, cache=None):
+    """Drop-in for the notebook's geocode_location(): (lat, lon) or (None, None)."""
+    row = geocode_many([location_name], gazetteer, cache).iloc[0]
+    return row["latitude"], row["longitude"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline gazetteer geocoding.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="Index a GeoNames dump (e.g. cities15000.txt)")
+    build.add_argument("geonames_file")
+    build.add_argument("--min-population", type=int, default=0)
+
+    locate = sub.add_parser("locate", help="Geocode the locations of a location_extraction.py output")
+    locate.add_argument("input", help="CSV with a 'location' column (and optionally 'majority_risk')")
+    locate.add_argument("--output", default="map_risk_data.csv")
+    locate.add_argument("--no-fuzzy", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_gazetteer(args.geonames_file, min_population=args.min_population)
+    else:
+        table = pd.read_csv(args.input)
+        cache = GeocodeCache()
+        try:
+            coords = geocode_many(table["location"].tolist(), Gazetteer(), cache, fuzzy=not args.no_fuzzy)
+        finally:
+            cache.close()
+        map_df = pd.concat([table.reset_index(drop=True), coords.drop(columns="location")], axis=1)
+        if "majority_risk" in map_df.columns:
+            map_df["risk"] = map_df["majority_risk"]
+        found = map_df["latitude"].notna()
+        map_df[found].to_csv(args.output, index=False)
+        print(f"Geocoded {int(found.sum()):,} of {len(map_df):,} locations -> {args.output}")
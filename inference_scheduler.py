@@ -0,0 +1,189 @@
+"""
+Micro-batching scheduler for hybrid (ensemble + semantic lexicon) inference.
+
+Request threads call submit(texts) and wait on the returned Future. A single scheduler thread
+drains the queue into one batch, waiting at most max_wait_ms for more requests. A batch never holds
+more than max_batch_size texts: larger requests are split into parts, and a request that does not
+fit starts the next batch.
+
+The scheduler runs the ensemble and the semantic scorer on each batch concurrently in two worker
+threads. Both release the GIL in their heavy parts (torch forward pass, NumPy matmul), so a batch
+takes about as long as the slower component rather than the sum of the two.
+
+With an admission.BatchAdmission, submit() rejects requests whose estimated queueing delay is over
+budget or past their deadline, and queued requests whose deadline passes are dropped instead of
+being scored.
+"""
+import math
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+
+from admission import DeadlineExceeded
+
+
+def combine_predictions(model_risk, model_conf, semantic_risk, sim_score,
+                        sim_threshold=0.7, model_conf_threshold=0.85):
+    """The notebook's hybrid rule: trust the lexicon only when it is confident and the model is not."""
+    if model_risk != semantic_risk:
+        if sim_score >= sim_threshold and model_conf < model_conf_threshold:
+            return semantic_risk
+    return model_risk
+
+
+class HybridBatchScheduler:
+    def __init__(self, ensemble, semantic_scorer, max_batch_size=64, max_wait_ms=5, max_length=128,
+                 admission=None):
+        self.ensemble = ensemble
+        self.semantic_scorer = semantic_scorer
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_length = max_length
+        self.admission = admission
+
+        self._queue = queue.Queue()
+        self._carry = None  # request taken from the queue that did not fit into the previous batch
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="hybrid")
+        self._thread = threading.Thread(target=self._run, name="hybrid-scheduler", daemon=True)
+        self._thread.start()
+
+    def submit(self, texts, deadline=None):
+        """
+        Queue texts for scoring. deadline is a time.monotonic() value; with admission configured,
+        raises admission.Overloaded when the texts cannot be scored before it.
+
+        Returns:
+            Future resolving to a dict of per-text results: model_labels, model_confidences,
+            model_probs, semantic_labels, semantic_scores
+        """
+        texts = list(texts)
+        deadline = math.inf if deadline is None else deadline
+        if self.admission is not None:
+            self.admission.admit(len(texts), deadline)
+        if len(texts) <= self.max_batch_size:
+            future = Future()
+            self._queue.put((texts, future, deadline))
+            return future
+
+        parts = []
+        for start in range(0, len(texts), self.max_batch_size):
+            part = Future()
+            self._queue.put((texts[start:start + self.max_batch_size], part, deadline))
+            parts.append(part)
+        return self._join_parts(parts)
+
+    @staticmethod
+    def _join_parts(parts):
+        """One Future for a split request, resolved once every part is done (first error wins)."""
+        future = Future()
+        lock = threading.Lock()
+
+        def on_done(part):
+            with lock:
+                if future.done():
+                    return
+                if part.cancelled():
+                    future.set_exception(RuntimeError("Request part was cancelled"))
+                    return
+                if part.exception() is not None:
+                    future.set_exception(part.exception())
+                    return
+                if not all(p.done() for p in parts):
+                    return
+                results = [p.result() for p in parts]
+                future.set_result({
+                    key: (np.concatenate([r[key] for r in results]) if isinstance(results[0][key], np.ndarray)
+                          else [value for r in results for value in r[key]])
+                    for key in results[0]
+                })
+
+        def on_cancel(joined):
+            if joined.cancelled():
+                for part in parts:
+                    part.cancel()
+
+        for part in parts:
+            part.add_done_callback(on_done)
+        future.add_done_callback(on_cancel)
+        return future
+
+    def _collect_batch(self):
+        """Block for the first request, then gather more until the batch is full or max_wait passes."""
+        if self._carry is not None:
+            batch, self._carry = [self._carry], None
+        else:
+            batch = [self._queue.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if size + len(item[0]) > self.max_batch_size:
+                # Starts the next batch instead of overflowing this one
+                self._carry = item
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    def _take_batch(self):
+        """Next batch as [(texts, future)], without cancelled requests and those whose deadline passed."""
+        batch = []
+        now = time.monotonic()
+        for texts, future, deadline in self._collect_batch():
+            expired = now >= deadline
+            if self.admission is not None:
+                self.admission.dequeued(len(texts), expired)
+            if not future.set_running_or_notify_cancel():
+                continue
+            if expired:
+                retry_after = self.admission.retry_after() if self.admission is not None else 1
+                future.set_exception(DeadlineExceeded("Request deadline passed while queued", retry_after))
+                continue
+            batch.append((texts, future))
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                continue
+            texts = [text for item_texts, _ in batch for text in item_texts]
+            if self.admission is not None:
+                self.admission.batch_started()
+            started = time.monotonic()
+            try:
+                model_future = self._executor.submit(
+                    self.ensemble.predict_with_model_probs, texts, self.max_length
+                )
+                semantic_future = self._executor.submit(self.semantic_scorer.score_batch, texts)
+                model_labels, model_confidences, model_probs = model_future.result()
+                semantic_labels, semantic_scores = semantic_future.result()
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            finally:
+                if self.admission is not None:
+                    self.admission.batch_finished(time.monotonic() - started)
+
+            model_confidences = np.asarray(model_confidences)
+            start = 0
+            for item_texts, future in batch:
+                end = start + len(item_texts)
+                future.set_result({
+                    "model_labels": list(model_labels[start:end]),
+                    "model_confidences": model_confidences[start:end],
+                    "model_probs": model_probs[start:end],
+                    "semantic_labels": list(semantic_labels[start:end]),
+                    "semantic_scores": semantic_scores[start:end],
+                })
+                start = end
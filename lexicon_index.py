@@ -0,0 +1,265 @@
+"""
+On-disk nearest-neighbour index over the risk lexicon's phrase embeddings.
+
+Each risk level is indexed separately so every query gets per-level top-k similarities. Small levels
+(up to BRUTE_FORCE_MAX phrases) are scanned exhaustively with one matrix multiply. Larger levels are
+partitioned into ~sqrt(n) inverted lists by spherical k-means (IVF); a query only scans the phrases
+of its nprobe closest lists, so cost grows roughly with sqrt(lexicon size) instead of linearly.
+
+Layout of index_dir (one directory per embedding model):
+    meta.json                       level order, sizes, trained sizes
+    <level>-phrases.json            phrase text of every row
+    <level>-vectors.npy             normalized float32 embeddings (memory-mapped on load)
+    <level>-centroids.npy           IVF centroids (absent for brute-force levels)
+    <level>-assign.npy              inverted-list id of every row
+
+sync() brings the index in line with the lexicon JSON: only new phrases are encoded, removed phrases
+are dropped from the stored vectors, and lists are re-trained from stored vectors (no re-encoding)
+once a level has doubled since its last training.
+"""
+import json
+import os
+
+import numpy as np
+
+BRUTE_FORCE_MAX = 4096  # levels up to this many phrases are scanned exhaustively
+DEFAULT_NPROBE = 16
+KMEANS_ITERATIONS = 20
+
+
+def _slug(level):
+    return level.replace(" ", "_")
+
+
+def _save_array(path, array):
+    tmp_path = path + ".tmp.npy"
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+
+
+def _top_k(scores, k):
+    """Row-wise top-k of a 2-D score array, best first; padded with (-inf, -1) when k > n_columns."""
+    n_rows, n_cols = scores.shape
+    top_scores = np.full((n_rows, k), -np.inf, dtype=np.float32)
+    top_ids = np.full((n_rows, k), -1, dtype=np.int64)
+    kk = min(k, n_cols)
+    if kk == 0:
+        return top_scores, top_ids
+    idx = np.argpartition(-scores, kk - 1, axis=1)[:, :kk]
+    part = np.take_along_axis(scores, idx, axis=1)
+    order = np.argsort(-part, axis=1, kind="stable")
+    top_scores[:, :kk] = np.take_along_axis(part, order, axis=1)
+    top_ids[:, :kk] = np.take_along_axis(idx, order, axis=1)
+    return top_scores, top_ids
+
+
+def spherical_kmeans(vectors, n_clusters, iterations=KMEANS_ITERATIONS, seed=42):
+    """k-means on the unit sphere (cosine). Returns (centroids float32, assignment int32)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assign = (vectors @ centroids.T).argmax(axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        empty = np.bincount(assign, minlength=n_clusters) == 0
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()), replace=False)]
+        centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+    assign = (vectors @ centroids.T).argmax(axis=1)
+    return centroids.astype(np.float32), assign.astype(np.int32)
+
+
+class LevelIndex:
+    """Phrase vectors of one risk level, optionally split into IVF lists."""
+    def __init__(self, phrases, vectors, centroids=None, assign=None, trained_size=0):
+        self.phrases = list(phrases)
+        self.vectors = vectors
+        self.centroids = centroids
+        self.assign = assign
+        self.trained_size = trained_size
+        self._build_lists()
+
+    def _build_lists(self):
+        if self.centroids is None:
+            self.list_order = self.list_starts = None
+            return
+        self.list_order = np.argsort(self.assign, kind="stable")
+        counts = np.bincount(self.assign, minlength=len(self.centroids))
+        self.list_starts = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    def __len__(self):
+        return len(self.phrases)
+
+    @property
+    def is_brute_force(self):
+        return self.centroids is None
+
+    def train(self, seed=42):
+        """(Re)partition the stored vectors; levels at or below BRUTE_FORCE_MAX drop their lists."""
+        if len(self) <= BRUTE_FORCE_MAX:
+            self.centroids = self.assign = None
+            self.trained_size = 0
+        else:
+            n_lists = int(np.sqrt(len(self)))
+            self.centroids, self.assign = spherical_kmeans(np.asarray(self.vectors), n_lists, seed=seed)
+            self.trained_size = len(self)
+        self._build_lists()
+
+    def search(self, queries, k=1, nprobe=DEFAULT_NPROBE):
+        """Top-k (similarities, row ids) of normalized queries against this level."""
+        if len(self) == 0:
+            return _top_k(np.zeros((len(queries), 0), dtype=np.float32), k)
+        if self.is_brute_force:
+            return _top_k(queries @ np.asarray(self.vectors).T, k)
+
+        _, probes = _top_k(queries @ self.centroids.T, min(nprobe, len(self.centroids)))
+        top_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        top_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        for i, query in enumerate(queries):
+            candidates = np.concatenate([
+                self.list_order[self.list_starts[l]:self.list_starts[l + 1]] for l in probes[i]
+            ])
+            candidates.sort()  # sequential reads from the memory-mapped vectors
+            scores, idx = _top_k((self.vectors[candidates] @ query)[None, :], k)
+            top_scores[i] = scores[0]
+            top_ids[i] = np.where(idx[0] >= 0, candidates[idx[0]], -1)
+        return top_scores, top_ids
+
+
+class LexiconIndex:
+    def __init__(self, index_dir, levels=None):
+        self.index_dir = index_dir
+        self.levels = levels if levels is not None else {}
+
+    @classmethod
+    def open(cls, index_dir):
+        """Load an index (vectors memory-mapped); an empty index if index_dir has none yet."""
+        meta_path = os.path.join(index_dir, "meta.json")
+        if not os.path.exists(meta_path):
+            return cls(index_dir)
+        with open(meta_path) as f:
+            meta = json.load(f)
+
+        levels = {}
+        for entry in meta["levels"]:
+            prefix = os.path.join(index_dir, _slug(entry["name"]))
+            with open(f"{prefix}-phrases.json", encoding="utf-8") as f:
+                phrases = json.load(f)
+            centroids = assign = None
+            if os.path.exists(f"{prefix}-centroids.npy"):
+                centroids = np.load(f"{prefix}-centroids.npy")
+                assign = np.load(f"{prefix}-assign.npy")
+            levels[entry["name"]] = LevelIndex(
+                phrases, np.load(f"{prefix}-vectors.npy", mmap_mode="r"),
+                centroids, assign, entry.get("trained_size", 0)
+            )
+        return cls(index_dir, levels)
+
+    def save(self):
+        os.makedirs(self.index_dir, exist_ok=True)
+        for name, level in self.levels.items():
+            prefix = os.path.join(self.index_dir, _slug(name))
+            _save_array(f"{prefix}-vectors.npy", np.asarray(level.vectors, dtype=np.float32))
+            if level.is_brute_force:
+                for suffix in ("centroids", "assign"):
+                    if os.path.exists(f"{prefix}-{suffix}.npy"):
+                        os.remove(f"{prefix}-{suffix}.npy")
+            else:
+                _save_array(f"{prefix}-centroids.npy", level.centroids)
+                _save_array(f"{prefix}-assign.npy", level.assign)
+            with open(f"{prefix}-phrases.json.tmp", "w", encoding="utf-8") as f:
+                json.dump(level.phrases, f, ensure_ascii=False)
+            os.replace(f"{prefix}-phrases.json.tmp", f"{prefix}-phrases.json")
+
+        meta_path = os.path.join(self.index_dir, "meta.json")
+        with open(meta_path + ".tmp", "w") as f:
+            json.dump({"levels": [
+                {"name": name, "size": len(level), "trained_size": level.trained_size}
+                for name, level in self.levels.items()
+            ]}, f, indent=2)
+        os.replace(meta_path + ".tmp", meta_path)
+
+        # Files of levels that were removed from the lexicon
+        current = {_slug(name) for name in self.levels}
+        for file_name in os.listdir(self.index_dir):
+            if file_name != "meta.json" and file_name.rsplit("-", 1)[0] not in current:
+                os.remove(os.path.join(self.index_dir, file_name))
+
+    def add(self, level_name, phrases, encode_fn):
+        """
+        Append phrases to one level, encoding only those not already indexed. New rows join their
+        nearest existing list; the level is re-partitioned once it has doubled since training.
+
+        Returns:
+            int: number of phrases added
+        """
+        level = self.levels.get(level_name)
+        if level is None:
+            level = self.levels[level_name] = LevelIndex([], np.zeros((0, 0), dtype=np.float32))
+        known = set(level.phrases)
+        new_phrases = [p for p in dict.fromkeys(phrases) if p not in known]
+        if not new_phrases:
+            return 0
+
+        new_vectors = np.asarray(encode_fn(new_phrases), dtype=np.float32)
+        old_vectors = np.asarray(level.vectors, dtype=np.float32)
+        level.vectors = new_vectors if len(level) == 0 else np.vstack([old_vectors, new_vectors])
+        level.phrases.extend(new_phrases)
+
+        crossed_threshold = level.is_brute_force and len(level) > BRUTE_FORCE_MAX
+        if crossed_threshold or (not level.is_brute_force and len(level) >= 2 * level.trained_size):
+            level.train()
+        elif not level.is_brute_force:
+            level.assign = np.concatenate([
+                level.assign, (new_vectors @ level.centroids.T).argmax(axis=1).astype(np.int32)
+            ])
+            level._build_lists()
+        return len(new_phrases)
+
+    def remove(self, level_name, phrases):
+        """Drop phrases from one level using the stored vectors (no re-encoding). Returns the number removed."""
+        level = self.levels.get(level_name)
+        if level is None:
+            return 0
+        drop = set(phrases)
+        keep = np.array([p not in drop for p in level.phrases], dtype=bool)
+        removed = int((~keep).sum())
+        if removed:
+            level.phrases = [p for p, k in zip(level.phrases, keep) if k]
+            level.vectors = np.asarray(level.vectors)[keep]
+            if level.is_brute_force:
+                level._build_lists()
+            elif len(level) <= BRUTE_FORCE_MAX:
+                level.train()
+            else:
+                level.assign = level.assign[keep]
+                level._build_lists()
+        return removed
+
+    def sync(self, lexicon, encode_fn):
+        """
+        Make the index match a {level: [phrases]} lexicon (level order included).
+
+        Returns:
+            bool: True when anything changed and the index should be saved
+        """
+        changed = list(self.levels) != list(lexicon)
+        for name in [n for n in self.levels if n not in lexicon]:
+            del self.levels[name]
+        for name, phrases in lexicon.items():
+            wanted = set(phrases)
+            stale = [p for p in self.levels[name].phrases if p not in wanted] if name in self.levels else []
+            changed |= self.remove(name, stale) > 0
+            changed |= self.add(name, phrases, encode_fn) > 0
+        self.levels = {name: self.levels[name] for name in lexicon}
+        return changed
+
+    def search(self, queries, k=1, nprobe=DEFAULT_NPROBE):
+        """{level: (similarities (n, k), row ids (n, k))} for normalized query embeddings."""
+        queries = np.asarray(queries, dtype=np.float32)
+        return {name: level.search(queries, k, nprobe) for name, level in self.levels.items()}
+
+    def level_max(self, queries, nprobe=DEFAULT_NPROBE):
+        """(n_queries, n_levels) best similarity per level, in level order."""
+        results = self.search(queries, 1, nprobe)
+        return np.stack([results[name][0][:, 0] for name in self.levels], axis=1)
@@ -0,0 +1,202 @@
+"""
+Location extraction (NER) and per-location risk distributions for the geo analysis.
+
+    python location_extraction.py results.csv --output location_risk.csv --text-column content --risk-column risk
+
+Replaces the notebook's per-row ner_pipeline(text) + data.iterrows() loop:
+  * unique texts are looked up in a disk cache (data/ner_cache.sqlite, keyed by content hash),
+  * cache misses are sorted by length and run through dslim/bert-base-NER in batches,
+  * location -> risk counts are built with explode + groupby instead of Python loops.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+
+import pandas as pd
+
+from batch_io import iter_input_chunks
+
+NER_MODEL_NAME = "dslim/bert-base-NER"
+NER_CACHE_PATH = os.path.join("data", "ner_cache.sqlite")
+RISK_LEVELS = ["high", "moderate", "low", "no risk"]
+
+
+def load_ner_pipeline(model_name=NER_MODEL_NAME, device=None):
+    # Imported here so aggregation helpers work without torch/transformers installed
+    import torch
+    from transformers import pipeline
+
+    if device is None:
+        device = 0 if torch.cuda.is_available() else -1
+    return pipeline("ner", model=model_name, aggregation_strategy="simple", device=device)
+
+
+def content_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def merge_locations(entities):
+    """Consecutive LOC entities joined into one place name (same rule as extract_locations_from_text)."""
+    locations = []
+    current_location = ''
+    for entity in entities:
+        if entity['entity_group'] == 'LOC':
+            current_location = f"{current_location} {entity['word']}" if current_location else entity['word']
+        elif current_location:
+            locations.append(current_location.strip())
+            current_location = ''
+    if current_location:
+        locations.append(current_location.strip())
+    return locations
+
+
+class NERCache:
+    """content hash -> extracted locations, in a small SQLite file. Entries are per NER model."""
+    def __init__(self, path=NER_CACHE_PATH, model_name=NER_MODEL_NAME):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.model_name = model_name
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS ner_locations ("
+            "model TEXT NOT NULL, text_hash TEXT NOT NULL, locations TEXT NOT NULL, "
+            "PRIMARY KEY (model, text_hash))"
+        )
+        self.conn.commit()
+
+    def get_many(self, hashes, query_size=500):
+        found = {}
+        for start in range(0, len(hashes), query_size):
+            part = hashes[start:start + query_size]
+            rows = self.conn.execute(
+                f"SELECT text_hash, locations FROM ner_locations WHERE model = ? "
+                f"AND text_hash IN ({','.join('?' * len(part))})",
+                [self.model_name, *part]
+            )
+            found.update((h, json.loads(locs)) for h, locs in rows)
+        return found
+
+    def put_many(self, items):
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO ner_locations (model, text_hash, locations) VALUES (?, ?, ?)",
+            [(self.model_name, h, json.dumps(locs)) for h, locs in items]
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+def _run_ner(ner, texts, batch_size):
+    """
+    [(index, entities)] for texts, bisecting on failure: a text NER cannot process is reported and
+    left out instead of failing the whole chunk.
+    """
+    try:
+        return list(enumerate(ner(texts, batch_size=batch_size)))
+    except Exception as e:
+        if len(texts) == 1:
+            print(f"NER failed for a text ({len(texts[0])} chars): {e}")
+            return []
+    mid = len(texts) // 2
+    return _run_ner(ner, texts[:mid], batch_size) + [
+        (mid + i, entities) for i, entities in _run_ner(ner, texts[mid:], batch_size)
+    ]
+
+
+def extract_locations_batch(texts, ner, cache=None, batch_size=32, chunk_size=1024):
+    """
+    Locations for every text, in input order. Empty/non-string texts give [].
+
+    Each unique text is processed once; results are written to the cache after every chunk so an
+    interrupted run keeps its progress. When NER fails on a chunk it is bisected down to the texts
+    that fail on their own; those get [] in this run but are not cached, so the next run retries them.
+    """
+    texts = [t if isinstance(t, str) and t.strip() else "" for t in texts]
+    hashes = [content_hash(t) for t in texts]
+    unique = {h: t for h, t in zip(hashes, texts) if t}
+
+    results = cache.get_many(list(unique)) if cache is not None else {}
+    missing = sorted((h for h in unique if h not in results), key=lambda h: len(unique[h]))
+
+    for start in range(0, len(missing), chunk_size):
+        chunk = missing[start:start + chunk_size]
+        outputs = _run_ner(ner, [unique[h] for h in chunk], batch_size)
+        new_items = [(chunk[i], merge_locations(entities)) for i, entities in outputs]
+        results.update(new_items)
+        if cache is not None:
+            cache.put_many(new_items)
+
+    return [results.get(h, []) if t else [] for h, t in zip(hashes, texts)]
+
+
+def add_location_column(data, ner, cache=None, text_column="content", batch_size=32):
+    """Adds the notebook's 'location' column (comma-joined names, None when no location was found)."""
+    locations = extract_locations_batch(data[text_column].tolist(), ner, cache, batch_size)
+    data = data.copy()
+    data["location"] = [", ".join(locs) if locs else None for locs in locations]
+    return data
+
+
+def location_risk_counts(data, location_column="location", risk_column="risk"):
+    """(location x risk level) post counts from comma-joined location strings."""
+    pairs = data[[location_column, risk_column]].dropna()
+    pairs = pairs.assign(**{location_column: pairs[location_column].str.split(", ")}).explode(location_column)
+    pairs = pairs[pairs[location_column].str.len() > 0]
+    return _order_risk_columns(pairs.groupby([location_column, risk_column]).size().unstack(fill_value=0))
+
+
+def _order_risk_columns(counts):
+    columns = [level for level in RISK_LEVELS if level in counts.columns]
+    columns += [c for c in counts.columns if c not in columns]
+    return counts.reindex(columns=columns, fill_value=0)
+
+
+def location_risk_distribution(counts):
+    """Adds total posts, majority risk (first of RISK_LEVELS on ties) and share of each risk level."""
+    result = counts.copy()
+    total = counts.sum(axis=1)
+    result["total"] = total
+    result["majority_risk"] = counts.idxmax(axis=1)
+    for level in counts.columns:
+        result[f"{level}_share"] = (counts[level] / total).round(4)
+    return result.sort_values("total", ascending=False)
+
+
+def run(input_path, output_path, text_column="content", risk_column="risk", chunk_size=20000, batch_size=32):
+    """Extract locations from every row of input_path and write the per-location risk table."""
+    ner = load_ner_pipeline()
+    cache = NERCache()
+    counts = None
+    rows = 0
+    try:
+        for chunk in iter_input_chunks(input_path, chunk_size):
+            chunk = add_location_column(chunk, ner, cache, text_column, batch_size)
+            chunk_counts = location_risk_counts(chunk, risk_column=risk_column)
+            counts = chunk_counts if counts is None else counts.add(chunk_counts, fill_value=0)
+            rows += len(chunk)
+            print(f"✅ {rows:,} posts processed, {len(counts):,} locations so far")
+    finally:
+        cache.close()
+
+    if counts is None or counts.empty:
+        print("No locations found.")
+        return None
+    distribution = location_risk_distribution(_order_risk_columns(counts).astype(int))
+    distribution.to_csv(output_path, index_label="location")
+    print(f"Saved {len(distribution):,} locations to {output_path}")
+    return distribution
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract locations with NER and aggregate risk per location.")
+    parser.add_argument("input", help="CSV, JSONL or Parquet file with text and risk columns")
+    parser.add_argument("--output", default="location_risk.csv")
+    parser.add_argument("--text-column", default="content")
+    parser.add_argument("--risk-column", default="risk")
+    parser.add_argument("--chunk-size", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    run(args.input, args.output, args.text_column, args.risk_column, args.chunk_size, args.batch_size)
@@ -0,0 +1,170 @@
+import argparse
+import json
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import select, delete
+
+from db_models import PostAnalysisLog, get_engine
+
+# Default location of the columnar copy of post_analysis_logs
+ARCHIVE_DIR = os.path.join("data", "log_archive")
+STATE_FILE = "_export_state.json"
+
+LOG_TABLE = PostAnalysisLog.__table__
+
+# Column order and Arrow types of the exported files
+PARQUET_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("analysis_id", pa.string()),
+    ("content", pa.string()),
+    ("risk_level", pa.string()),
+    ("confidence", pa.float64()),
+    ("timestamp", pa.timestamp("us")),
+    ("source", pa.string()),
+    ("model_probs", pa.binary()),
+])
+
+
+def _load_state(out_dir):
+    """Returns the id of the last row already written to Parquet (0 if nothing was exported)."""
+    path = os.path.join(out_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        return int(json.load(f).get("last_id", 0))
+
+
+def _save_state(out_dir, last_id):
+    """Atomically records the export watermark."""
+    path = os.path.join(out_dir, STATE_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"last_id": int(last_id), "updated_at": datetime.now().isoformat()}, f)
+    os.replace(tmp_path, path)
+
+
+def iter_log_chunks(conn, after_id=0, chunk_size=10000, max_id=None):
+    """
+    Yields lists of post_analysis_logs rows ordered by id, chunk_size at a time.
+    Uses keyset pagination (id > last seen id) so every page is an index range scan.
+    """
+    columns = [LOG_TABLE.c[name] for name in PARQUET_SCHEMA.names]
+    last_id = after_id
+    while True:
+        query = select(*columns).where(LOG_TABLE.c.id > last_id)
+        if max_id is not None:
+            query = query.where(LOG_TABLE.c.id <= max_id)
+        rows = conn.execute(query.order_by(LOG_TABLE.c.id).limit(chunk_size)).all()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def _write_partitions(out_dir, rows):
+    """Writes one chunk of rows into date=YYYY-MM-DD partitions. Returns the number of files written."""
+    table = pa.Table.from_arrays(
+        [pa.array(list(col), type=field.type) for col, field in zip(zip(*rows), PARQUET_SCHEMA)],
+        schema=PARQUET_SCHEMA,
+    )
+
+    ts_index = PARQUET_SCHEMA.get_field_index("timestamp")
+    by_date = defaultdict(list)
+    for i, row in enumerate(rows):
+        ts = row[ts_index]
+        by_date[ts.strftime("%Y-%m-%d") if ts is not None else "unknown"].append(i)
+
+    first_id, last_id = rows[0][0], rows[-1][0]
+    for day, indices in by_date.items():
+        partition_dir = os.path.join(out_dir, f"date={day}")
+        os.makedirs(partition_dir, exist_ok=True)
+        # File names are derived from the id range, so a re-run after a crash overwrites instead of duplicating
+        path = os.path.join(partition_dir, f"part-{first_id:012d}-{last_id:012d}.parquet")
+        pq.write_table(table.take(indices), path, compression="zstd")
+    return len(by_date)
+
+
+def export_logs(out_dir=ARCHIVE_DIR, chunk_size=10000):
+    """
+    Incrementally export new post_analysis_logs rows to date-partitioned Parquet files.
+    Only rows with an id above the saved watermark are read; the watermark advances after each chunk.
+
+    Returns:
+        dict: {'rows': rows exported, 'files': files written, 'last_id': new watermark}
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    last_id = _load_state(out_dir)
+    exported_rows = 0
+    files_written = 0
+
+    engine = get_engine()
+    with engine.connect() as conn:
+        # Freeze the upper bound so rows inserted during the export are picked up by the next run
+        max_id = conn.execute(select(LOG_TABLE.c.id).order_by(LOG_TABLE.c.id.desc()).limit(1)).scalar()
+        if max_id is None:
+            return {'rows': 0, 'files': 0, 'last_id': last_id}
+
+        for rows in iter_log_chunks(conn, after_id=last_id, chunk_size=chunk_size, max_id=max_id):
+            files_written += _write_partitions(out_dir, rows)
+            exported_rows += len(rows)
+            last_id = rows[-1][0]
+            _save_state(out_dir, last_id)
+
+    print(f"Exported {exported_rows} rows into {files_written} Parquet files (watermark id={last_id}).")
+    return {'rows': exported_rows, 'files': files_written, 'last_id': last_id}
+
+
+def archive_old_logs(retention_days, out_dir=ARCHIVE_DIR, chunk_size=10000, delete_batch_size=1000):
+    """
+    Apply the retention policy: rows older than retention_days are moved out of the hot table.
+
+    New rows are exported first, then only rows that are both older than the cutoff and at or below
+    the export watermark are deleted, in transactions of at most delete_batch_size rows each.
+
+    Returns:
+        int: number of rows deleted from post_analysis_logs
+    """
+    export_logs(out_dir, chunk_size=chunk_size)
+    watermark = _load_state(out_dir)
+    cutoff = datetime.now() - timedelta(days=retention_days)
+
+    engine = get_engine()
+    deleted = 0
+    last_id = 0
+    while True:
+        # Each batch is its own short transaction so the hot table is never locked for long
+        with engine.begin() as conn:
+            ids = conn.execute(
+                select(LOG_TABLE.c.id)
+                .where(LOG_TABLE.c.id > last_id)
+                .where(LOG_TABLE.c.id <= watermark)
+                .where(LOG_TABLE.c.timestamp < cutoff)
+                .order_by(LOG_TABLE.c.id)
+                .limit(delete_batch_size)
+            ).scalars().all()
+            if not ids:
+                break
+            conn.execute(delete(LOG_TABLE).where(LOG_TABLE.c.id.in_(ids)))
+        deleted += len(ids)
+        last_id = ids[-1]
+
+    print(f"Archived {deleted} rows older than {cutoff:%Y-%m-%d %H:%M}.")
+    return deleted
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export / archive post_analysis_logs to Parquet.")
+    parser.add_argument("command", choices=["export", "archive"])
+    parser.add_argument("--out", default=ARCHIVE_DIR, help="Root directory of the Parquet dataset")
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    parser.add_argument("--retention-days", type=int, default=90, help="Used by 'archive' only")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_logs(args.out, chunk_size=args.chunk_size)
+    else:
+        archive_old_logs(args.retention_days, out_dir=args.out, chunk_size=args.chunk_size)
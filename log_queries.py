@@ -0,0 +1,104 @@
+import base64
+from datetime import datetime
+
+from sqlalchemy import select, and_, or_
+
+from db_models import PostAnalysisLog, get_engine
+
+LOG_TABLE = PostAnalysisLog.__table__
+
+MAX_PAGE_SIZE = 1000
+
+# Columns returned by the read API (model_probs is served by db_utils.load_model_probs instead)
+RESULT_COLUMNS = ["id", "analysis_id", "content", "risk_level", "confidence", "timestamp", "source"]
+
+
+def encode_cursor(timestamp, row_id):
+    """Opaque page cursor for the (timestamp, id) position of the last returned row."""
+    raw = f"{timestamp.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor(). Raises ValueError for malformed cursors."""
+    try:
+        ts_str, id_str = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(ts_str), int(id_str)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def _build_query(start=None, end=None, risk_level=None, source=None, min_confidence=None,
+                 include_content=True):
+    """Base SELECT with all filters applied, newest first."""
+    names = RESULT_COLUMNS if include_content else [c for c in RESULT_COLUMNS if c != "content"]
+    query = select(*[LOG_TABLE.c[name] for name in names]).where(LOG_TABLE.c.timestamp.isnot(None))
+
+    if start is not None:
+        query = query.where(LOG_TABLE.c.timestamp >= start)
+    if end is not None:
+        query = query.where(LOG_TABLE.c.timestamp < end)
+    if risk_level:
+        levels = [risk_level] if isinstance(risk_level, str) else list(risk_level)
+        query = query.where(LOG_TABLE.c.risk_level.in_(levels))
+    if source:
+        query = query.where(LOG_TABLE.c.source == source)
+    if min_confidence is not None:
+        query = query.where(LOG_TABLE.c.confidence >= min_confidence)
+    return query.order_by(LOG_TABLE.c.timestamp.desc(), LOG_TABLE.c.id.desc())
+
+
+def _after_cursor(query, cursor):
+    """Restrict the query to rows strictly after the cursor position in (timestamp DESC, id DESC) order."""
+    ts, row_id = decode_cursor(cursor)
+    return query.where(or_(
+        LOG_TABLE.c.timestamp < ts,
+        and_(LOG_TABLE.c.timestamp == ts, LOG_TABLE.c.id < row_id),
+    ))
+
+
+def query_logs(start=None, end=None, risk_level=None, source=None, min_confidence=None,
+               cursor=None, limit=100, include_content=True):
+    """
+    Fetch one page of PostAnalysisLog entries, newest first.
+
+    Pagination is keyset-based on (timestamp, id): each page seeks directly to the cursor position
+    through ix_post_analysis_logs_timestamp_id, so page N costs the same as page 1.
+
+    Args:
+        start, end (datetime): Optional half-open time range [start, end)
+        risk_level (str | list): One or more risk levels to include
+        source (str): Exact source match (e.g. 'streamlit_web')
+        min_confidence (float): Lower bound on confidence
+        cursor (str): next_cursor from the previous page
+        limit (int): Page size (capped at MAX_PAGE_SIZE)
+
+    Returns:
+        tuple: (items, next_cursor) where next_cursor is None on the last page
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    query = _build_query(start, end, risk_level, source, min_confidence, include_content)
+    if cursor:
+        query = _after_cursor(query, cursor)
+
+    with get_engine().connect() as conn:
+        # Fetch one extra row to know whether another page exists
+        rows = conn.execute(query.limit(limit + 1)).mappings().all()
+
+    has_more = len(rows) > limit
+    items = [dict(row) for row in rows[:limit]]
+    next_cursor = encode_cursor(items[-1]["timestamp"], items[-1]["id"]) if has_more else None
+    return items, next_cursor
+
+
+def iter_logs(page_size=MAX_PAGE_SIZE, **filters):
+    """
+    Stream every matching entry, one page in memory at a time.
+    Accepts the same filters as query_logs().
+    """
+    cursor = None
+    while True:
+        items, cursor = query_logs(cursor=cursor, limit=page_size, **filters)
+        yield from items
+        if cursor is None:
+            return
@@ -0,0 +1,268 @@
+from collections import defaultdict
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, func
+
+from db_models import (
+    PostAnalysisLog, RiskHourlyRollup, RiskConfidenceRollup, get_engine, get_session, upsert_increments
+)
+
+LOG_TABLE = PostAnalysisLog.__table__
+
+WEEKDAY_ORDER = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+# Same buckets as the exploratory analysis in the training notebook
+TIME_OF_DAY_ORDER = ['Morning (5AM–12PM)', 'Afternoon (12PM–5PM)', 'Evening (5PM–9PM)', 'Night (9PM–5AM)']
+
+def get_time_of_day(hour):
+    """Map an hour (0-23) to its index in TIME_OF_DAY_ORDER."""
+    if 5 <= hour < 12:
+        return 0
+    elif 12 <= hour < 17:
+        return 1
+    elif 17 <= hour < 21:
+        return 2
+    else:
+        return 3
+
+HOUR_TO_TIME_OF_DAY = np.array([get_time_of_day(h) for h in range(24)])
+
+DEFAULT_SOURCE = 'streamlit_web'
+
+# Equal-width confidence bins over [0, 1] for RiskConfidenceRollup
+CONFIDENCE_BINS = 20
+
+
+def hour_bucket(ts):
+    """Truncate a datetime to the start of its hour."""
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def day_bucket(ts):
+    """Truncate a datetime to midnight."""
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def confidence_bin(confidence):
+    """Index of the CONFIDENCE_BINS bin a confidence falls into (1.0 goes into the last bin)."""
+    return min(max(int(float(confidence or 0.0) * CONFIDENCE_BINS), 0), CONFIDENCE_BINS - 1)
+
+
+def _aggregate(entries):
+    """
+    Collapse (timestamp, risk_level, source, confidence) tuples into
+    hourly {(hour, risk_level, source): [count, confidence_sum]} and daily {(day, risk_level, source, bin): count}.
+    """
+    buckets = defaultdict(lambda: [0, 0.0])
+    histogram = defaultdict(int)
+    for ts, risk_level, source, confidence in entries:
+        if ts is None:
+            continue
+        source = source or DEFAULT_SOURCE
+        bucket = buckets[(hour_bucket(ts), risk_level, source)]
+        bucket[0] += 1
+        bucket[1] += float(confidence or 0.0)
+        histogram[(day_bucket(ts), risk_level, source, confidence_bin(confidence))] += 1
+    return buckets, histogram
+
+
+def add_to_rollups(session, entries):
+    """
+    Add log entries to the hourly and daily confidence rollups inside the caller's transaction.
+
+    Args:
+        session: SQLAlchemy session that is also inserting the log rows (committed by the caller)
+        entries: iterable of (timestamp, risk_level, source, confidence)
+    """
+    buckets, histogram = _aggregate(entries)
+    # Upserts: two writers opening the same new hour/bin must not fail (and roll back their log rows)
+    upsert_increments(session, RiskHourlyRollup, ['bucket_start', 'risk_level', 'source'], [
+        {'bucket_start': bucket_start, 'risk_level': risk_level, 'source': source,
+         'count': count, 'confidence_sum': confidence_sum}
+        for (bucket_start, risk_level, source), (count, confidence_sum) in buckets.items()
+    ], ['count', 'confidence_sum'])
+    upsert_increments(session, RiskConfidenceRollup, ['day', 'risk_level', 'source', 'confidence_bin'], [
+        {'day': day, 'risk_level': risk_level, 'source': source, 'confidence_bin': bin_index, 'count': count}
+        for (day, risk_level, source, bin_index), count in histogram.items()
+    ], ['count'])
+
+
+def rebuild_rollups(start=None, end=None, chunk_size=10000):
+    """
+    Recompute rollups for the days covering [start, end) from post_analysis_logs (backfill / repair job).
+    The log is read in id-ordered chunks, so memory is bounded by the number of hourly buckets.
+
+    Only rebuild ranges that are still in the hot table: rows already moved out by
+    log_archive.archive_old_logs() would otherwise disappear from the rollups.
+    """
+    # Day-aligned so the hourly and daily tables cover exactly the same rows
+    start = day_bucket(start) if start is not None else None
+    end = day_bucket(end) if end is not None else None
+    columns = [LOG_TABLE.c.id, LOG_TABLE.c.timestamp, LOG_TABLE.c.risk_level, LOG_TABLE.c.source, LOG_TABLE.c.confidence]
+
+    buckets = defaultdict(lambda: [0, 0.0])
+    histogram = defaultdict(int)
+    last_id = 0
+    with get_engine().connect() as conn:
+        while True:
+            query = select(*columns).where(LOG_TABLE.c.id > last_id)
+            if start is not None:
+                query = query.where(LOG_TABLE.c.timestamp >= start)
+            if end is not None:
+                query = query.where(LOG_TABLE.c.timestamp < end)
+            rows = conn.execute(query.order_by(LOG_TABLE.c.id).limit(chunk_size)).all()
+            if not rows:
+                break
+            chunk_buckets, chunk_histogram = _aggregate(row[1:] for row in rows)
+            for key, (count, confidence_sum) in chunk_buckets.items():
+                buckets[key][0] += count
+                buckets[key][1] += confidence_sum
+            for key, count in chunk_histogram.items():
+                histogram[key] += count
+            last_id = rows[-1][0]
+
+    session = get_session()
+    try:
+        stale = session.query(RiskHourlyRollup)
+        if start is not None:
+            stale = stale.filter(RiskHourlyRollup.bucket_start >= start)
+        if end is not None:
+            stale = stale.filter(RiskHourlyRollup.bucket_start < end)
+        stale.delete(synchronize_session=False)
+        stale_days = session.query(RiskConfidenceRollup)
+        if start is not None:
+            stale_days = stale_days.filter(RiskConfidenceRollup.day >= start)
+        if end is not None:
+            stale_days = stale_days.filter(RiskConfidenceRollup.day < end)
+        stale_days.delete(synchronize_session=False)
+        session.add_all(
+            RiskHourlyRollup(bucket_start=b, risk_level=r, source=s, count=c, confidence_sum=cs)
+            for (b, r, s), (c, cs) in buckets.items()
+        )
+        session.add_all(
+            RiskConfidenceRollup(day=d, risk_level=r, source=s, confidence_bin=i, count=c)
+            for (d, r, s, i), c in histogram.items()
+        )
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+    return len(buckets)
+
+
+def _filtered(query, start, end, risk_level, source):
+    if start is not None:
+        query = query.where(RiskHourlyRollup.bucket_start >= start)
+    if end is not None:
+        query = query.where(RiskHourlyRollup.bucket_start < end)
+    if risk_level:
+        levels = [risk_level] if isinstance(risk_level, str) else list(risk_level)
+        query = query.where(RiskHourlyRollup.risk_level.in_(levels))
+    if source:
+        query = query.where(RiskHourlyRollup.source == source)
+    return query
+
+
+def get_hourly_trend(start=None, end=None, risk_level=None, source=None):
+    """
+    Hourly post counts per risk level from the rollups.
+
+    Returns:
+        pd.DataFrame: columns bucket_start, risk_level, count, avg_confidence
+    """
+    query = select(
+        RiskHourlyRollup.bucket_start,
+        RiskHourlyRollup.risk_level,
+        func.sum(RiskHourlyRollup.count).label('count'),
+        func.sum(RiskHourlyRollup.confidence_sum).label('confidence_sum'),
+    ).group_by(RiskHourlyRollup.bucket_start, RiskHourlyRollup.risk_level).order_by(RiskHourlyRollup.bucket_start)
+    query = _filtered(query, start, end, risk_level, source)
+
+    with get_engine().connect() as conn:
+        df = pd.DataFrame(conn.execute(query).all(), columns=['bucket_start', 'risk_level', 'count', 'confidence_sum'])
+
+    df['avg_confidence'] = np.where(df['count'] > 0, df['confidence_sum'] / df['count'].clip(lower=1), 0.0)
+    return df.drop(columns='confidence_sum')
+
+
+def get_weekday_time_of_day_heatmap(start=None, end=None, risk_level=None, source=None):
+    """
+    Weekday x time-of-day post counts (the notebook's heatmap) computed from the rollups.
+    At most one row per hour is fetched; folding into the 7x4 grid is done in NumPy.
+
+    Returns:
+        pd.DataFrame: index WEEKDAY_ORDER, columns TIME_OF_DAY_ORDER
+    """
+    query = select(
+        RiskHourlyRollup.bucket_start, func.sum(RiskHourlyRollup.count)
+    ).group_by(RiskHourlyRollup.bucket_start)
+    query = _filtered(query, start, end, risk_level, source)
+
+    with get_engine().connect() as conn:
+        rows = conn.execute(query).all()
+
+    grid = np.zeros((7, len(TIME_OF_DAY_ORDER)), dtype=np.int64)
+    if rows:
+        buckets = pd.DatetimeIndex([row[0] for row in rows])
+        counts = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows))
+        np.add.at(grid, (buckets.weekday.to_numpy(), HOUR_TO_TIME_OF_DAY[buckets.hour.to_numpy()]), counts)
+
+    return pd.DataFrame(grid, index=WEEKDAY_ORDER, columns=TIME_OF_DAY_ORDER)
+
+
+def get_confidence_histogram(start=None, end=None, risk_level=None, source=None):
+    """
+    Confidence histogram per risk level from the daily rollups.
+    The rollups are per day, so [start, end) is widened to whole days: every day it touches is counted.
+
+    Returns:
+        pd.DataFrame: columns bin_start, bin_end, risk_level, count (empty bins omitted)
+    """
+    query = select(
+        RiskConfidenceRollup.confidence_bin,
+        RiskConfidenceRollup.risk_level,
+        func.sum(RiskConfidenceRollup.count),
+    ).group_by(RiskConfidenceRollup.confidence_bin, RiskConfidenceRollup.risk_level)
+    if start is not None:
+        query = query.where(RiskConfidenceRollup.day >= day_bucket(start))
+    if end is not None:
+        end_day = day_bucket(end)
+        query = query.where(RiskConfidenceRollup.day < (end_day if end_day == end else end_day + timedelta(days=1)))
+    if risk_level:
+        levels = [risk_level] if isinstance(risk_level, str) else list(risk_level)
+        query = query.where(RiskConfidenceRollup.risk_level.in_(levels))
+    if source:
+        query = query.where(RiskConfidenceRollup.source == source)
+
+    with get_engine().connect() as conn:
+        df = pd.DataFrame(conn.execute(query).all(), columns=['confidence_bin', 'risk_level', 'count'])
+
+    df['bin_start'] = df['confidence_bin'] / CONFIDENCE_BINS
+    df['bin_end'] = (df['confidence_bin'] + 1) / CONFIDENCE_BINS
+    return df[['bin_start', 'bin_end', 'risk_level', 'count']].sort_values(['bin_start', 'risk_level'])
+
+
+def get_source_breakdown(start=None, end=None, risk_level=None):
+    """
+    Post counts per (source, risk_level) from the hourly rollups.
+
+    Returns:
+        pd.DataFrame: columns source, risk_level, count, avg_confidence
+    """
+    query = select(
+        RiskHourlyRollup.source,
+        RiskHourlyRollup.risk_level,
+        func.sum(RiskHourlyRollup.count).label('count'),
+        func.sum(RiskHourlyRollup.confidence_sum).label('confidence_sum'),
+    ).group_by(RiskHourlyRollup.source, RiskHourlyRollup.risk_level)
+    query = _filtered(query, start, end, risk_level, None)
+
+    with get_engine().connect() as conn:
+        df = pd.DataFrame(conn.execute(query).all(), columns=['source', 'risk_level', 'count', 'confidence_sum'])
+
+    df['avg_confidence'] = np.where(df['count'] > 0, df['confidence_sum'] / df['count'].clip(lower=1), 0.0)
+    return df.drop(columns='confidence_sum')
@@ -1,5 +1,93 @@
+"""
+Offline batch scoring of historical posts with the ensemble (no HTTP service involved).
+
+    python main.py posts.csv --output scored_posts/ --text-column content
+
+Input may be CSV, JSONL or Parquet and is read in chunks. Each chunk is cleaned in a process pool,
+scored with MentalHealthEnsemble in length-sorted batches and written to its own Parquet part file
+together with the per-model probabilities. A checkpoint file records finished chunks, so re-running
+the same command after an interruption continues with the first unfinished chunk.
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from batch_io import iter_pending_chunks, save_checkpoint, write_part
+from text_preprocessing import clean_text_for_analysis
+
+
+def probability_columns(ensemble):
+    """Output column name for every (model, class) slot of the model_probs array."""
+    return [
+        f"prob_{model}_{ensemble.id2label[class_id].replace(' ', '_')}"
+        for model in ensemble.model_paths
+        for class_id in sorted(ensemble.id2label)
+    ]
+
+
+def score_chunk(ensemble, pool, chunk, text_column, batch_size, max_length):
+    """Cleans and scores one chunk; returns it with risk_level, confidence and prob_* columns added."""
+    raw_texts = chunk[text_column].fillna("").astype(str).tolist()
+    cleaned = list(pool.map(clean_text_for_analysis, raw_texts, chunksize=256))
+
+    risk_labels, confidences, model_probs = ensemble.predict_sorted_batches(
+        cleaned, batch_size=batch_size, max_length=max_length
+    )
+
+    scored = chunk.reset_index(drop=True).assign(risk_level=risk_labels, confidence=confidences)
+    probs = pd.DataFrame(
+        model_probs.reshape(len(chunk), -1).astype(np.float32),
+        columns=probability_columns(ensemble)
+    )
+    return pd.concat([scored, probs], axis=1)
+
+
+def run(input_path, output_dir, text_column="content", chunk_size=10000, batch_size=64,
+        max_length=128, workers=None):
+    """Score input_path into output_dir/part-NNNNNN.parquet, resuming from the checkpoint if present."""
+    # Imported here so `python main.py --help` does not load torch/transformers
+    from model_utils import load_ensemble_models
+
+    ensemble = load_ensemble_models()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for chunk_index, chunk, rows_done in iter_pending_chunks(input_path, output_dir, chunk_size):
+            if text_column not in chunk.columns:
+                raise ValueError(f"Column '{text_column}' not found in input (columns: {list(chunk.columns)})")
+
+            scored = score_chunk(ensemble, pool, chunk, text_column, batch_size, max_length)
+
+            write_part(output_dir, chunk_index, scored)
+
+            rows_done += len(chunk)
+            save_checkpoint(output_dir, input_path, chunk_size, chunk_index + 1, rows_done)
+            print(f"✅ Chunk {chunk_index + 1}: {rows_done:,} posts scored")
+
+    print(f"Finished: all chunks of {input_path} scored into {output_dir}")
+
+
 def main():
-    print("Hello from repl-nix-workspace!")
+    parser = argparse.ArgumentParser(description="Batch-score posts with the mental health risk ensemble.")
+    parser.add_argument("input", help="CSV, JSONL or Parquet file of posts")
+    parser.add_argument("--output", default="scored_posts", help="Output directory for Parquet parts")
+    parser.add_argument("--text-column", default="content")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="Rows read and checkpointed at a time")
+    parser.add_argument("--batch-size", type=int, default=64, help="Texts per model forward pass")
+    parser.add_argument("--max-length", type=int, default=128)
+    parser.add_argument("--workers", type=int, default=None, help="Text-cleaning processes (default: CPU count)")
+    args = parser.parse_args()
+
+    run(
+        args.input,
+        args.output,
+        text_column=args.text_column,
+        chunk_size=args.chunk_size,
+        batch_size=args.batch_size,
+        max_length=args.max_length,
+        workers=args.workers,
+    )
 
 
 if __name__ == "__main__":
@@ -5,6 +5,7 @@ import pandas as pd
 from transformers import AutoModelForSequenceClassification, AutoTokenizer
 # from torch.cuda.amp import autocast 
 from joblib import load 
+from feature_store import get_model_probs, get_valid_meta_features, make_meta_model, valid_rows
 import warnings
 
 # Suppress warnings, useful for a clean deployed application
@@ -86,14 +87,24 @@ class MentalHealthEnsemble:
         return models
 
     def _initialize_validation(self, X_val, y_val):
-        """Initialize validation metrics (implementation removed for brevity)"""
+        """Initialize validation metrics from the cached base-model features (see feature_store)"""
         print("Computing validation metrics...")
-        pass
+        self.val_metrics = {}
+        for name in self.models:
+            probs = np.asarray(get_model_probs(self, name, X_val))
+            self.val_metrics[name] = {
+                'probs': probs,
+                # -1 for texts the model yields NaN for
+                'preds': np.where(valid_rows(probs), np.argmax(np.nan_to_num(probs, nan=-1.0), axis=1), -1)
+            }
 
     def train_meta_model(self, X_train, y_train, X_val=None, y_val=None):
-        """Trains logistic regression meta-model (implementation removed for brevity)"""
-        print("Meta-model training stub - usually run offline.")
-        pass
+        """Trains logistic regression meta-model on cached base-model features (see feature_store)"""
+        print("Training meta-model...")
+        # Texts a base model yields NaN logits for cannot be stacked; fit on the rest
+        meta_X, y_train = get_valid_meta_features(self, X_train, y_train)
+        self.meta_model = make_meta_model()
+        self.meta_model.fit(meta_X, y_train)
 
     def _predict_batch(self, model, tokenizer, texts, max_length):
         """Batch prediction helper, now with NaN/Error protection."""
@@ -120,15 +131,18 @@ class MentalHealthEnsemble:
             
             return torch.nn.functional.softmax(outputs.logits, dim=1).cpu().numpy()
 
-    def predict(self, texts, max_length=128):
+    def _collect_model_probs(self, texts, max_length):
         """
-        Predicts risk levels with confidence scores using the ensemble.
+        Runs every base model over the texts and returns a (n_texts, n_models, n_classes)
+        probability array in LOCAL_MODEL_PATHS order. Skipped models are left as NaN.
         """
-        if isinstance(texts, str):
-            texts = [texts]
+        n_classes = len(self.id2label)
+        model_probs = np.full((len(texts), len(self.model_paths), n_classes), np.nan, dtype=np.float32)
 
-        all_probs = []
-        for name, model_info in self.models.items():
+        for slot, name in enumerate(self.model_paths):
+            model_info = self.models.get(name)
+            if model_info is None:
+                continue
             try:
                 probs = self._predict_batch(model_info["model"], model_info["tokenizer"], texts, max_length)
                 
@@ -136,12 +150,26 @@ class MentalHealthEnsemble:
                 if probs is None:
                     continue 
                 
-                all_probs.append(probs)
+                model_probs[:, slot, :] = probs
                 
             except Exception as e:
                 print(f"⚠️ Skipping {name} due to unexpected error: {str(e)}")
                 continue
 
+        return model_probs
+
+    def predict_with_model_probs(self, texts, max_length=128):
+        """
+        Same as predict(), but always returns lists and additionally the per-model
+        softmax outputs as a (n_texts, n_models, n_classes) array (NaN for skipped models).
+        """
+        if isinstance(texts, str):
+            texts = [texts]
+
+        model_probs = self._collect_model_probs(texts, max_length)
+        available = ~np.isnan(model_probs).any(axis=(0, 2))
+        all_probs = [model_probs[:, slot, :] for slot in np.flatnonzero(available)]
+
         if not all_probs:
             raise RuntimeError("All models failed - cannot make predictions")
 
@@ -158,12 +186,48 @@ class MentalHealthEnsemble:
 
         # Convert to readable labels
         risk_labels = [self.id2label.get(p, "unknown") for p in predictions]
+        return risk_labels, confidences.tolist(), model_probs
+
+    def predict_sorted_batches(self, texts, batch_size=64, max_length=128):
+        """
+        Predicts a large list of texts in batches of similar length, so each batch is padded only to
+        its own longest text instead of the global maximum. Results come back in input order.
+
+        Returns:
+            tuple: (risk_labels list, confidences ndarray, model_probs ndarray (n_texts, n_models, n_classes))
+        """
+        texts = self._ensure_text_format(texts)
+        n = len(texts)
+        order = np.argsort([len(t) for t in texts], kind="stable")
+
+        risk_labels = [None] * n
+        confidences = np.zeros(n, dtype=np.float32)
+        model_probs = np.full((n, len(self.model_paths), len(self.id2label)), np.nan, dtype=np.float32)
+
+        for start in range(0, n, batch_size):
+            idx = order[start:start + batch_size]
+            labels, confs, probs = self.predict_with_model_probs([texts[i] for i in idx], max_length)
+            for i, label in zip(idx, labels):
+                risk_labels[i] = label
+            confidences[idx] = confs
+            model_probs[idx] = probs
+
+        return risk_labels, confidences, model_probs
+
+    def predict(self, texts, max_length=128):
+        """
+        Predicts risk levels with confidence scores using the ensemble.
+        """
+        if isinstance(texts, str):
+            texts = [texts]
+
+        risk_labels, confidences, _ = self.predict_with_model_probs(texts, max_length)
 
         # Ensure single output if input was single string
         if len(risk_labels) == 1 and isinstance(texts, list) and len(texts) == 1:
-             return risk_labels[0], confidences.tolist()[0]
+             return risk_labels[0], confidences[0]
              
-        return risk_labels, confidences.tolist()
+        return risk_labels, confidences
 
 
 # ------------------ LOAD FUNCTION (Required by app.py) ------------------
@@ -0,0 +1,133 @@
+import streamlit as st
+import pandas as pd
+from datetime import datetime, timedelta, time
+
+from db_utils import initialize_database
+from log_rollups import (
+    get_hourly_trend, get_confidence_histogram, get_source_breakdown, get_weekday_time_of_day_heatmap
+)
+
+# Aggregates are recomputed at most this often; new log rows show up after the TTL expires
+DASHBOARD_CACHE_TTL = 60
+
+GRANULARITY = {"Hourly": "h", "Daily": "D", "Weekly": "W-MON"}
+
+st.set_page_config(
+    page_title="Risk Dashboard",
+    page_icon="📊",
+    layout="wide"
+)
+
+
+@st.cache_resource
+def ensure_database():
+    """Create the rollup tables once per process."""
+    return initialize_database()
+
+
+# --- CACHED AGGREGATE LOADERS (all read rollup tables only, never raw log rows) ---
+
+@st.cache_data(ttl=DASHBOARD_CACHE_TTL, show_spinner=False)
+def load_trend(start, end, risk_levels, source, freq):
+    trend = get_hourly_trend(start, end, risk_level=list(risk_levels) or None, source=source)
+    if trend.empty:
+        return trend
+    return (
+        trend.pivot_table(index='bucket_start', columns='risk_level', values='count', aggfunc='sum', fill_value=0)
+        .resample(freq).sum()
+    )
+
+
+@st.cache_data(ttl=DASHBOARD_CACHE_TTL, show_spinner=False)
+def load_confidence_histogram(start, end, risk_levels, source):
+    hist = get_confidence_histogram(start, end, risk_level=list(risk_levels) or None, source=source)
+    if hist.empty:
+        return hist
+    hist['bin'] = hist['bin_start'].map(lambda b: f"{b:.2f}")
+    return hist.pivot_table(index='bin', columns='risk_level', values='count', aggfunc='sum', fill_value=0)
+
+
+@st.cache_data(ttl=DASHBOARD_CACHE_TTL, show_spinner=False)
+def load_source_breakdown(start, end, risk_levels):
+    return get_source_breakdown(start, end, risk_level=list(risk_levels) or None)
+
+
+@st.cache_data(ttl=DASHBOARD_CACHE_TTL, show_spinner=False)
+def load_heatmap(start, end, risk_levels, source):
+    return get_weekday_time_of_day_heatmap(start, end, risk_level=list(risk_levels) or None, source=source)
+
+
+def main():
+    st.title("📊 Historical Risk Dashboard")
+
+    if not ensure_database():
+        st.warning("⚠️ **Database is not available.** Ensure the `DATABASE_URL` environment variable is set.")
+        return
+
+    # Filters
+    col1, col2, col3 = st.columns([2, 1, 1])
+    today = datetime.now().date()
+    with col1:
+        date_range = st.date_input("Date range", value=(today - timedelta(days=30), today))
+    with col2:
+        granularity = st.selectbox("Granularity", list(GRANULARITY), index=1)
+    with col3:
+        if st.button("🔄 Refresh", use_container_width=True):
+            st.cache_data.clear()
+
+    if not isinstance(date_range, (list, tuple)) or len(date_range) != 2:
+        st.info("Select a start and end date.")
+        return
+    start = datetime.combine(date_range[0], time.min)
+    end = datetime.combine(date_range[1] + timedelta(days=1), time.min)
+
+    sources = load_source_breakdown(start, end, ())
+    available_levels = sorted(sources['risk_level'].unique()) if not sources.empty else []
+    available_sources = sorted(sources['source'].unique()) if not sources.empty else []
+
+    col1, col2 = st.columns(2)
+    with col1:
+        # Tuples keep the arguments hashable for st.cache_data
+        risk_levels = tuple(st.multiselect("Risk levels", available_levels))
+    with col2:
+        source = st.selectbox("Source", ["All"] + available_sources)
+    source = None if source == "All" else source
+
+    if sources.empty:
+        st.info("No analyses logged in this date range.")
+        return
+
+    # Risk distribution over time
+    st.subheader("Risk distribution over time")
+    trend = load_trend(start, end, risk_levels, source, GRANULARITY[granularity])
+    if trend.empty:
+        st.info("No data for the selected filters.")
+    else:
+        st.area_chart(trend)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("Confidence histogram")
+        hist = load_confidence_histogram(start, end, risk_levels, source)
+        if hist.empty:
+            st.info("No data for the selected filters.")
+        else:
+            st.bar_chart(hist)
+    with col2:
+        st.subheader("Posts by weekday and time of day")
+        st.dataframe(load_heatmap(start, end, risk_levels, source), use_container_width=True)
+
+    st.subheader("Per-source breakdown")
+    breakdown = load_source_breakdown(start, end, risk_levels)
+    if breakdown.empty:
+        st.info("No data for the selected filters.")
+    else:
+        st.bar_chart(breakdown.pivot_table(index='source', columns='risk_level', values='count', aggfunc='sum', fill_value=0))
+        st.dataframe(
+            breakdown.sort_values(['source', 'count'], ascending=[True, False]),
+            use_container_width=True,
+            hide_index=True
+        )
+
+
+main()
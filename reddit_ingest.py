@@ -0,0 +1,273 @@
+"""
+Incremental Reddit ingestion into append-only Parquet parts.
+
+    python reddit_ingest.py --output reddit_posts/                      # live (asyncpraw, REDDIT_* env vars)
+    python reddit_ingest.py --output reddit_posts/ --fixtures fixtures/ # offline, from recorded JSON
+
+Compared with the notebook's fetch_reddit_posts():
+  * subreddits are fetched concurrently (--concurrency), sharing one requests-per-minute rate limiter,
+  * posts are flushed every --chunk-rows rows to reddit_posts/part-NNNNNN.parquet, so a crash loses at
+    most one unflushed chunk,
+  * a seen-set of post_ids (reddit_posts/_ingest_state.sqlite) is committed together with each part, so
+    reruns never write a post twice; part files left behind by a crash before that commit are removed,
+  * each subreddit keeps a cursor (newest created_utc ingested) and later runs stop paging at it.
+
+Fixture mode reads <fixtures>/<subreddit>.json: a list of post dicts (post_id, timestamp, title,
+content, score, num_comments, url), newest first, as returned by the live listing.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import time
+
+import pandas as pd
+
+# Subreddit distribution used for the training data (posts fetched per subreddit)
+SUBREDDIT_LIMITS = {
+    # High-Risk
+    "SuicideWatch": 500, "selfharm": 500, "BPD": 500, "Psychosis": 500,
+    # Moderate-Risk
+    "depression": 300, "addiction": 300, "BipolarReddit": 300, "ptsd": 300, "cptsd": 300,
+    "Anxiety": 300, "Insecure": 300, "Lonely": 300, "OCD": 300,
+    # Mixed
+    "mentalhealth": 300, "offmychest": 300, "CasualConversation": 300,
+    # Positive/No-Risk
+    "Happiness": 500, "Happy": 500, "KindVoice": 500, "GetMotivated": 500,
+    "DecidingToBeBetter": 500, "MadeMeSmile": 500, "UpliftingNews": 500, "HumansBeingBros": 500,
+}
+
+POST_COLUMNS = ["post_id", "timestamp", "title", "content", "subreddit", "score", "num_comments", "url"]
+STATE_FILE = "_ingest_state.sqlite"  # leading underscore: ignored by pd.read_parquet(output_dir)
+LISTING_PAGE_SIZE = 100              # posts per Reddit listing request
+REQUESTS_PER_MINUTE = 60
+CHUNK_ROWS = 1000
+
+
+class RateLimiter:
+    """Token bucket shared by all fetch tasks: `rate_per_minute` requests, bursts of up to `burst`."""
+    def __init__(self, rate_per_minute=REQUESTS_PER_MINUTE, burst=5):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AsyncPrawClient:
+    """Live Reddit listing via asyncpraw (credentials from REDDIT_CLIENT_ID/SECRET/USER_AGENT)."""
+    def __init__(self):
+        import asyncpraw
+
+        self.reddit = asyncpraw.Reddit(
+            client_id=os.getenv("REDDIT_CLIENT_ID"),
+            client_secret=os.getenv("REDDIT_CLIENT_SECRET"),
+            user_agent=os.getenv("REDDIT_USER_AGENT"),
+        )
+        self.reddit.read_only = True
+
+    async def new_posts(self, subreddit_name, limit):
+        subreddit = await self.reddit.subreddit(subreddit_name)
+        async for post in subreddit.new(limit=limit):
+            yield {
+                "post_id": post.id,
+                "timestamp": post.created_utc,
+                "title": post.title,
+                "content": post.selftext,
+                "score": post.score,
+                "num_comments": post.num_comments,
+                "url": post.url,
+            }
+
+    async def close(self):
+        await self.reddit.close()
+
+
+class FixtureRedditClient:
+    """Offline stand-in: serves recorded listings from <fixture_dir>/<subreddit>.json."""
+    def __init__(self, fixture_dir):
+        self.fixture_dir = fixture_dir
+
+    async def new_posts(self, subreddit_name, limit):
+        path = os.path.join(self.fixture_dir, f"{subreddit_name}.json")
+        if not os.path.exists(path):
+            return
+        with open(path, encoding="utf-8") as f:
+            posts = json.load(f)
+        for post in posts[:limit]:
+            await asyncio.sleep(0)
+            yield post
+
+    async def close(self):
+        pass
+
+
+class IngestState:
+    """Seen post_ids, committed part files and per-subreddit cursors, in one SQLite file."""
+    def __init__(self, output_dir):
+        self.conn = sqlite3.connect(os.path.join(output_dir, STATE_FILE))
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS seen_posts (post_id TEXT PRIMARY KEY);"
+            "CREATE TABLE IF NOT EXISTS parts (seq INTEGER PRIMARY KEY, file_name TEXT NOT NULL, n_rows INTEGER NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS cursors (subreddit TEXT PRIMARY KEY, newest_timestamp REAL NOT NULL);"
+        )
+        self.conn.commit()
+
+    def last_seq(self):
+        return self.conn.execute("SELECT COALESCE(MAX(seq), -1) FROM parts").fetchone()[0]
+
+    def committed_files(self):
+        return {row[0] for row in self.conn.execute("SELECT file_name FROM parts")}
+
+    def unseen(self, post_ids, query_size=500):
+        seen = set()
+        for start in range(0, len(post_ids), query_size):
+            part = post_ids[start:start + query_size]
+            seen.update(row[0] for row in self.conn.execute(
+                f"SELECT post_id FROM seen_posts WHERE post_id IN ({','.join('?' * len(part))})", part
+            ))
+        return [post_id for post_id in post_ids if post_id not in seen]
+
+    def commit_part(self, seq, file_name, post_ids):
+        with self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO seen_posts (post_id) VALUES (?)", [(p,) for p in post_ids])
+            self.conn.execute("INSERT INTO parts (seq, file_name, n_rows) VALUES (?, ?, ?)", (seq, file_name, len(post_ids)))
+
+    def cursor(self, subreddit):
+        row = self.conn.execute("SELECT newest_timestamp FROM cursors WHERE subreddit = ?", (subreddit,)).fetchone()
+        return row[0] if row else None
+
+    def set_cursor(self, subreddit, newest_timestamp):
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO cursors (subreddit, newest_timestamp) VALUES (?, ?) "
+                "ON CONFLICT(subreddit) DO UPDATE SET newest_timestamp = MAX(newest_timestamp, excluded.newest_timestamp)",
+                (subreddit, newest_timestamp)
+            )
+
+    def close(self):
+        self.conn.close()
+
+
+class RedditIngester:
+    def __init__(self, client, output_dir, chunk_rows=CHUNK_ROWS, max_concurrency=4,
+                 requests_per_minute=REQUESTS_PER_MINUTE):
+        os.makedirs(output_dir, exist_ok=True)
+        self.client = client
+        self.output_dir = output_dir
+        self.chunk_rows = chunk_rows
+        self.max_concurrency = max_concurrency
+        self.limiter = RateLimiter(requests_per_minute)
+        self.state = IngestState(output_dir)
+        self.buffer = []
+        self.rows_written = 0
+
+    def _remove_orphan_parts(self):
+        """Delete part files written before a crash but never committed to the state DB."""
+        committed = self.state.committed_files()
+        for name in os.listdir(self.output_dir):
+            if name.startswith("part-") and name not in committed:
+                os.remove(os.path.join(self.output_dir, name))
+                print(f"Removed uncommitted part {name}")
+
+    def _flush(self):
+        if not self.buffer:
+            return
+        chunk = pd.DataFrame(self.buffer, columns=POST_COLUMNS).drop_duplicates("post_id")
+        self.buffer = []
+        new_ids = set(self.state.unseen(chunk["post_id"].tolist()))
+        chunk = chunk[chunk["post_id"].isin(new_ids)]
+        if chunk.empty:
+            return
+
+        seq = self.state.last_seq() + 1
+        file_name = f"part-{seq:06d}.parquet"
+        path = os.path.join(self.output_dir, file_name)
+        chunk.to_parquet(path + ".tmp", index=False)
+        os.replace(path + ".tmp", path)
+        self.state.commit_part(seq, file_name, chunk["post_id"].tolist())
+        self.rows_written += len(chunk)
+        print(f"✅ {file_name}: {len(chunk):,} new posts ({self.rows_written:,} this run)")
+
+    async def _fetch_subreddit(self, semaphore, subreddit, limit):
+        cursor = self.state.cursor(subreddit)
+        newest = None
+        fetched = 0
+        async with semaphore:
+            try:
+                async for post in self.client.new_posts(subreddit, limit):
+                    if fetched % LISTING_PAGE_SIZE == 0:
+                        await self.limiter.acquire()
+                    fetched += 1
+                    # Listings are newest first: everything older than the cursor was ingested before
+                    if cursor is not None and post["timestamp"] < cursor:
+                        break
+                    newest = post["timestamp"] if newest is None else max(newest, post["timestamp"])
+                    self.buffer.append({**post, "subreddit": subreddit})
+                    if len(self.buffer) >= self.chunk_rows:
+                        self._flush()
+            except Exception as e:
+                print(f"❌ Failed fetching r/{subreddit}: {e}")
+                return
+        # Cursor moves only once this subreddit's posts are durably written
+        self._flush()
+        if newest is not None:
+            self.state.set_cursor(subreddit, newest)
+        print(f"r/{subreddit}: {fetched} posts scanned")
+
+    async def run(self, subreddit_limits=SUBREDDIT_LIMITS):
+        """Fetch all subreddits; returns the number of new posts written."""
+        self._remove_orphan_parts()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        try:
+            await asyncio.gather(*(
+                self._fetch_subreddit(semaphore, sub, limit) for sub, limit in subreddit_limits.items()
+            ))
+            self._flush()
+        finally:
+            await self.client.close()
+            self.state.close()
+        return self.rows_written
+
+
+def load_ingested(output_dir):
+    """All ingested posts as one DataFrame (replaces reading reddit_mental_health_posts.csv)."""
+    return pd.read_parquet(output_dir)
+
+
+def parse_subreddits(values):
+    """['depression=300', 'Anxiety'] -> {'depression': 300, 'Anxiety': 300}."""
+    limits = {}
+    for value in values:
+        name, _, limit = value.partition("=")
+        limits[name] = int(limit) if limit else 300
+    return limits
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incrementally ingest subreddit posts into Parquet parts.")
+    parser.add_argument("--output", default="reddit_posts")
+    parser.add_argument("--fixtures", default=None, help="Directory of recorded <subreddit>.json listings (offline)")
+    parser.add_argument("--subreddits", nargs="+", default=None, help="name=limit pairs (default: training set)")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--requests-per-minute", type=int, default=REQUESTS_PER_MINUTE)
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+
+    client = FixtureRedditClient(args.fixtures) if args.fixtures else AsyncPrawClient()
+    ingester = RedditIngester(client, args.output, args.chunk_rows, args.concurrency, args.requests_per_minute)
+    limits = parse_subreddits(args.subreddits) if args.subreddits else SUBREDDIT_LIMITS
+    written = asyncio.run(ingester.run(limits))
+    print(f"Finished: {written:,} new posts written to {args.output}")
@@ -0,0 +1,126 @@
+"""
+Consistent-hash routing of model API requests across several api_server replicas.
+
+    MODEL_API_REPLICAS=http://10.0.0.5:5001,http://10.0.0.6:5001 streamlit run app.py
+
+Each api_server keeps its own LRU of recent results (RESULT_CACHE_SIZE). With round-robin every replica
+ends up caching the same popular posts. Here the post text is hashed onto a ring instead, so repeats
+of a post go to the replica that already holds its result, and total cache capacity grows with the
+number of replicas.
+
+  * Each replica owns VIRTUAL_NODES points on the ring. Adding or removing a replica remaps only ~1/n keys.
+  * A background thread polls <replica>/health. A failed request also marks its replica down until the
+    next successful check, so its keys move to the ring successor.
+  * Bounded load: a replica is passed over while its in-flight requests are at or above
+    LOAD_FACTOR x the average. A hot post or a slow replica then spills to the next replica instead of
+    queueing behind it.
+"""
+import bisect
+import hashlib
+import math
+import threading
+
+import requests
+
+VIRTUAL_NODES = 100
+LOAD_FACTOR = 1.25
+HEALTH_CHECK_INTERVAL = 5  # seconds
+HEALTH_CHECK_TIMEOUT = 1.0
+HEALTH_PATH = "/health"
+
+
+def routing_key(text):
+    """
+    Key hashed onto the ring: the exact text api_server's ResultCache is keyed on. The base models are
+    cased, so copies differing in case or spacing are different inputs and are not merged here.
+    """
+    return str(text)
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.sha1(value.encode("utf-8")).digest()[:8], "big")
+
+
+class ConsistentHashRing:
+    def __init__(self, nodes, virtual_nodes=VIRTUAL_NODES):
+        self.nodes = list(dict.fromkeys(nodes))
+        points = sorted((_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(virtual_nodes))
+        self._hashes = [h for h, _ in points]
+        self._owners = [node for _, node in points]
+
+    def successors(self, key):
+        """Every node once, in ring order starting from the owner of key."""
+        start = bisect.bisect(self._hashes, _hash(key))
+        order = []
+        for i in range(len(self._owners)):
+            node = self._owners[(start + i) % len(self._owners)]
+            if node not in order:
+                order.append(node)
+                if len(order) == len(self.nodes):
+                    break
+        return order
+
+
+class ReplicaPool:
+    """Thread-safe replica choice: ring order, skipping unhealthy and overloaded replicas."""
+    def __init__(self, base_urls, session=None, load_factor=LOAD_FACTOR, check_interval=HEALTH_CHECK_INTERVAL):
+        self.ring = ConsistentHashRing([url.rstrip("/") for url in base_urls])
+        self.load_factor = load_factor
+        self.check_interval = check_interval
+        self.session = session or requests.Session()
+        self.healthy = {url: True for url in self.ring.nodes}
+        self.in_flight = {url: 0 for url in self.ring.nodes}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._checker = None
+
+    def start_health_checks(self):
+        if self._checker is None:
+            self._checker = threading.Thread(target=self._health_loop, daemon=True)
+            self._checker.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _health_loop(self):
+        while not self._stopped.wait(self.check_interval):
+            self.check_health()
+
+    def check_health(self):
+        for url in self.ring.nodes:
+            try:
+                ok = self.session.get(url + HEALTH_PATH, timeout=HEALTH_CHECK_TIMEOUT).status_code == 200
+            except requests.exceptions.RequestException:
+                ok = False
+            with self._lock:
+                if self.healthy[url] != ok:
+                    print(f"{'✅' if ok else '⚠️'} Model replica {url} is {'healthy' if ok else 'down'}")
+                self.healthy[url] = ok
+
+    def _candidates(self, key):
+        order = self.ring.successors(key)
+        # With every replica marked down, still try them in ring order rather than failing outright
+        return [url for url in order if self.healthy[url]] or order
+
+    def owner(self, key):
+        """Healthy replica that owns key, ignoring load (used to group batch requests)."""
+        with self._lock:
+            return self._candidates(key)[0]
+
+    def acquire(self, key):
+        """Replica to send key to; the caller must release() it when the request finishes."""
+        with self._lock:
+            candidates = self._candidates(key)
+            healthy_load = sum(self.in_flight[url] for url in candidates)
+            bound = math.ceil(self.load_factor * (healthy_load + 1) / len(candidates))
+            chosen = next((url for url in candidates if self.in_flight[url] < bound), candidates[0])
+            self.in_flight[chosen] += 1
+            return chosen
+
+    def release(self, url, failed=False):
+        with self._lock:
+            self.in_flight[url] -= 1
+            if failed:
+                if self.healthy[url]:
+                    print(f"⚠️ Model replica {url} is down")
+                self.healthy[url] = False
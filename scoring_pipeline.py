@@ -0,0 +1,386 @@
+"""
+Long-running ingest -> clean -> score -> log pipeline.
+
+    python scoring_pipeline.py reddit_posts/ --follow --clean-processes 4 --score-batch-size 64
+
+Stages run in their own threads and are connected by bounded queues:
+
+    source --q--> clean (clean_text_for_analysis) --q--> score (MentalHealthEnsemble) --q--> write (log_post_analyses)
+
+Each stage takes items in batches (batch_size / max_wait) and has its own worker count. A put into a
+full queue blocks, so a slow database stalls scoring, then cleaning, then the source, instead of letting
+memory grow. Per-stage counters (items, batches, busy time, errors) and queue depths are printed every
+--metrics-interval seconds.
+
+The default source follows the Parquet parts written by reddit_ingest.py. A part is recorded as done
+in the state file only after all of its rows were logged, so a restart resumes at the first part that
+was not completely written. Rows that hit a stage failure (model or database error) are not
+acknowledged, so their part stays pending and is re-read on restart. Each row is logged under an
+analysis_id derived from its post_id (deduplicated globally by reddit_ingest.py), or from (part name,
+row) when a row has none, so rows of a re-read part that were already logged are skipped rather than
+duplicated, wherever the parts directory is mounted.
+"""
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from db_utils import initialize_database, log_post_analyses
+from text_preprocessing import clean_text_for_analysis
+
+STOP = object()  # end-of-stream marker passed down the queues
+PIPELINE_STATE_PATH = os.path.join("data", "pipeline_state.json")
+WRITE_MAX_RETRIES = 8
+WRITE_BACKOFF_MAX = 30.0
+
+
+class StageMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+        self.items_in = 0
+        self.items_out = 0
+        self.batches = 0
+        self.busy_seconds = 0.0
+        self.errors = 0
+
+    def record(self, n_in, n_out, seconds, errors=0):
+        with self._lock:
+            self.items_in += n_in
+            self.items_out += n_out
+            self.batches += 1
+            self.busy_seconds += seconds
+            self.errors += errors
+
+    def snapshot(self, workers):
+        with self._lock:
+            elapsed = max(time.monotonic() - self.started, 1e-9)
+            return {
+                "items_in": self.items_in,
+                "items_out": self.items_out,
+                "batches": self.batches,
+                "errors": self.errors,
+                "items_per_sec": round(self.items_out / elapsed, 2),
+                # Fraction of the stage's worker time spent inside fn (1.0 = bottleneck)
+                "utilization": round(self.busy_seconds / (elapsed * workers), 3),
+            }
+
+
+class Stage:
+    """
+    Worker threads that read batches from input_queue, apply fn(batch) -> list of items and put the
+    results on output_queue. STOP is forwarded downstream once every worker has finished.
+    """
+    def __init__(self, name, fn, input_queue, output_queue=None, workers=1, batch_size=1, max_wait=0.05):
+        self.name = name
+        self.fn = fn
+        self.input_queue = input_queue
+        self.output_queue = output_queue
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.metrics = StageMetrics()
+        self._threads = []
+        self._alive = workers
+        self._alive_lock = threading.Lock()
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"{self.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+
+    def _next_batch(self):
+        """Returns (batch, stopped). Blocks for the first item, then waits at most max_wait for more."""
+        first = self.input_queue.get()
+        if first is STOP:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self.input_queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _work(self):
+        while True:
+            batch, stopped = self._next_batch()
+            if batch:
+                start = time.monotonic()
+                try:
+                    results = self.fn(batch)
+                    # Only count errors raised by this stage, not ones passed down from upstream
+                    errors = max(0, sum(1 for item in results if item.get("error"))
+                                 - sum(1 for item in batch if item.get("error")))
+                except Exception as e:
+                    print(f"❌ Stage {self.name} failed on a batch of {len(batch)}: {e}")
+                    # Not the items' fault (OOM, device or database error): retry them on restart
+                    results = [dict(item, error=str(e), retryable=True) for item in batch]
+                    errors = len(batch)
+                self.metrics.record(len(batch), len(results), time.monotonic() - start, errors)
+                if self.output_queue is not None:
+                    for item in results:
+                        self.output_queue.put(item)  # blocks when downstream is full
+            if stopped:
+                # Let sibling workers see STOP too; the last one out forwards it downstream
+                self.input_queue.put(STOP)
+                with self._alive_lock:
+                    self._alive -= 1
+                    last = self._alive == 0
+                if last and self.output_queue is not None:
+                    self.output_queue.put(STOP)
+                return
+
+
+def analysis_id(post, part_name, row):
+    """Stable log id for a post: from its post_id, else from its position in the part."""
+    post_id = post.get("post_id")
+    key = f"post:{post_id}" if isinstance(post_id, str) and post_id else f"part:{part_name}#{row}"
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, key))
+
+
+class IterableSource:
+    """Wraps any iterable of post dicts ({'content': ...}); nothing to acknowledge."""
+    def __init__(self, posts):
+        self.posts = posts
+
+    def follow(self, stop_event):
+        for post in self.posts:
+            if stop_event.is_set():
+                return
+            yield post
+
+    def ack(self, items):
+        pass
+
+
+class ParquetPartsSource:
+    """Posts from part-*.parquet files in a directory (reddit_ingest.py output), part by part."""
+    def __init__(self, parts_dir, state_path=PIPELINE_STATE_PATH, follow=False, poll_seconds=10.0,
+                 text_column="content"):
+        self.parts_dir = parts_dir
+        self.state_path = state_path
+        self.keep_following = follow
+        self.poll_seconds = poll_seconds
+        self.text_column = text_column
+        self.done = set()
+        if os.path.exists(state_path):
+            with open(state_path) as f:
+                self.done = set(json.load(f).get("done_parts", []))
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def _save_state(self):
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"parts_dir": os.path.abspath(self.parts_dir), "done_parts": sorted(self.done)}, f)
+        os.replace(tmp_path, self.state_path)
+
+    def follow(self, stop_event):
+        emitted = set()
+        while not stop_event.is_set():
+            parts = sorted(
+                name for name in os.listdir(self.parts_dir)
+                if name.startswith("part-") and name.endswith(".parquet")
+                and name not in self.done and name not in emitted
+            )
+            for name in parts:
+                chunk = pd.read_parquet(os.path.join(self.parts_dir, name))
+                emitted.add(name)
+                if chunk.empty:
+                    with self._lock:
+                        self.done.add(name)
+                        self._save_state()
+                    continue
+                with self._lock:
+                    self._pending[name] = len(chunk)
+                for row, post in enumerate(chunk.to_dict("records")):
+                    if stop_event.is_set():
+                        return
+                    post["content"] = post.get(self.text_column) or ""
+                    post["_part"] = name
+                    # Idempotency key for log_post_analyses: replaying the part never logs a row twice
+                    post["analysis_id"] = analysis_id(post, name, row)
+                    yield post
+            if not self.keep_following:
+                return
+            stop_event.wait(self.poll_seconds)
+
+    def ack(self, items):
+        """Called after items were logged; marks parts whose rows are all written as done."""
+        with self._lock:
+            finished = False
+            for item in items:
+                name = item.get("_part")
+                if name not in self._pending:
+                    continue
+                self._pending[name] -= 1
+                if self._pending[name] == 0:
+                    del self._pending[name]
+                    self.done.add(name)
+                    finished = True
+            if finished:
+                self._save_state()
+
+
+class ScoringPipeline:
+    def __init__(self, source, ensemble, queue_size=1000, clean_workers=2, clean_processes=None,
+                 score_workers=1, score_batch_size=64, write_batch_size=500, max_length=128,
+                 source_tag="pipeline"):
+        self.source = source
+        self.ensemble = ensemble
+        self.max_length = max_length
+        self.source_tag = source_tag
+        self.stop_event = threading.Event()
+        self.clean_pool = ProcessPoolExecutor(clean_processes) if clean_processes else None
+
+        self.queues = {name: queue.Queue(maxsize=queue_size) for name in ("clean", "score", "write")}
+        self.stages = [
+            Stage("clean", self._clean, self.queues["clean"], self.queues["score"],
+                  workers=clean_workers, batch_size=256),
+            Stage("score", self._score, self.queues["score"], self.queues["write"],
+                  workers=score_workers, batch_size=score_batch_size),
+            Stage("write", self._write, self.queues["write"], None,
+                  workers=1, batch_size=write_batch_size, max_wait=0.5),
+        ]
+        self.source_metrics = StageMetrics()
+
+    def _clean(self, batch):
+        texts = [str(item.get("content") or "") for item in batch]
+        if self.clean_pool is not None:
+            cleaned = list(self.clean_pool.map(clean_text_for_analysis, texts, chunksize=32))
+        else:
+            cleaned = [clean_text_for_analysis(text) for text in texts]
+        return [dict(item, cleaned=text) for item, text in zip(batch, cleaned)]
+
+    def _score(self, batch):
+        ok = [item for item in batch if not item.get("error")]
+        if not ok:
+            return batch
+        risk_labels, confidences, model_probs = self.ensemble.predict_with_model_probs(
+            [item["cleaned"] for item in ok], self.max_length
+        )
+        scored = [
+            dict(item, risk_level=label.replace(' ', '').lower(), confidence=float(conf), model_probs=probs)
+            for item, label, conf, probs in zip(ok, risk_labels, confidences, model_probs)
+        ]
+        return scored + [item for item in batch if item.get("error")]
+
+    def _write(self, batch):
+        entries = [item for item in batch if not item.get("error")]
+        # Items with a permanent per-item error are acknowledged so one bad post cannot block its part
+        # forever; retryable (stage-level) failures are not, so a restart re-reads them
+        settled = entries + [item for item in batch if item.get("error") and not item.get("retryable")]
+        backoff = 0.5
+        for attempt in range(WRITE_MAX_RETRIES + 1):
+            if not entries or log_post_analyses(entries, source=self.source_tag):
+                self.source.ack(settled)
+                return batch
+            if attempt < WRITE_MAX_RETRIES:
+                # Holding the batch here is what pushes back on the upstream stages
+                time.sleep(backoff)
+                backoff = min(backoff * 2, WRITE_BACKOFF_MAX)
+        print(f"❌ Giving up on {len(entries)} rows after {WRITE_MAX_RETRIES} retries; they will be re-read on restart.")
+        return [dict(item, error="write failed") for item in batch]
+
+    def metrics(self):
+        # For the source, "utilization" is the share of time spent blocked on a full clean queue
+        snapshot = {"source": self.source_metrics.snapshot(1)}
+        for stage in self.stages:
+            snapshot[stage.name] = stage.metrics.snapshot(stage.workers)
+            snapshot[stage.name]["queue_depth"] = stage.input_queue.qsize()
+        return snapshot
+
+    def _report(self, interval):
+        while not self.stop_event.wait(interval):
+            print(format_metrics(self.metrics()))
+
+    def run(self, metrics_interval=30.0):
+        """Run until the source is exhausted (or Ctrl+C), then drain the queues."""
+        for stage in self.stages:
+            stage.start()
+        reporter = threading.Thread(target=self._report, args=(metrics_interval,), daemon=True)
+        reporter.start()
+
+        try:
+            for post in self.source.follow(self.stop_event):
+                start = time.monotonic()
+                self.queues["clean"].put(post)  # blocks when the pipeline is full
+                self.source_metrics.record(1, 1, time.monotonic() - start)
+        except KeyboardInterrupt:
+            print("Stopping: draining queued posts...")
+        finally:
+            self.stop_event.set()
+            self.queues["clean"].put(STOP)
+            for stage in self.stages:
+                stage.join()
+            if self.clean_pool is not None:
+                self.clean_pool.shutdown()
+
+        final = self.metrics()
+        print(format_metrics(final))
+        return final
+
+
+def format_metrics(metrics):
+    lines = ["Pipeline metrics:"]
+    for name, m in metrics.items():
+        depth = f", queue {m['queue_depth']}" if "queue_depth" in m else ""
+        lines.append(
+            f"  {name:<6} {m['items_out']:>9,} items ({m['items_per_sec']:,}/s), "
+            f"util {m['utilization']:.0%}, errors {m['errors']:,}{depth}"
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream posts through clean -> score -> audit log.")
+    parser.add_argument("parts_dir", help="Directory of part-*.parquet files (e.g. reddit_ingest.py output)")
+    parser.add_argument("--follow", action="store_true", help="Keep polling for new parts")
+    parser.add_argument("--poll-seconds", type=float, default=10.0)
+    parser.add_argument("--state", default=PIPELINE_STATE_PATH)
+    parser.add_argument("--text-column", default="content")
+    parser.add_argument("--queue-size", type=int, default=1000)
+    parser.add_argument("--clean-workers", type=int, default=2)
+    parser.add_argument("--clean-processes", type=int, default=None, help="Process pool for text cleaning (default: in-thread)")
+    parser.add_argument("--score-workers", type=int, default=1)
+    parser.add_argument("--score-batch-size", type=int, default=64)
+    parser.add_argument("--write-batch-size", type=int, default=500)
+    parser.add_argument("--metrics-interval", type=float, default=30.0)
+    args = parser.parse_args()
+
+    if not initialize_database():
+        raise SystemExit("Database initialization failed.")
+    # Imported here so `python scoring_pipeline.py --help` does not load torch/transformers
+    from model_utils import load_ensemble_models
+
+    pipeline = ScoringPipeline(
+        ParquetPartsSource(args.parts_dir, args.state, args.follow, args.poll_seconds, args.text_column),
+        load_ensemble_models(),
+        queue_size=args.queue_size,
+        clean_workers=args.clean_workers,
+        clean_processes=args.clean_processes,
+        score_workers=args.score_workers,
+        score_batch_size=args.score_batch_size,
+        write_batch_size=args.write_batch_size,
+    )
+    pipeline.run(args.metrics_interval)
@@ -0,0 +1,112 @@
+"""
+Semantic risk scoring against the curated risk lexicon (risk_lexicon.json).
+
+Productionized get_semantic_risk() from the training notebook: a text's semantic risk is the lexicon
+level holding the phrase most similar to it (cosine similarity of all-MiniLM-L6-v2 embeddings).
+
+Phrase embeddings live in a LexiconIndex under data/lexicon_index/<model>/ (memory-mapped, brute
+force for small levels, inverted lists for large ones). On startup the index is synced with the JSON
+file, so only phrases added since the last run are encoded. Scoring a batch is one encode call plus
+one best-match lookup per level.
+"""
+import json
+import os
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+from lexicon_index import DEFAULT_NPROBE, LexiconIndex
+
+EMBED_MODEL_NAME = "all-MiniLM-L6-v2"
+LEXICON_PATH = "risk_lexicon.json"
+LEXICON_INDEX_DIR = os.path.join("data", "lexicon_index")
+
+
+def load_lexicon(path=LEXICON_PATH):
+    """{risk level: [phrases]} with duplicates and empty levels removed (level order kept)."""
+    with open(path, encoding="utf-8") as f:
+        lexicon = json.load(f)
+    cleaned = {}
+    for level, phrases in lexicon.items():
+        unique = list(dict.fromkeys(p.strip() for p in phrases if p and p.strip()))
+        if unique:
+            cleaned[level] = unique
+    return cleaned
+
+
+class SemanticRiskScorer:
+    def __init__(self, model_name=EMBED_MODEL_NAME, lexicon_path=LEXICON_PATH,
+                 index_dir=LEXICON_INDEX_DIR, device=None, nprobe=DEFAULT_NPROBE):
+        self.model_name = model_name
+        self.lexicon_path = lexicon_path
+        self.nprobe = nprobe
+        self.embed_model = SentenceTransformer(model_name, device=device)
+        self.lexicon = load_lexicon(lexicon_path)
+
+        self.index = LexiconIndex.open(os.path.join(index_dir, model_name.replace("/", "_")))
+        if self.index.sync(self.lexicon, self.encode):
+            self.index.save()
+        self.levels = list(self.index.levels)
+        self.level_array = np.array(self.levels, dtype=object)
+
+    def encode(self, texts, batch_size=64):
+        """Normalized (n_texts, dim) float32 text embeddings."""
+        return self.embed_model.encode(
+            texts, batch_size=batch_size, normalize_embeddings=True, convert_to_numpy=True
+        ).astype(np.float32, copy=False)
+
+    def level_similarities(self, text_embeddings):
+        """(n_texts, n_levels) best cosine similarity per level for already-normalized embeddings."""
+        return self.index.level_max(text_embeddings, self.nprobe)
+
+    def score_batch(self, texts, batch_size=64):
+        """
+        Semantic risk for many texts at once.
+
+        Returns:
+            tuple: (risk levels list, similarity scores float32 ndarray)
+        """
+        texts = ["" if t is None else str(t) for t in texts]
+        if not texts:
+            return [], np.zeros(0, dtype=np.float32)
+        level_sims = self.level_similarities(self.encode(texts, batch_size))
+        best = level_sims.argmax(axis=1)
+        return self.level_array[best].tolist(), level_sims[np.arange(len(texts)), best]
+
+    def score(self, text):
+        """Same return value as the notebook's get_semantic_risk(): (risk level, similarity)."""
+        labels, scores = self.score_batch([text])
+        return labels[0], float(scores[0])
+
+    def top_matches(self, texts, k=5):
+        """Per text, {level: [(phrase, similarity), ...]} with the k closest phrases of every level."""
+        results = self.index.search(self.encode(list(texts)), k, self.nprobe)
+        matches = [{} for _ in texts]
+        for level, (scores, ids) in results.items():
+            phrases = self.index.levels[level].phrases
+            for i in range(len(matches)):
+                matches[i][level] = [(phrases[j], float(s)) for s, j in zip(scores[i], ids[i]) if j >= 0]
+        return matches
+
+    def add_phrases(self, level, phrases):
+        """Add curated phrases: encodes only the new ones, updates the index and the lexicon JSON."""
+        phrases = [p.strip() for p in phrases if p and p.strip()]
+        added = self.index.add(level, phrases, self.encode)
+        if added:
+            self.index.save()
+            known = set(self.lexicon.get(level, []))
+            self.lexicon.setdefault(level, []).extend(p for p in dict.fromkeys(phrases) if p not in known)
+            tmp_path = self.lexicon_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.lexicon, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.lexicon_path)
+            self.levels = list(self.index.levels)
+            self.level_array = np.array(self.levels, dtype=object)
+        return added
+
+
+def load_semantic_scorer(device=None):
+    """Load the embedding model and the (cached) lexicon matrix for inference."""
+    scorer = SemanticRiskScorer(device=device)
+    print(f"✅ Semantic scorer ready ({sum(len(l) for l in scorer.index.levels.values()):,} lexicon phrases, {len(scorer.levels)} levels)")
+    return scorer
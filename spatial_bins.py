@@ -0,0 +1,193 @@
+"""
+Spatial binning of geocoded risk data for the location heatmap.
+
+    python spatial_bins.py map_risk_data.csv --output location_risk_heatmap.html --precisions 2 3 4
+
+The notebook's create_heatmap_with_risk() / MarkerCluster map adds one folium marker per location, so
+render time and HTML size grow with the data. Here points are first binned into geohash cells
+(computed in NumPy, no per-point Python) with per-cell risk counts and a mean risk intensity, for
+several precisions (zoom levels) at once. The map renders only cells: at most 32**precision of them,
+however many posts or locations there are.
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+RISK_LEVELS = ["high", "moderate", "low", "no risk"]
+# Same weights as the notebook's heatmap
+RISK_INTENSITY = {"high": 1.0, "moderate": 0.66, "low": 0.33, "no risk": 0.1}
+RISK_COLORS = {"high": "red", "moderate": "orange", "low": "yellow", "no risk": "green"}
+GEOHASH_BASE32 = np.array(list("0123456789bcdefghjkmnpqrstuvwxyz"))
+DEFAULT_PRECISIONS = (2, 3, 4)
+AGGREGATE_DIR = os.path.join("data", "heatmap")
+
+# Folium zoom level at which each geohash precision is a sensible cell size
+PRECISION_ZOOM = {1: 1, 2: 3, 3: 5, 4: 8, 5: 10, 6: 13}
+
+
+def _bits(precision):
+    """(longitude bits, latitude bits) of a geohash with this many characters."""
+    total = 5 * precision
+    return (total + 1) // 2, total // 2
+
+
+def geohash_codes(lat, lon, precision):
+    """Integer geohash (interleaved lon/lat bits, lon first) of every point, vectorized. precision <= 12."""
+    lon_bits, lat_bits = _bits(precision)
+    lon_idx = np.clip(((np.asarray(lon, dtype=np.float64) + 180.0) / 360.0 * (1 << lon_bits)).astype(np.int64),
+                      0, (1 << lon_bits) - 1)
+    lat_idx = np.clip(((np.asarray(lat, dtype=np.float64) + 90.0) / 180.0 * (1 << lat_bits)).astype(np.int64),
+                      0, (1 << lat_bits) - 1)
+
+    codes = np.zeros(len(lon_idx), dtype=np.int64)
+    for i in range(5 * precision):
+        # Even positions (from the most significant bit) take longitude bits, odd ones latitude bits
+        if i % 2 == 0:
+            bit = (lon_idx >> (lon_bits - 1 - i // 2)) & 1
+        else:
+            bit = (lat_idx >> (lat_bits - 1 - i // 2)) & 1
+        codes = (codes << 1) | bit
+    return codes
+
+
+def geohash_strings(codes, precision):
+    """Base32 geohash strings for integer codes."""
+    chars = np.empty((len(codes), precision), dtype="<U1")
+    for pos in range(precision):
+        shift = 5 * (precision - 1 - pos)
+        chars[:, pos] = GEOHASH_BASE32[(codes >> shift) & 31]
+    return np.array(["".join(row) for row in chars], dtype=object)
+
+
+def geohash_centers(codes, precision):
+    """(lat, lon) of each cell's center."""
+    lon_bits, lat_bits = _bits(precision)
+    lon_idx = np.zeros(len(codes), dtype=np.int64)
+    lat_idx = np.zeros(len(codes), dtype=np.int64)
+    total = 5 * precision
+    for i in range(total):
+        bit = (codes >> (total - 1 - i)) & 1
+        if i % 2 == 0:
+            lon_idx = (lon_idx << 1) | bit
+        else:
+            lat_idx = (lat_idx << 1) | bit
+    lat = (lat_idx + 0.5) / (1 << lat_bits) * 180.0 - 90.0
+    lon = (lon_idx + 0.5) / (1 << lon_bits) * 360.0 - 180.0
+    return lat, lon
+
+
+def risk_count_matrix(points, risk_column="risk"):
+    """
+    (n_points, len(RISK_LEVELS)) post counts. Uses per-level count columns when present (output of
+    location_extraction.py), otherwise counts each row once under its risk label.
+    """
+    if all(level in points.columns for level in RISK_LEVELS):
+        return points[RISK_LEVELS].fillna(0).to_numpy(dtype=np.int64)
+    risk = points[risk_column].astype(str).str.replace("_", " ").str.lower()
+    return np.stack([(risk == level).to_numpy(dtype=np.int64) for level in RISK_LEVELS], axis=1)
+
+
+def aggregate_cells(lat, lon, counts, precision):
+    """
+    Sum risk counts per geohash cell.
+
+    Returns:
+        DataFrame: geohash, latitude, longitude (cell center), one count column per risk level,
+        total, intensity (post-weighted mean of RISK_INTENSITY) and majority_risk
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    valid = np.isfinite(lat) & np.isfinite(lon)
+    codes = geohash_codes(lat[valid], lon[valid], precision)
+    counts = np.asarray(counts)[valid]
+
+    cells, inverse = np.unique(codes, return_inverse=True)
+    cell_counts = np.stack(
+        [np.bincount(inverse, weights=counts[:, j], minlength=len(cells)) for j in range(len(RISK_LEVELS))],
+        axis=1
+    ).astype(np.int64)
+    total = cell_counts.sum(axis=1)
+    weights = np.array([RISK_INTENSITY[level] for level in RISK_LEVELS])
+    intensity = np.divide(cell_counts @ weights, total, out=np.zeros(len(cells)), where=total > 0)
+
+    center_lat, center_lon = geohash_centers(cells, precision)
+    result = pd.DataFrame({
+        "geohash": geohash_strings(cells, precision),
+        "latitude": center_lat,
+        "longitude": center_lon,
+    })
+    for j, level in enumerate(RISK_LEVELS):
+        result[level] = cell_counts[:, j]
+    result["total"] = total
+    result["intensity"] = intensity.round(4)
+    result["majority_risk"] = np.array(RISK_LEVELS, dtype=object)[cell_counts.argmax(axis=1)]
+    return result[total > 0].reset_index(drop=True)
+
+
+def build_zoom_aggregates(points, precisions=DEFAULT_PRECISIONS, risk_column="risk", out_dir=None):
+    """{precision: cell DataFrame} for every precision; also written as cells-p<precision>.parquet if out_dir."""
+    counts = risk_count_matrix(points, risk_column)
+    aggregates = {
+        p: aggregate_cells(points["latitude"], points["longitude"], counts, p) for p in precisions
+    }
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+        for p, cells in aggregates.items():
+            cells.to_parquet(os.path.join(out_dir, f"cells-p{p}.parquet"), index=False)
+    return aggregates
+
+
+def render_heatmap(aggregates, output_path="location_risk_heatmap.html", show_precision=None):
+    """
+    Folium map with one toggleable layer per precision (heat layer + one circle per cell).
+    Only show_precision (default: the coarsest) is visible initially.
+    """
+    import folium
+    from folium.plugins import HeatMap
+
+    precisions = sorted(aggregates)
+    show_precision = show_precision or precisions[0]
+    m = folium.Map(location=[20, 0], zoom_start=PRECISION_ZOOM.get(show_precision, 2))
+
+    for p in precisions:
+        cells = aggregates[p]
+        layer = folium.FeatureGroup(name=f"Geohash {p} ({len(cells):,} cells)", show=(p == show_precision))
+        max_total = max(int(cells["total"].max()), 1) if len(cells) else 1
+        HeatMap(
+            cells[["latitude", "longitude", "intensity"]].values.tolist(),
+            radius=15, blur=10, max_zoom=PRECISION_ZOOM.get(p, 1)
+        ).add_to(layer)
+        for row in cells.to_dict("records"):
+            folium.CircleMarker(
+                location=(row["latitude"], row["longitude"]),
+                radius=4 + 12 * np.sqrt(row["total"] / max_total),
+                color=RISK_COLORS.get(row["majority_risk"], "gray"),
+                fill=True,
+                fill_opacity=0.6,
+                popup=f"{row['geohash']}: {row['total']} posts — "
+                      + ", ".join(f"{level} {row[level]}" for level in RISK_LEVELS)
+            ).add_to(layer)
+        layer.add_to(m)
+
+    folium.LayerControl(collapsed=False).add_to(m)
+    m.save(output_path)
+    return m
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bin geocoded risk data into geohash cells and render a heatmap.")
+    parser.add_argument("input", help="CSV from geocoding.py (latitude, longitude, risk or per-level counts)")
+    parser.add_argument("--output", default="location_risk_heatmap.html")
+    parser.add_argument("--precisions", type=int, nargs="+", default=list(DEFAULT_PRECISIONS))
+    parser.add_argument("--show-precision", type=int, default=None)
+    parser.add_argument("--risk-column", default="risk")
+    args = parser.parse_args()
+
+    points = pd.read_csv(args.input)
+    aggregates = build_zoom_aggregates(points, args.precisions, args.risk_column, out_dir=AGGREGATE_DIR)
+    for p, cells in aggregates.items():
+        print(f"Precision {p}: {len(points):,} points -> {len(cells):,} cells")
+    render_heatmap(aggregates, args.output, args.show_precision)
+    print(f"✅ Map saved as {args.output}")
@@ -0,0 +1,131 @@
+"""
+Weak labeling of posts with the sentiment teacher model used to build the training set.
+
+    python teacher_labeling.py combined_df.csv --output labeled/ --text-column content
+
+Replaces the notebook's one-post-at-a-time loop: texts are tokenized once, sorted by token length and
+run through cardiffnlp/twitter-roberta-base-sentiment in padded-per-batch groups. Sentiments are mapped
+to risk levels with vectorized NumPy, and output is written in checkpointed Parquet chunks so an
+interrupted relabel run resumes at the first unfinished chunk.
+"""
+import argparse
+
+import numpy as np
+import torch
+from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+from batch_io import iter_pending_chunks, save_checkpoint, write_part
+
+TEACHER_MODEL_NAME = "cardiffnlp/twitter-roberta-base-sentiment"
+SENTIMENT_ID2LABEL = {0: "negative", 1: "neutral", 2: "positive"}
+
+# Same rule as the notebook's map_to_risk_level()
+POSITIVE_NO_RISK_THRESHOLD = 0.50
+
+label2id = {"low": 0, "moderate": 1, "high": 2, "no risk": 3}
+
+
+def load_teacher(model_name=TEACHER_MODEL_NAME, device=None):
+    """Load the teacher tokenizer/model in eval mode. Returns (tokenizer, model, device)."""
+    if device is None:
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForSequenceClassification.from_pretrained(model_name).to(device).eval()
+    return tokenizer, model, device
+
+
+def classify_sentiments(texts, tokenizer, model, device, batch_size=64, max_length=512):
+    """
+    Sentiment label and confidence for every text, in input order.
+
+    All texts are tokenized in one call without padding; batches are then formed from texts of
+    similar token length and padded only to their own maximum.
+
+    Returns:
+        tuple: (labels ndarray of str, confidences ndarray of float32 rounded to 4 decimals)
+    """
+    texts = ["" if t is None else str(t) for t in texts]
+    n = len(texts)
+    labels = np.full(n, "error", dtype=object)
+    confidences = np.zeros(n, dtype=np.float32)
+    if n == 0:
+        return labels, confidences
+
+    encodings = tokenizer(texts, truncation=True, max_length=max_length)
+    input_ids = encodings["input_ids"]
+    order = np.argsort([len(ids) for ids in input_ids], kind="stable")
+    id2label = np.array([SENTIMENT_ID2LABEL[i] for i in range(len(SENTIMENT_ID2LABEL))], dtype=object)
+
+    for start in range(0, n, batch_size):
+        idx = order[start:start + batch_size]
+        try:
+            batch = tokenizer.pad(
+                {key: [encodings[key][i] for i in idx] for key in encodings.keys()},
+                return_tensors="pt"
+            ).to(device)
+            with torch.inference_mode():
+                probs = torch.softmax(model(**batch).logits, dim=1)
+                conf, pred = torch.max(probs, dim=1)
+            labels[idx] = id2label[pred.cpu().numpy()]
+            confidences[idx] = np.round(conf.cpu().numpy(), 4)
+        except Exception as e:
+            # Same fallback as the notebook: mark the rows as 'error' with confidence 0.0
+            print(f"Error processing batch starting with: {texts[idx[0]][:40]}... | {e}")
+
+    return labels, confidences
+
+
+def map_to_risk_levels(sentiments, confidences, positive_threshold=POSITIVE_NO_RISK_THRESHOLD):
+    """
+    Vectorized map_to_risk_level():
+    positive -> 'no risk' (confidence >= threshold) or 'low', neutral -> 'moderate', negative -> 'high',
+    anything else -> None.
+    """
+    sentiments = np.asarray(sentiments, dtype=object)
+    confidences = np.asarray(confidences, dtype=np.float64)
+    return np.select(
+        [
+            (sentiments == "positive") & (confidences >= positive_threshold),
+            sentiments == "positive",
+            sentiments == "neutral",
+            sentiments == "negative",
+        ],
+        ["no risk", "low", "moderate", "high"],
+        default=None,
+    )
+
+
+def label_chunk(chunk, tokenizer, model, device, text_column="content", batch_size=64, max_length=512):
+    """Adds bert_sentiment, bert_sentiment_confidence, label and label_id columns to a DataFrame chunk."""
+    sentiments, confidences = classify_sentiments(
+        chunk[text_column].fillna("").tolist(), tokenizer, model, device,
+        batch_size=batch_size, max_length=max_length
+    )
+    chunk = chunk.assign(bert_sentiment=sentiments, bert_sentiment_confidence=confidences)
+    chunk["label"] = map_to_risk_levels(sentiments, confidences)
+    chunk["label_id"] = chunk["label"].map(label2id)
+    return chunk
+
+
+def run(input_path, output_dir, text_column="content", chunk_size=5000, batch_size=64, max_length=512):
+    """Label input_path into output_dir/part-NNNNNN.parquet, resuming from the checkpoint if present."""
+    tokenizer, model, device = load_teacher()
+    for chunk_index, chunk, rows_done in iter_pending_chunks(input_path, output_dir, chunk_size):
+        labeled = label_chunk(chunk, tokenizer, model, device, text_column, batch_size, max_length)
+        write_part(output_dir, chunk_index, labeled)
+        rows_done += len(chunk)
+        save_checkpoint(output_dir, input_path, chunk_size, chunk_index + 1, rows_done)
+        print(f"✅ Chunk {chunk_index + 1}: {rows_done:,} posts labeled")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Label posts with the sentiment teacher model.")
+    parser.add_argument("input", help="CSV, JSONL or Parquet file of posts")
+    parser.add_argument("--output", default="labeled_posts", help="Output directory for Parquet parts")
+    parser.add_argument("--text-column", default="content")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="Rows read and checkpointed at a time")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--max-length", type=int, default=512)
+    args = parser.parse_args()
+
+    run(args.input, args.output, args.text_column, args.chunk_size, args.batch_size, args.max_length)
@@ -0,0 +1,259 @@
+"""
+Threshold search for the hybrid (ensemble + semantic lexicon) risk decision.
+
+    python threshold_tuning.py scores.npz --sim-range 0.3 0.95 0.005 --conf-range 0.4 1.0 0.005 --per-class
+
+The notebook's analyze_threshold_performance() re-ran the ensemble and the embedding model over the
+whole test set for every (similarity, confidence) pair. Here the four per-text inputs of
+combine_predictions() -- model risk, model confidence, semantic risk, similarity -- are computed once
+(collect_scores) and stored in an .npz file. Every grid cell is then evaluated from 2-D cumulative
+histograms in NumPy, so the cost is O(n_texts + grid size) and grids of 100x100 or finer take well
+under a second.
+
+Decision rule (same as combine_predictions): take the semantic risk when it differs from the model
+risk, similarity >= sim_threshold and model confidence < conf_threshold. With --per-class the two
+thresholds may differ per semantic risk level.
+"""
+import argparse
+
+import numpy as np
+
+# Class order used by the ensemble (label2id in the notebook and model_utils)
+RISK_LEVELS = ["low", "moderate", "high", "no risk"]
+METRICS = ("accuracy", "macro_f1")
+
+
+def encode_labels(labels):
+    """Risk label strings -> class ids (accepts 'no risk', 'no_risk', 'norisk'); unknown labels -> -1."""
+    lookup = {level.replace(" ", ""): i for i, level in enumerate(RISK_LEVELS)}
+    return np.array(
+        [lookup.get(str(label).replace("_", "").replace(" ", "").lower(), -1) for label in labels],
+        dtype=np.int64
+    )
+
+
+def collect_scores(ensemble, texts, true_labels, semantic_scorer, batch_size=64, max_length=128):
+    """
+    Run both components once over texts.
+
+    Args:
+        ensemble: MentalHealthEnsemble
+        texts: list of texts
+        true_labels: class ids or risk label strings
+        semantic_scorer: callable(list of texts) -> (risk labels, similarity scores)
+
+    Returns:
+        dict of arrays: y_true, model_pred, model_conf, sem_pred, sem_score
+    """
+    model_labels, model_conf, _ = ensemble.predict_sorted_batches(texts, batch_size=batch_size, max_length=max_length)
+    sem_labels, sem_score = semantic_scorer(texts)
+
+    true_labels = np.asarray(true_labels)
+    y_true = true_labels.astype(np.int64) if np.issubdtype(true_labels.dtype, np.integer) else encode_labels(true_labels)
+    return {
+        "y_true": y_true,
+        "model_pred": encode_labels(model_labels),
+        "model_conf": np.asarray(model_conf, dtype=np.float64),
+        "sem_pred": encode_labels(sem_labels),
+        "sem_score": np.asarray(sem_score, dtype=np.float64),
+    }
+
+
+def save_scores(path, scores):
+    np.savez_compressed(path, **scores)
+
+
+def load_scores(path):
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+
+def apply_thresholds(scores, sim_threshold=0.7, conf_threshold=0.85):
+    """
+    Hybrid predictions (class ids) for one threshold setting. Either threshold may be a scalar or an
+    array of len(RISK_LEVELS) indexed by the semantic risk level.
+    """
+    model_pred, sem_pred = scores["model_pred"], scores["sem_pred"]
+    valid = sem_pred >= 0
+    sem_idx = np.where(valid, sem_pred, 0)
+    sim_t = np.broadcast_to(np.asarray(sim_threshold, dtype=np.float64), (len(RISK_LEVELS),))[sem_idx]
+    conf_t = np.broadcast_to(np.asarray(conf_threshold, dtype=np.float64), (len(RISK_LEVELS),))[sem_idx]
+    switch = valid & (sem_pred != model_pred) & (scores["sem_score"] >= sim_t) & (scores["model_conf"] < conf_t)
+    return np.where(switch, sem_pred, model_pred)
+
+
+def confusion_matrix(y_true, y_pred, n_classes=len(RISK_LEVELS)):
+    """(n_classes, n_classes) counts, rows = true class; predictions of -1 are dropped."""
+    keep = (y_true >= 0) & (y_pred >= 0)
+    return np.bincount(
+        y_true[keep] * n_classes + y_pred[keep], minlength=n_classes * n_classes
+    ).reshape(n_classes, n_classes)
+
+
+def confusion_grid(y_true, base_pred, cand_pred, model_conf, sem_score, sim_thresholds, conf_thresholds,
+                   n_classes=len(RISK_LEVELS)):
+    """
+    Confusion matrix for every (sim_threshold, conf_threshold) pair.
+
+    A text switches from base_pred to cand_pred when sem_score >= sim_threshold and
+    model_conf < conf_threshold. Only texts where the two predictions differ are histogrammed by
+    (number of sim thresholds passed, number of conf thresholds failed); cumulative sums over that
+    histogram give the switched counts of every cell at once.
+
+    Returns:
+        ndarray (n_sim, n_conf, n_classes, n_classes) of int64
+    """
+    sim_thresholds = np.asarray(sim_thresholds, dtype=np.float64)
+    conf_thresholds = np.asarray(conf_thresholds, dtype=np.float64)
+    n_sim, n_conf = len(sim_thresholds), len(conf_thresholds)
+    K = n_classes
+
+    base = confusion_matrix(y_true, base_pred, K)
+    grid = np.broadcast_to(base, (n_sim, n_conf, K, K)).copy()
+
+    movers = (base_pred != cand_pred) & (cand_pred >= 0) & (y_true >= 0)
+    if not movers.any():
+        return grid
+
+    t, b, c = y_true[movers], base_pred[movers], cand_pred[movers]
+    # Threshold j is passed when sim >= sim_thresholds[j]; conf threshold k when conf < conf_thresholds[k]
+    sim_idx = np.searchsorted(np.sort(sim_thresholds), sem_score[movers], side="right")
+    conf_idx = np.searchsorted(np.sort(conf_thresholds), model_conf[movers], side="right")
+    # One histogram cell per (sim_idx, conf_idx, true, from, to)
+    code = (((sim_idx * (n_conf + 1) + conf_idx) * K + t) * K + b) * K + c
+    hist = np.bincount(code, minlength=(n_sim + 1) * (n_conf + 1) * K ** 3).reshape(n_sim + 1, n_conf + 1, K, K, K)
+
+    # switched[j, k] = sum over sim_idx > j and conf_idx <= k
+    switched = np.cumsum(hist[::-1], axis=0)[::-1][1:]
+    switched = np.cumsum(switched, axis=1)[:, :n_conf]
+
+    grid += switched.sum(axis=3)   # +1 at (true, to)
+    grid -= switched.sum(axis=4)   # -1 at (true, from)
+
+    # Undo the sort so rows/columns follow the caller's threshold order
+    sim_rank = np.argsort(np.argsort(sim_thresholds, kind="stable"), kind="stable")
+    conf_rank = np.argsort(np.argsort(conf_thresholds, kind="stable"), kind="stable")
+    return grid[sim_rank][:, conf_rank]
+
+
+def grid_metrics(grid, classes=None):
+    """
+    Accuracy and macro F1 of every cell of a confusion grid (zero_division=0, like the notebook's
+    classification_report). classes restricts the macro average, e.g. to the classes present in y_true.
+    """
+    tp = np.diagonal(grid, axis1=-2, axis2=-1).astype(np.float64)
+    total = grid.sum(axis=(-2, -1)).astype(np.float64)
+    support = grid.sum(axis=-1)
+    predicted = grid.sum(axis=-2)
+    denom = (support + predicted).astype(np.float64)
+    f1 = np.divide(2 * tp, denom, out=np.zeros_like(tp), where=denom > 0)
+    if classes is not None:
+        f1 = f1[..., classes]
+    return {
+        "accuracy": np.divide(tp.sum(axis=-1), total, out=np.zeros_like(total), where=total > 0),
+        "macro_f1": f1.mean(axis=-1),
+    }
+
+
+def search_thresholds(scores, sim_thresholds, conf_thresholds, metric="accuracy"):
+    """
+    Evaluate one global (sim, conf) threshold pair per grid cell.
+
+    Returns:
+        tuple: (best dict, {metric name: (n_sim, n_conf) ndarray})
+    """
+    y_true = scores["y_true"]
+    grid = confusion_grid(
+        y_true, scores["model_pred"], scores["sem_pred"], scores["model_conf"], scores["sem_score"],
+        sim_thresholds, conf_thresholds
+    )
+    metrics = grid_metrics(grid, classes=np.unique(y_true[y_true >= 0]))
+    j, k = np.unravel_index(np.argmax(metrics[metric]), metrics[metric].shape)
+    best = {
+        "sim_threshold": float(np.asarray(sim_thresholds)[j]),
+        "conf_threshold": float(np.asarray(conf_thresholds)[k]),
+        **{name: float(values[j, k]) for name, values in metrics.items()},
+    }
+    return best, metrics
+
+
+def search_per_class_thresholds(scores, sim_thresholds, conf_thresholds, metric="accuracy", max_rounds=5):
+    """
+    Separate (sim, conf) thresholds for each semantic risk level, by coordinate ascent starting from
+    the best global pair. Each step re-grids one level's texts with the other levels' decisions fixed.
+    For accuracy the levels are independent and one round is already optimal.
+
+    Returns:
+        dict: sim_thresholds / conf_thresholds keyed by risk level, plus the metrics of the result
+    """
+    y_true, model_pred, sem_pred = scores["y_true"], scores["model_pred"], scores["sem_pred"]
+    classes = np.unique(y_true[y_true >= 0])
+    best, _ = search_thresholds(scores, sim_thresholds, conf_thresholds, metric)
+    sim_t = np.full(len(RISK_LEVELS), best["sim_threshold"])
+    conf_t = np.full(len(RISK_LEVELS), best["conf_threshold"])
+    current = best[metric]
+
+    for _ in range(max_rounds):
+        improved = False
+        for level in range(len(RISK_LEVELS)):
+            in_level = sem_pred == level
+            if not in_level.any():
+                continue
+            # Texts of other levels keep their current hybrid decision; this level's texts may switch
+            base_pred = np.where(in_level, model_pred, apply_thresholds(scores, sim_t, conf_t))
+            cand_pred = np.where(in_level, sem_pred, base_pred)
+            grid = confusion_grid(
+                y_true, base_pred, cand_pred, scores["model_conf"], scores["sem_score"],
+                sim_thresholds, conf_thresholds
+            )
+            values = grid_metrics(grid, classes)[metric]
+            j, k = np.unravel_index(np.argmax(values), values.shape)
+            if values[j, k] > current + 1e-12:
+                sim_t[level] = np.asarray(sim_thresholds)[j]
+                conf_t[level] = np.asarray(conf_thresholds)[k]
+                current = float(values[j, k])
+                improved = True
+        if not improved:
+            break
+
+    final = grid_metrics(confusion_matrix(y_true, apply_thresholds(scores, sim_t, conf_t)), classes)
+    return {
+        "sim_thresholds": dict(zip(RISK_LEVELS, sim_t.tolist())),
+        "conf_thresholds": dict(zip(RISK_LEVELS, conf_t.tolist())),
+        **{name: float(value) for name, value in final.items()},
+    }
+
+
+def threshold_range(start, stop, step):
+    """Inclusive float range, rounded to avoid 0.7000000001-style thresholds."""
+    return np.round(np.arange(start, stop + step / 2, step), 6)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Grid-search hybrid semantic-voting thresholds.")
+    parser.add_argument("scores", help=".npz from collect_scores()/save_scores()")
+    parser.add_argument("--sim-range", nargs=3, type=float, default=[0.3, 0.95, 0.01], metavar=("START", "STOP", "STEP"))
+    parser.add_argument("--conf-range", nargs=3, type=float, default=[0.4, 1.0, 0.01], metavar=("START", "STOP", "STEP"))
+    parser.add_argument("--metric", choices=METRICS, default="accuracy")
+    parser.add_argument("--per-class", action="store_true", help="Also tune thresholds per semantic risk level")
+    args = parser.parse_args()
+
+    scores = load_scores(args.scores)
+    sim_grid = threshold_range(*args.sim_range)
+    conf_grid = threshold_range(*args.conf_range)
+
+    model_only = grid_metrics(confusion_matrix(scores["y_true"], scores["model_pred"]),
+                              np.unique(scores["y_true"][scores["y_true"] >= 0]))
+    print(f"Ensemble only: accuracy={model_only['accuracy']:.4f}, macro F1={model_only['macro_f1']:.4f}")
+
+    best, _ = search_thresholds(scores, sim_grid, conf_grid, args.metric)
+    print(f"Searched {len(sim_grid)} x {len(conf_grid)} thresholds")
+    print(f"Best thresholds: sim_threshold={best['sim_threshold']}, conf_threshold={best['conf_threshold']}")
+    print(f"  accuracy={best['accuracy']:.4f}, macro F1={best['macro_f1']:.4f}")
+
+    if args.per_class:
+        per_class = search_per_class_thresholds(scores, sim_grid, conf_grid, args.metric)
+        print("Per-class thresholds:")
+        for level in RISK_LEVELS:
+            print(f"  {level}: sim={per_class['sim_thresholds'][level]}, conf={per_class['conf_thresholds'][level]}")
+        print(f"  accuracy={per_class['accuracy']:.4f}, macro F1={per_class['macro_f1']:.4f}")
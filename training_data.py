@@ -0,0 +1,217 @@
+"""
+Tokenize-once training data for fine-tuning the base models.
+
+get_tokenized_dataset() tokenizes a (texts, labels) split once per tokenizer and stores it as
+memory-mapped NumPy shards under data/token_cache/<dataset hash>-<tokenizer hash>/. Later runs, other
+fine-tuning sections and every Optuna trial load the cached shards instead of re-tokenizing.
+
+Sequences are stored unpadded; DynamicPaddingCollator pads each batch only to its own longest
+sequence, and LengthGroupedSampler puts sequences of similar length into the same batch.
+"""
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import torch
+from torch.utils.data import Dataset, Sampler
+from transformers import Trainer
+
+CACHE_DIR = os.path.join("data", "token_cache")
+SHARD_SIZE = 50000  # texts tokenized and written per shard
+
+
+def dataset_hash(texts, labels):
+    """Content hash of a split (order-sensitive)."""
+    h = hashlib.sha256()
+    for text, label in zip(texts, labels):
+        h.update(str(text).encode("utf-8"))
+        h.update(b"\x00")
+        h.update(str(int(label)).encode())
+        h.update(b"\x01")
+    return h.hexdigest()[:16]
+
+
+def tokenizer_hash(tokenizer, max_length):
+    """Identifies everything about the tokenizer that changes the produced ids."""
+    fingerprint = {
+        "class": type(tokenizer).__name__,
+        "name_or_path": tokenizer.name_or_path,
+        "vocab_size": len(tokenizer),
+        "special_tokens": tokenizer.special_tokens_map,
+        "max_length": max_length,
+    }
+    backend = getattr(tokenizer, "backend_tokenizer", None)
+    if backend is not None:
+        fingerprint["backend"] = hashlib.sha256(backend.to_str().encode("utf-8")).hexdigest()
+    return hashlib.sha256(json.dumps(fingerprint, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def _write_shard(shard_dir, encodings, labels):
+    """Store each tokenizer output key as one flat int32 array plus shared offsets."""
+    os.makedirs(shard_dir)
+    lengths = np.fromiter((len(ids) for ids in encodings["input_ids"]), dtype=np.int64, count=len(labels))
+    offsets = np.zeros(len(labels) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    np.save(os.path.join(shard_dir, "offsets.npy"), offsets)
+    np.save(os.path.join(shard_dir, "labels.npy"), np.asarray(labels, dtype=np.int64))
+    for key, values in encodings.items():
+        if key == "attention_mask":
+            continue  # all ones before padding; the collator rebuilds it
+        flat = np.concatenate([np.asarray(seq, dtype=np.int32) for seq in values])
+        np.save(os.path.join(shard_dir, f"{key}.npy"), flat)
+
+
+def build_token_cache(texts, labels, tokenizer, max_length, cache_path, shard_size=SHARD_SIZE):
+    """Tokenize into cache_path (written to a temp dir and renamed, so a crash leaves no partial cache)."""
+    tmp_path = cache_path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    keys = None
+    for shard_index, start in enumerate(range(0, len(texts), shard_size)):
+        shard_texts = [str(t) for t in texts[start:start + shard_size]]
+        encodings = tokenizer(shard_texts, truncation=True, max_length=max_length)
+        keys = [k for k in encodings.keys() if k != "attention_mask"]
+        _write_shard(os.path.join(tmp_path, f"shard-{shard_index:05d}"), encodings, labels[start:start + shard_size])
+
+    with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+        json.dump({
+            "n_examples": len(texts),
+            "keys": keys or ["input_ids"],
+            "max_length": max_length,
+            "tokenizer": tokenizer.name_or_path,
+        }, f)
+    os.replace(tmp_path, cache_path)
+
+
+class TokenizedDataset(Dataset):
+    """
+    Read-only view over cached shards. Arrays are memory-mapped, so opening a multi-million-row
+    cache is instant and items are plain NumPy slices (tensors are built once per batch by the collator).
+    """
+    def __init__(self, cache_path):
+        with open(os.path.join(cache_path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.keys = self.meta["keys"]
+
+        self.shards = []
+        shard_sizes = []
+        for name in sorted(os.listdir(cache_path)):
+            if not name.startswith("shard-"):
+                continue
+            shard_dir = os.path.join(cache_path, name)
+            shard = {key: np.load(os.path.join(shard_dir, f"{key}.npy"), mmap_mode="r") for key in self.keys}
+            shard["offsets"] = np.load(os.path.join(shard_dir, "offsets.npy"), mmap_mode="r")
+            shard["labels"] = np.load(os.path.join(shard_dir, "labels.npy"), mmap_mode="r")
+            self.shards.append(shard)
+            shard_sizes.append(len(shard["labels"]))
+
+        self.shard_starts = np.concatenate([[0], np.cumsum(shard_sizes)]).astype(np.int64)
+        self.lengths = np.concatenate([np.diff(s["offsets"]) for s in self.shards]) if self.shards else np.zeros(0, dtype=np.int64)
+
+    def __len__(self):
+        return int(self.shard_starts[-1])
+
+    def __getitem__(self, idx):
+        shard_index = int(np.searchsorted(self.shard_starts, idx, side="right") - 1)
+        shard = self.shards[shard_index]
+        local = idx - self.shard_starts[shard_index]
+        start, end = shard["offsets"][local], shard["offsets"][local + 1]
+        item = {key: shard[key][start:end] for key in self.keys}
+        item["labels"] = int(shard["labels"][local])
+        return item
+
+
+def get_tokenized_dataset(texts, labels, tokenizer, max_length=128, cache_dir=CACHE_DIR):
+    """
+    Cached replacement for `MentalHealthDataset(tokenizer(texts, padding=True, ...), labels)`.
+    Tokenizes only on the first call for a given (dataset, tokenizer, max_length).
+    """
+    texts = list(texts)
+    labels = list(labels)
+    cache_path = os.path.join(cache_dir, f"{dataset_hash(texts, labels)}-{tokenizer_hash(tokenizer, max_length)}")
+    if not os.path.exists(os.path.join(cache_path, "meta.json")):
+        print(f"Tokenizing {len(texts):,} texts into {cache_path}...")
+        os.makedirs(cache_dir, exist_ok=True)
+        build_token_cache(texts, labels, tokenizer, max_length, cache_path)
+    return TokenizedDataset(cache_path)
+
+
+class DynamicPaddingCollator:
+    """Pads a batch of TokenizedDataset items to the batch's longest sequence and builds the attention mask."""
+    def __init__(self, tokenizer, pad_to_multiple_of=8):
+        self.pad_values = {
+            "input_ids": tokenizer.pad_token_id,
+            "token_type_ids": getattr(tokenizer, "pad_token_type_id", 0),
+        }
+        # XLNet pads on the left
+        self.left_pad = tokenizer.padding_side == "left"
+        self.pad_to_multiple_of = pad_to_multiple_of
+
+    def __call__(self, items):
+        lengths = [len(item["input_ids"]) for item in items]
+        max_len = max(lengths)
+        if self.pad_to_multiple_of:
+            max_len = -(-max_len // self.pad_to_multiple_of) * self.pad_to_multiple_of
+
+        batch = {}
+        keys = [k for k in items[0] if k != "labels"]
+        for key in keys:
+            out = np.full((len(items), max_len), self.pad_values.get(key, 0), dtype=np.int64)
+            for row, item in enumerate(items):
+                seq = item[key]
+                if self.left_pad:
+                    out[row, max_len - len(seq):] = seq
+                else:
+                    out[row, :len(seq)] = seq
+            batch[key] = torch.from_numpy(out)
+
+        mask = np.zeros((len(items), max_len), dtype=np.int64)
+        for row, length in enumerate(lengths):
+            if self.left_pad:
+                mask[row, max_len - length:] = 1
+            else:
+                mask[row, :length] = 1
+        batch["attention_mask"] = torch.from_numpy(mask)
+        batch["labels"] = torch.tensor([item["labels"] for item in items], dtype=torch.long)
+        return batch
+
+
+class LengthGroupedSampler(Sampler):
+    """
+    Shuffles indices, cuts them into mega-batches of batch_size * mega_batch_mult, sorts each
+    mega-batch by length (longest first) and yields the result. Consecutive batch_size indices
+    therefore have similar lengths, while epochs stay randomized.
+    """
+    def __init__(self, lengths, batch_size, mega_batch_mult=50, seed=42):
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.mega_batch_size = batch_size * mega_batch_mult
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def __iter__(self):
+        rng = np.random.default_rng(self.seed + self.epoch)
+        self.epoch += 1
+        indices = rng.permutation(len(self.lengths))
+        for start in range(0, len(indices), self.mega_batch_size):
+            mega = indices[start:start + self.mega_batch_size]
+            yield from mega[np.argsort(-self.lengths[mega], kind="stable")].tolist()
+
+
+class LengthGroupedTrainer(Trainer):
+    """Trainer that samples TokenizedDataset batches with LengthGroupedSampler."""
+    def _get_train_sampler(self, *args, **kwargs):
+        dataset = self.train_dataset
+        if not isinstance(dataset, TokenizedDataset):
+            return super()._get_train_sampler(*args, **kwargs)
+        batch_size = self.args.train_batch_size * self.args.gradient_accumulation_steps
+        return LengthGroupedSampler(dataset.lengths, batch_size, seed=self.args.seed)
@@ -0,0 +1,241 @@
+"""
+Optuna hyperparameter search for fine-tuning a base model.
+
+    python tuning.py final_df.csv --model distilbert-base-uncased --n-trials 20 --workers 2
+
+Compared with the notebook's objective():
+  * the sampled learning rate, batch size, epochs, weight decay and warmup are actually used,
+  * eval F1 is reported to Optuna several times per epoch so a median or ASHA pruner stops bad trials early,
+  * trials run in parallel worker processes sharing a local SQLite study (data/optuna.db),
+  * every trial reuses the cached tokenized splits from training_data instead of re-tokenizing.
+"""
+import argparse
+import math
+import multiprocessing
+import os
+
+import optuna
+import pandas as pd
+import torch
+from sklearn.metrics import accuracy_score, precision_recall_fscore_support
+from sklearn.model_selection import train_test_split
+from transformers import AutoModelForSequenceClassification, AutoTokenizer, TrainerCallback, TrainingArguments
+
+from training_data import DynamicPaddingCollator, LengthGroupedTrainer, get_tokenized_dataset
+
+STORAGE_URL = "sqlite:///" + os.path.join("data", "optuna.db")
+RESULTS_DIR = os.path.join("data", "tuning_runs")
+
+label2id = {"low": 0, "moderate": 1, "high": 2, "no risk": 3}
+id2label = {v: k for k, v in label2id.items()}
+
+
+def load_splits(path, text_column="content", label_column="label_id"):
+    """Train / validation texts and labels, split exactly like the notebook (60/20/20, stratified, seed 42)."""
+    data = pd.read_parquet(path) if path.lower().endswith(".parquet") else pd.read_csv(path)
+    data = data.dropna(subset=[text_column, label_column])
+    X_temp, _, y_temp, _ = train_test_split(
+        data[text_column].tolist(), data[label_column].astype(int).tolist(),
+        test_size=0.2, stratify=data[label_column], random_state=42
+    )
+    X_train, X_val, y_train, y_val = train_test_split(
+        X_temp, y_temp, test_size=0.25, stratify=y_temp, random_state=42
+    )
+    return X_train, y_train, X_val, y_val
+
+
+def compute_metrics(eval_pred):
+    logits, labels = eval_pred
+    predictions = logits.argmax(axis=-1)
+    precision, recall, f1, _ = precision_recall_fscore_support(labels, predictions, average='weighted')
+    acc = accuracy_score(labels, predictions)
+    return {
+        'accuracy': acc,
+        'f1': f1,
+        'precision': precision,
+        'recall': recall
+    }
+
+
+def suggest_params(trial):
+    """Search space (same ranges as the notebook)."""
+    return {
+        "learning_rate": trial.suggest_float("learning_rate", 1e-5, 5e-5, log=True),
+        "per_device_train_batch_size": trial.suggest_categorical("per_device_train_batch_size", [8, 16, 32]),
+        "num_train_epochs": trial.suggest_int("num_train_epochs", 3, 5),
+        "weight_decay": trial.suggest_float("weight_decay", 0.01, 0.1),
+        "warmup_ratio": trial.suggest_float("warmup_ratio", 0.05, 0.2),
+    }
+
+
+class OptunaPruningCallback(TrainerCallback):
+    """Reports eval F1 after every evaluation and stops the trial when the pruner says so."""
+    def __init__(self, trial, metric="eval_f1"):
+        self.trial = trial
+        self.metric = metric
+        self.report_step = 0
+
+    def on_evaluate(self, args, state, control, metrics=None, **kwargs):
+        if not metrics or self.metric not in metrics:
+            return
+        self.trial.report(metrics[self.metric], step=self.report_step)
+        self.report_step += 1
+        if self.trial.should_prune():
+            raise optuna.TrialPruned(f"Pruned at evaluation {self.report_step} ({self.metric}={metrics[self.metric]:.4f})")
+
+
+def make_objective(model_name, splits, max_length=128, evals_per_epoch=2):
+    """Build the Optuna objective for one base model. splits = (X_train, y_train, X_val, y_val)."""
+    X_train, y_train, X_val, y_val = splits
+
+    def objective(trial):
+        params = suggest_params(trial)
+
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModelForSequenceClassification.from_pretrained(
+            model_name,
+            num_labels=4,
+            id2label=id2label,
+            label2id=label2id
+        )
+        # Cache hits after the first trial (and the parent's warm-up in run_search)
+        train_dataset = get_tokenized_dataset(X_train, y_train, tokenizer, max_length)
+        val_dataset = get_tokenized_dataset(X_val, y_val, tokenizer, max_length)
+
+        steps_per_epoch = math.ceil(len(train_dataset) / params["per_device_train_batch_size"])
+        eval_steps = max(1, steps_per_epoch // evals_per_epoch)
+
+        training_args = TrainingArguments(
+            output_dir=os.path.join(RESULTS_DIR, f"trial-{trial.number}"),
+            eval_strategy="steps",
+            eval_steps=eval_steps,
+            save_strategy="no",
+            learning_rate=params["learning_rate"],
+            per_device_train_batch_size=params["per_device_train_batch_size"],
+            per_device_eval_batch_size=max(32, params["per_device_train_batch_size"]),
+            num_train_epochs=params["num_train_epochs"],
+            weight_decay=params["weight_decay"],
+            warmup_ratio=params["warmup_ratio"],
+            load_best_model_at_end=False,
+            metric_for_best_model="f1",
+            logging_steps=50,
+            fp16=torch.cuda.is_available(),
+            report_to=[],
+            seed=42,
+        )
+        trainer = LengthGroupedTrainer(
+            model=model,
+            args=training_args,
+            train_dataset=train_dataset,
+            eval_dataset=val_dataset,
+            data_collator=DynamicPaddingCollator(tokenizer),
+            compute_metrics=compute_metrics,
+            callbacks=[OptunaPruningCallback(trial)]
+        )
+
+        trainer.train()
+        eval_result = trainer.evaluate()
+        train_loss = None
+        for record in trainer.state.log_history[::-1]:
+            if "loss" in record:
+                train_loss = record["loss"]
+                break
+
+        trial.set_user_attr("model_name", model_name)
+        trial.set_user_attr("accuracy", eval_result.get("eval_accuracy"))
+        trial.set_user_attr("precision", eval_result.get("eval_precision"))
+        trial.set_user_attr("recall", eval_result.get("eval_recall"))
+        trial.set_user_attr("train_loss", train_loss)
+        trial.set_user_attr("val_loss", eval_result.get("eval_loss"))
+
+        return eval_result["eval_f1"]
+
+    return objective
+
+
+def make_pruner(name):
+    """'median' stops trials below the running median; 'asha' uses asynchronous successive halving."""
+    if name == "asha":
+        return optuna.pruners.SuccessiveHalvingPruner(min_resource=1, reduction_factor=3)
+    return optuna.pruners.MedianPruner(n_startup_trials=3, n_warmup_steps=1)
+
+
+def get_study(study_name, pruner="median", storage_url=STORAGE_URL):
+    os.makedirs("data", exist_ok=True)
+    storage = optuna.storages.RDBStorage(
+        storage_url,
+        # Several worker processes write to the same SQLite file
+        engine_kwargs={"connect_args": {"timeout": 60}},
+    )
+    return optuna.create_study(
+        study_name=study_name,
+        storage=storage,
+        direction="maximize",
+        pruner=make_pruner(pruner),
+        load_if_exists=True,
+    )
+
+
+def _worker(study_name, pruner, model_name, data_path, max_length, n_trials, torch_threads):
+    """Entry point of one worker process: pulls trials from the shared study until n_trials exist in total."""
+    torch.set_num_threads(torch_threads)
+    splits = load_splits(data_path)
+    study = get_study(study_name, pruner)
+    study.optimize(
+        make_objective(model_name, splits, max_length),
+        n_trials=n_trials,
+        callbacks=[optuna.study.MaxTrialsCallback(n_trials, states=None)],
+        catch=(RuntimeError,),
+    )
+
+
+def run_search(data_path, model_name, n_trials=20, n_workers=1, pruner="median", max_length=128, study_name=None):
+    """Run the search with n_workers processes and return the finished study."""
+    study_name = study_name or f"finetune-{model_name.replace('/', '_')}"
+
+    # Tokenize once up front so workers never race to build the same cache
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    X_train, y_train, X_val, y_val = load_splits(data_path)
+    get_tokenized_dataset(X_train, y_train, tokenizer, max_length)
+    get_tokenized_dataset(X_val, y_val, tokenizer, max_length)
+
+    get_study(study_name, pruner)
+    torch_threads = max(1, (os.cpu_count() or 1) // n_workers)
+
+    if n_workers == 1:
+        _worker(study_name, pruner, model_name, data_path, max_length, n_trials, torch_threads)
+    else:
+        ctx = multiprocessing.get_context("spawn")
+        workers = [
+            ctx.Process(
+                target=_worker,
+                args=(study_name, pruner, model_name, data_path, max_length, n_trials, torch_threads)
+            )
+            for _ in range(n_workers)
+        ]
+        for proc in workers:
+            proc.start()
+        for proc in workers:
+            proc.join()
+
+    study = get_study(study_name, pruner)
+    completed = study.get_trials(deepcopy=False, states=(optuna.trial.TrialState.COMPLETE,))
+    pruned = study.get_trials(deepcopy=False, states=(optuna.trial.TrialState.PRUNED,))
+    print(f"Finished: {len(completed)} complete, {len(pruned)} pruned trials.")
+    if completed:
+        print(f"Best F1: {study.best_value:.4f} with {study.best_params}")
+    return study
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tune fine-tuning hyperparameters with Optuna.")
+    parser.add_argument("data", help="Labeled CSV/Parquet with 'content' and 'label_id' columns")
+    parser.add_argument("--model", default="distilbert-base-uncased")
+    parser.add_argument("--n-trials", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--pruner", choices=["median", "asha"], default="median")
+    parser.add_argument("--max-length", type=int, default=128)
+    parser.add_argument("--study-name", default=None)
+    args = parser.parse_args()
+
+    run_search(args.data, args.model, args.n_trials, args.workers, args.pruner, args.max_length, args.study_name)
@@ -0,0 +1,322 @@
+"""
+Scale-out batch scoring over a durable SQLite work queue (no external services).
+
+    python work_queue.py create posts.parquet --queue data/score_queue.sqlite --output scored/ --unit-rows 20000
+    python work_queue.py worker --queue data/score_queue.sqlite --processes 4     # on every host / terminal
+    python work_queue.py status --queue data/score_queue.sqlite
+
+The coordinator (create) splits the input into fixed row ranges ("units") and records them in the queue.
+A CSV or JSONL input (or a Parquet file with row groups larger than a unit) is read once and staged
+as one Parquet file per unit next to the queue, so a worker reads only its own rows instead of
+re-parsing the file up to its start row. Workers claim one unit at a time under a lease, score it
+exactly like main.py and write <output>/part-<unit id>.parquet through a temp file + rename. Rewriting a unit therefore replaces
+its part instead of duplicating rows, so a unit scored twice is harmless.
+
+A worker renews its lease while scoring. If it dies, the lease expires and another worker re-claims the
+unit. Units that fail MAX_ATTEMPTS times are marked 'failed' (see `requeue`). Workers only touch the
+queue to claim and finish units, so throughput grows with the number of workers. To span hosts, put the
+queue and output on a shared filesystem with working file locks.
+"""
+import argparse
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from batch_io import iter_input_chunks, read_row_range, write_part
+
+QUEUE_PATH = os.path.join("data", "score_queue.sqlite")
+LEASE_SECONDS = 300
+MAX_ATTEMPTS = 3
+
+
+def connect(queue_path):
+    conn = sqlite3.connect(queue_path, timeout=60, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=60000")
+    return conn
+
+
+def staged_units_dir(queue_path):
+    """Where create_job stages per-unit Parquet files for CSV/JSONL inputs."""
+    return os.path.splitext(queue_path)[0] + "_units"
+
+
+def create_job(input_path, output_dir, queue_path=QUEUE_PATH, unit_rows=20000, text_column="content",
+               batch_size=64, max_length=128):
+    """Split input_path into units. Re-running for the job already in the queue adds nothing."""
+    os.makedirs(os.path.dirname(queue_path) or ".", exist_ok=True)
+    conn = connect(queue_path)
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS job (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            input_path TEXT NOT NULL, output_dir TEXT NOT NULL, text_column TEXT NOT NULL,
+            batch_size INTEGER NOT NULL, max_length INTEGER NOT NULL, units_dir TEXT
+        );
+        CREATE TABLE IF NOT EXISTS units (
+            id INTEGER PRIMARY KEY,
+            start_row INTEGER NOT NULL, end_row INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            lease_owner TEXT, lease_expires REAL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT, finished_at REAL
+        );
+        CREATE INDEX IF NOT EXISTS ix_units_status ON units (status, lease_expires);
+    """)
+    existing = conn.execute("SELECT input_path FROM job").fetchone()
+    if existing:
+        conn.close()
+        if existing[0] != os.path.abspath(input_path):
+            raise ValueError(f"{queue_path} already holds a job for {existing[0]}; use another --queue.")
+        print(f"{queue_path} already holds this job; nothing to add")
+        return
+
+    units, units_dir = [], None
+    metadata = pq.ParquetFile(input_path).metadata if input_path.lower().endswith(".parquet") else None
+    if metadata is not None and all(metadata.row_group(i).num_rows <= unit_rows for i in range(metadata.num_row_groups)):
+        # Workers read only the row groups overlapping their unit
+        n_rows = metadata.num_rows
+        units = [(i, start, min(start + unit_rows, n_rows)) for i, start in enumerate(range(0, n_rows, unit_rows))]
+    else:
+        units_dir = os.path.abspath(staged_units_dir(queue_path))
+        os.makedirs(units_dir, exist_ok=True)
+        n_rows = 0
+        for i, chunk in enumerate(iter_input_chunks(input_path, unit_rows)):
+            write_part(units_dir, i, chunk)
+            units.append((i, n_rows, n_rows + len(chunk)))
+            n_rows += len(chunk)
+
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute(
+        "INSERT INTO job VALUES (1, ?, ?, ?, ?, ?, ?)",
+        (os.path.abspath(input_path), os.path.abspath(output_dir), text_column, batch_size, max_length, units_dir)
+    )
+    conn.executemany("INSERT INTO units (id, start_row, end_row) VALUES (?, ?, ?)", units)
+    conn.execute("COMMIT")
+    conn.close()
+    os.makedirs(output_dir, exist_ok=True)
+    print(f"Queued {n_rows:,} rows as {len(units):,} units in {queue_path}")
+
+
+def claim_unit(conn, worker_id, lease_seconds=LEASE_SECONDS):
+    """Lease the next pending (or expired) unit. Returns (id, start_row, end_row) or None."""
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # A worker that died on a unit's last attempt leaves it leased; fail it so the job can finish
+        conn.execute(
+            "UPDATE units SET status = 'failed', lease_owner = NULL, lease_expires = NULL, "
+            "last_error = COALESCE(last_error, 'lease expired on final attempt') "
+            "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+            (now, MAX_ATTEMPTS)
+        )
+        row = conn.execute(
+            "SELECT id, start_row, end_row FROM units "
+            "WHERE (status = 'pending' OR (status = 'leased' AND lease_expires < ?)) AND attempts < ? "
+            "ORDER BY id LIMIT 1",
+            (now, MAX_ATTEMPTS)
+        ).fetchone()
+        if row:
+            conn.execute(
+                "UPDATE units SET status = 'leased', lease_owner = ?, lease_expires = ?, attempts = attempts + 1 "
+                "WHERE id = ?",
+                (worker_id, now + lease_seconds, row[0])
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return row
+
+
+def next_lease_expiry(conn):
+    """Earliest lease_expires among leased units, or None when no unit is leased."""
+    return conn.execute("SELECT MIN(lease_expires) FROM units WHERE status = 'leased'").fetchone()[0]
+
+
+def renew_lease(conn, unit_id, worker_id, lease_seconds=LEASE_SECONDS):
+    """Extend our lease; returns False if the unit was re-leased to someone else."""
+    cursor = conn.execute(
+        "UPDATE units SET lease_expires = ? WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+        (time.time() + lease_seconds, unit_id, worker_id)
+    )
+    return cursor.rowcount == 1
+
+
+def complete_unit(conn, unit_id):
+    # Whoever finishes first marks it done; the part file is identical either way
+    conn.execute(
+        "UPDATE units SET status = 'done', lease_owner = NULL, lease_expires = NULL, finished_at = ? WHERE id = ?",
+        (time.time(), unit_id)
+    )
+
+
+def fail_unit(conn, unit_id, worker_id, error):
+    conn.execute(
+        "UPDATE units SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+        "lease_owner = NULL, lease_expires = NULL, last_error = ? "
+        "WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+        (MAX_ATTEMPTS, str(error)[:1000], unit_id, worker_id)
+    )
+
+
+def requeue_failed(queue_path=QUEUE_PATH):
+    """Reset failed units, and units whose last lease expired without a result, to pending."""
+    conn = connect(queue_path)
+    count = conn.execute(
+        "UPDATE units SET status = 'pending', attempts = 0, lease_owner = NULL, lease_expires = NULL "
+        "WHERE status = 'failed' OR (status = 'leased' AND lease_expires < ? AND attempts >= ?)",
+        (time.time(), MAX_ATTEMPTS)
+    ).rowcount
+    conn.close()
+    return count
+
+
+def job_status(queue_path=QUEUE_PATH):
+    """{status: (units, rows)}; expired leases are reported as 'expired'."""
+    conn = connect(queue_path)
+    rows = conn.execute(
+        "SELECT CASE WHEN status = 'leased' AND lease_expires < ? THEN 'expired' ELSE status END AS s, "
+        "COUNT(*), SUM(end_row - start_row) FROM units GROUP BY s",
+        (time.time(),)
+    ).fetchall()
+    conn.close()
+    return {status: (units, n_rows or 0) for status, units, n_rows in rows}
+
+
+class _LeaseKeeper(threading.Thread):
+    """Renews a unit's lease every lease_seconds / 3 while the worker is scoring it."""
+    def __init__(self, queue_path, unit_id, worker_id, lease_seconds):
+        super().__init__(daemon=True)
+        self.queue_path, self.unit_id, self.worker_id, self.lease_seconds = queue_path, unit_id, worker_id, lease_seconds
+        self.stopped = threading.Event()
+        self.lost = False
+
+    def run(self):
+        conn = connect(self.queue_path)
+        try:
+            while not self.stopped.wait(self.lease_seconds / 3):
+                if not renew_lease(conn, self.unit_id, self.worker_id, self.lease_seconds):
+                    self.lost = True
+                    return
+        finally:
+            conn.close()
+
+
+def run_worker(queue_path=QUEUE_PATH, worker_id=None, lease_seconds=LEASE_SECONDS, clean_workers=2,
+               torch_threads=None):
+    """
+    Claim and score units until none are pending or leased. While other workers hold the remaining
+    units, sleep until the earliest lease expires, so a dead worker's unit is still re-claimed.
+    Returns the number of units this worker finished.
+    """
+    # Imported here so the coordinator and `status` do not load torch/transformers
+    import torch
+    from main import score_chunk
+    from model_utils import load_ensemble_models
+
+    if torch_threads:
+        torch.set_num_threads(torch_threads)
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    conn = connect(queue_path)
+    input_path, output_dir, text_column, batch_size, max_length, units_dir = conn.execute(
+        "SELECT input_path, output_dir, text_column, batch_size, max_length, units_dir FROM job"
+    ).fetchone()
+    ensemble = load_ensemble_models()
+    finished = 0
+
+    with ProcessPoolExecutor(max_workers=clean_workers) as pool:
+        while True:
+            unit = claim_unit(conn, worker_id, lease_seconds)
+            if unit is None:
+                expires = next_lease_expiry(conn)
+                if expires is None:
+                    break
+                time.sleep(min(max(expires - time.time(), 0) + 1, lease_seconds))
+                continue
+            unit_id, start_row, end_row = unit
+            keeper = _LeaseKeeper(queue_path, unit_id, worker_id, lease_seconds)
+            keeper.start()
+            try:
+                if units_dir:
+                    chunk = pd.read_parquet(os.path.join(units_dir, f"part-{unit_id:06d}.parquet"))
+                else:
+                    chunk = read_row_range(input_path, start_row, end_row)
+                scored = score_chunk(ensemble, pool, chunk, text_column, batch_size, max_length)
+                scored.insert(0, "row_id", range(start_row, start_row + len(scored)))
+                write_part(output_dir, unit_id, scored)
+                complete_unit(conn, unit_id)
+                finished += 1
+                lost = " (lease had expired; result kept)" if keeper.lost else ""
+                print(f"✅ [{worker_id}] unit {unit_id}: rows {start_row:,}-{end_row:,} scored{lost}")
+            except Exception as e:
+                print(f"❌ [{worker_id}] unit {unit_id} failed: {e}")
+                fail_unit(conn, unit_id, worker_id, e)
+            finally:
+                keeper.stopped.set()
+                keeper.join()
+
+    conn.close()
+    print(f"[{worker_id}] no units left; finished {finished}")
+    return finished
+
+
+def run_workers(queue_path=QUEUE_PATH, processes=1, lease_seconds=LEASE_SECONDS, clean_workers=2):
+    """Start `processes` local workers, splitting the CPU threads between them."""
+    torch_threads = max(1, (os.cpu_count() or 1) // processes)
+    if processes == 1:
+        return run_worker(queue_path, None, lease_seconds, clean_workers, torch_threads)
+    ctx = multiprocessing.get_context("spawn")
+    workers = [
+        ctx.Process(target=run_worker, args=(queue_path, None, lease_seconds, clean_workers, torch_threads))
+        for _ in range(processes)
+    ]
+    for proc in workers:
+        proc.start()
+    for proc in workers:
+        proc.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Distributed batch scoring over a SQLite work queue.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    create = sub.add_parser("create", help="Split an input file into work units")
+    create.add_argument("input", help="CSV, JSONL or Parquet file of posts")
+    create.add_argument("--queue", default=QUEUE_PATH)
+    create.add_argument("--output", default="scored_posts")
+    create.add_argument("--unit-rows", type=int, default=20000)
+    create.add_argument("--text-column", default="content")
+    create.add_argument("--batch-size", type=int, default=64)
+    create.add_argument("--max-length", type=int, default=128)
+
+    worker = sub.add_parser("worker", help="Claim and score units until the queue is empty")
+    worker.add_argument("--queue", default=QUEUE_PATH)
+    worker.add_argument("--processes", type=int, default=1)
+    worker.add_argument("--lease-seconds", type=int, default=LEASE_SECONDS)
+    worker.add_argument("--clean-workers", type=int, default=2)
+
+    status = sub.add_parser("status", help="Show unit counts per status")
+    status.add_argument("--queue", default=QUEUE_PATH)
+
+    requeue = sub.add_parser("requeue", help="Reset failed (and abandoned last-attempt) units to pending")
+    requeue.add_argument("--queue", default=QUEUE_PATH)
+    args = parser.parse_args()
+
+    if args.command == "create":
+        create_job(args.input, args.output, args.queue, args.unit_rows, args.text_column,
+                   args.batch_size, args.max_length)
+    elif args.command == "worker":
+        run_workers(args.queue, args.processes, args.lease_seconds, args.clean_workers)
+    elif args.command == "status":
+        for name, (units, rows) in sorted(job_status(args.queue).items()):
+            print(f"{name:<8} {units:>6,} units {rows:>12,} rows")
+    else:
+        print(f"Requeued {requeue_failed(args.queue):,} failed units")